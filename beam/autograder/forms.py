@@ -10,15 +10,69 @@ from .models import (ConcreteStudentAnswers, ReinforcementStudentAnswers, Girder
                      BearingCapacityMiddleBotStudent, BearingCapacityMiddleTopStudent,
                      BearingCapacityLeftBotStudent, BearingCapacityLeftTopStudent,
                      BearingCapacityRightBotStudent, BearingCapacityRightTopStudent, )
+from django.forms.models import ModelChoiceIterator
 from django.utils.safestring import mark_safe
+from autograder.services import reference_cache, bar_layouts
 
 
-class ConcreteStudentAnswersForm(ModelForm):
+class ReferenceChoiceIterator(ModelChoiceIterator):
+    """ Choices from reference table, which is cached in memory (no queries on rendering);
+    the list of choices is built once and shared by all fields, which refer to the table """
+
+    def get_choices(self):
+        return reference_cache.get_table(self.queryset.model).get_choices()
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield "", self.field.empty_label
+        yield from self.get_choices()
+
+    def __len__(self):
+        return len(self.get_choices()) + (1 if self.field.empty_label is not None else 0)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.get_choices())
+
+
+BAR_DIAMETER_FIELDS = [f"section_{section}_{surface}_d_{position}"
+                       for section in range(1, 4) for surface in ["top", "bot"] for position in ["external", "internal"]]
+
+
+class ReferenceModelChoiceField(forms.ModelChoiceField):
+    """ ModelChoiceField for reference tables: choices and submitted values are checked
+    against the cached table instead of queryset """
+    iterator = ReferenceChoiceIterator
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            row = reference_cache.get_table(self.queryset.model).get(int(value))
+        except (ValueError, TypeError):
+            row = None
+        if row is None:
+            raise ValidationError(self.error_messages["invalid_choice"], code="invalid_choice",
+                                  params={"value": value})
+        return row
+
+
+class ReferenceModelForm(ModelForm):
+    """ ModelForm with ReferenceModelChoiceFields: their values are checked against the cached table
+    already, so the model does not check them again (with a query per field) """
+
+    def _get_validation_exclusions(self):
+        exclude = super()._get_validation_exclusions()
+        exclude.update(name for name, field in self.fields.items() if isinstance(field, ReferenceModelChoiceField))
+        return exclude
+
+
+class ConcreteStudentAnswersForm(ReferenceModelForm):
     verbose_name = forms.CharField(label="header", required=False, initial="Исходные данные по бетону", disabled=True)
 
     class Meta:
         model = ConcreteStudentAnswers
         fields = ["concrete_class", "R_b_n", "R_bt_n", "R_b", "R_bt", "E_b"]
+        field_classes = {"concrete_class": ReferenceModelChoiceField}
         labels = {"concrete_class": "Класс бетона по заданию",
                   "R_b_n": mark_safe(
                       "Нормативное сопротивление бетона сжатию, R<sub>bn</sub> [кН/см<sup>2</sup>]"),
@@ -36,12 +90,13 @@ class ConcreteStudentAnswersForm(ModelForm):
         super(ConcreteStudentAnswersForm, self).__init__(*args, **kwargs)
 
 
-class ReinforcementStudentAnswersForm(ModelForm):
+class ReinforcementStudentAnswersForm(ReferenceModelForm):
     verbose_name = forms.CharField(label="header", required=False, initial="Исходные данные по арматуре", disabled=True)
 
     class Meta:
         model = ReinforcementStudentAnswers
         exclude = ("student",)
+        field_classes = {"reinforcement_class": ReferenceModelChoiceField}
         labels = {"reinforcement_class": "Класс продольной арматуры по заданию",
                   "R_s_ser": mark_safe(
                       "Нормативное сопротивление арматуры растяжению, R<sub>s,ser</sub> [кН/см<sup>2</sup>]"),
@@ -162,6 +217,8 @@ class GirderGeometryForm(ModelForm):
     def clean_girder_wall_height(self):
         data = self.cleaned_data
         girder_wall_height = data["girder_wall_height"]
+        if self.slab is None:
+            raise ValidationError(gettext_lazy('Высота плиты, опирающейся на ригель, ещё не задана'))
         slab_height = self.slab.slab_height / 10
         if girder_wall_height != slab_height:
             raise ValidationError(gettext_lazy('Высота стенки ригеля должна быть равна высоте плиты,'
@@ -229,12 +286,13 @@ class MomentsForcesForm(ModelForm):
             self.fields["right_support_shear_force"].disabled = True
 
 
-class InitialReinforcementForm(ModelForm):
+class InitialReinforcementForm(ReferenceModelForm):
     verbose_name = forms.CharField(label="header", required=False, initial="Предварительное армирование", disabled=True)
 
     class Meta:
         model = InitialReinforcement
         exclude = ("student",)
+        field_classes = dict.fromkeys(BAR_DIAMETER_FIELDS, ReferenceModelChoiceField)
 
         labels = {
             # SECTION 2 TOP
@@ -444,12 +502,13 @@ class CalculatedReinforcementRightStudentForm(ModelForm):
         }
 
 
-class CalculatedReinforcementForm(ModelForm):
+class CalculatedReinforcementForm(ReferenceModelForm):
     verbose_name = forms.CharField(label="header", required=False, initial="Итоговое армирование", disabled=True)
 
     class Meta:
         model = CalculatedReinforcement
         exclude = ("student",)
+        field_classes = dict.fromkeys(BAR_DIAMETER_FIELDS, ReferenceModelChoiceField)
 
         labels = {
             # SECTION 2 TOP
@@ -546,8 +605,16 @@ class CalculatedReinforcementForm(ModelForm):
     def __init__(self, *args, **kwargs):
         self.girder_height = kwargs.pop('girder_height')
         self.initial_reinforcement = kwargs.pop('initial_reinforcement')
+        suggested_layouts = kwargs.pop('suggested_layouts', dict())  # section -> layouts, see bar_layouts
         super(CalculatedReinforcementForm, self).__init__(*args, **kwargs)
 
+        # layouts with the least area of steel, which is not less than required one
+        for section, layouts in suggested_layouts.items():
+            if layouts:
+                surface = bar_layouts.TENSILE_SURFACES[section]
+                self.fields[f"section_{section}_{surface}_d_external"].help_text = \
+                    "Варианты: " + "; ".join(str(layout) for layout in layouts)
+
         self.fields["section_2_top_reinforcement_area"].disabled = True
         self.fields["section_2_top_effective_depth"].disabled = True
         self.fields["section_2_bot_reinforcement_area"].disabled = True
@@ -648,7 +715,7 @@ class CalculatedReinforcementForm(ModelForm):
     def get_initial_diameter(self, section: int, surface: str, bar_position: str):
         initial_data = self.initial_reinforcement
         if initial_data is not None:
-            return getattr(initial_data, f"section_{section}_{surface}_d_{bar_position}", 0)
+            return getattr(initial_data, f"section_{section}_{surface}_d_{bar_position}_id", 0)
         else:
             return 1
 
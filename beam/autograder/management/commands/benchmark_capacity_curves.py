@@ -0,0 +1,84 @@
+import time
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from autograder.models import Student
+from autograder.services import bearing_capacity_batch
+from autograder.services import calculation_kernel as kernel
+
+
+def calculate_capacity_curves_scalar(inputs: dict, tensile_areas, compressed_areas):
+    """ The same curves as bearing_capacity_batch.calculate_capacity_curves, point by point
+    with calculation_kernel.calculate_bearing_capacity """
+    students_number = len(inputs["student_id"])
+    bearing_capacity = np.full((students_number, len(bearing_capacity_batch.SECTIONS),
+                                len(bearing_capacity_batch.SURFACES), len(tensile_areas), len(compressed_areas)),
+                               np.nan, dtype=np.float32)
+    for number in np.flatnonzero(inputs["has_data"]):
+        materials = kernel.Materials(R_s=inputs["R_s"][number], R_sc=inputs["R_sc"][number],
+                                     R_b=inputs["R_b"][number], alpha_R=0)  # alpha_R is not used
+        geometry = kernel.SectionGeometry(b_w=inputs["b_w"][number], b_f=inputs["b_f"][number],
+                                          h_f=inputs["h_f"][number], h=inputs["h"][number])
+        for section_index in range(len(bearing_capacity_batch.SECTIONS)):
+            for surface_index, surface in enumerate(bearing_capacity_batch.SURFACES):
+                a_s = inputs["a_s"][number, section_index]
+                for tensile_index, tensile_area in enumerate(tensile_areas):
+                    for compressed_index, compressed_area in enumerate(compressed_areas):
+                        try:
+                            result = kernel.calculate_bearing_capacity(
+                                materials, geometry, surface,
+                                tensile=kernel.BarsLayer(A=tensile_area, a=a_s[surface_index]),
+                                compressed=kernel.BarsLayer(A=compressed_area, a=a_s[1 - surface_index]))
+                        except ValueError:  # not implemented case
+                            continue
+                        bearing_capacity[number, section_index, surface_index, tensile_index, compressed_index] = \
+                            result.bearing_capacity
+    return bearing_capacity
+
+
+class Command(BaseCommand):
+    help = "Compares time of building of M_ult(As, As') curves over the bar catalog for the students " \
+           "with NumPy and with scalar calculations point by point (on the first students only)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=str, help="name of the group")
+        parser.add_argument('--all', action='store_true', help="all students")
+        parser.add_argument('--scalar-students', type=int, default=10,
+                            help="number of students for scalar calculations")
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            students = Student.objects.all()
+        elif options["group"]:
+            students = Student.objects.filter(group__group_name=options["group"])
+        else:
+            raise CommandError("Choose students with --group or --all")
+
+        inputs = bearing_capacity_batch.get_cohort_inputs(
+            students.select_related(*bearing_capacity_batch.INPUT_ROWS).order_by("pk"))
+        if not inputs["has_data"].any():
+            raise CommandError("There are no students with geometry and calculated reinforcement")
+        tensile_areas, compressed_areas = bearing_capacity_batch.get_catalog_areas()
+
+        start = time.perf_counter()
+        curves = bearing_capacity_batch.calculate_capacity_curves(inputs, tensile_areas, compressed_areas)
+        vectorized_time = time.perf_counter() - start
+
+        scalar_inputs = {key: values[:options["scalar_students"]] for key, values in inputs.items()}
+        start = time.perf_counter()
+        scalar_curves = calculate_capacity_curves_scalar(scalar_inputs, tensile_areas.tolist(),
+                                                         compressed_areas.tolist())
+        scalar_time = time.perf_counter() - start
+
+        students_number = len(inputs["student_id"])
+        scalar_students_number = len(scalar_inputs["student_id"])
+        points_number = curves["bearing_capacity"][0].size
+        np.testing.assert_allclose(curves["bearing_capacity"][:scalar_students_number], scalar_curves, rtol=1e-6)
+
+        self.stdout.write(f"{students_number} students x {points_number} points "
+                          f"({len(tensile_areas)} As x {len(compressed_areas)} As' for 3 sections x 2 surfaces), "
+                          f"{curves['bearing_capacity'].nbytes / 2 ** 20:.1f} MB")
+        self.stdout.write(f"NumPy: {vectorized_time * 1000:.1f} ms "
+                          f"({vectorized_time / students_number * 1000:.3f} ms per student)")
+        self.stdout.write(f"scalar: {scalar_time * 1000:.1f} ms for {scalar_students_number} students "
+                          f"({scalar_time / scalar_students_number * 1000:.3f} ms per student)")
+        self.stdout.write(f"speedup: {scalar_time / scalar_students_number / (vectorized_time / students_number):.0f}x")
@@ -0,0 +1,54 @@
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+from autograder.models import Student
+
+
+def get_page(url: str):
+    """ Returns latency of the request (seconds) """
+    start = time.perf_counter()
+    with urllib.request.urlopen(url) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def get_percentile(latencies: list, percent: int):
+    return latencies[min(len(latencies) - 1, len(latencies) * percent // 100)]
+
+
+class Command(BaseCommand):
+    help = "Measures latency of students' personal pages of running server under concurrent load. " \
+           "Compare WSGI and ASGI servers started with the same DB, e.g. " \
+           "'gunicorn beam.wsgi -w 4' and 'uvicorn beam.asgi:application --workers 4' (with --async-views)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', type=str, default="http://127.0.0.1:8000")
+        parser.add_argument('--concurrency', type=int, default=200, help="number of students opening pages")
+        parser.add_argument('--requests', type=int, default=5, help="number of requests of every student")
+        parser.add_argument('--async-views', action='store_true', help="request async variant of the page")
+
+    def handle(self, *args, **options):
+        concurrency = options["concurrency"]
+        url_name = "grader:student_personal_async" if options["async_views"] else "grader:student_personal"
+
+        users_names = list(Student.objects.order_by("pk").values_list("user__username", flat=True)[:concurrency])
+        if not users_names:
+            raise CommandError("There are no students in DB")
+        urls = [options["base_url"] + reverse(url_name, args=[users_names[number % len(users_names)]])
+                for number in range(concurrency * options["requests"])]
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            latencies = sorted(executor.map(get_page, urls))
+        total_time = time.perf_counter() - start
+
+        self.stdout.write(f"{len(latencies)} requests of {len(users_names)} students, "
+                          f"{concurrency} concurrent, in {total_time:.2f} s ({len(latencies) / total_time:.1f} rps)")
+        self.stdout.write(f"latency, ms: mean {statistics.mean(latencies) * 1000:.1f}, "
+                          f"p50 {get_percentile(latencies, 50) * 1000:.1f}, "
+                          f"p95 {get_percentile(latencies, 95) * 1000:.1f}, "
+                          f"p99 {get_percentile(latencies, 99) * 1000:.1f}, "
+                          f"max {latencies[-1] * 1000:.1f}")
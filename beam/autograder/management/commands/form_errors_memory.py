@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from autograder.services import form_errors
+
+
+class Command(BaseCommand):
+    help = "Shows memory, which is occupied by the forms with errors kept between POST and redirected GET, " \
+           "and its upper bound (to size the cache)"
+
+    def handle(self, *args, **options):
+        max_memory_size = form_errors.get_max_memory_size()
+        self.stdout.write(f"upper bound: {max_memory_size / 2 ** 20:.1f} MiB "
+                          f"({form_errors.get_cache()._max_entries} users x {form_errors.MAX_FORMS_PER_USER} forms "
+                          f"x {form_errors.MAX_ENTRY_SIZE // 1024} KiB)")
+
+        memory_size = form_errors.get_memory_size()
+        if memory_size is None:
+            self.stdout.write("current size is not known for the cache backend")
+        else:
+            users_number, size = memory_size
+            self.stdout.write(f"now: {size / 2 ** 20:.2f} MiB for {users_number} users")
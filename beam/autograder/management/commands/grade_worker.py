@@ -0,0 +1,44 @@
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from autograder.services import grading_queue
+from autograder.views import StudentPersonalView
+
+
+class Command(BaseCommand):
+    help = "Grades answers, which are saved with DEFERRED_GRADING setting, in worker processes; " \
+           "every worker takes pending jobs in batches and saves results of a batch in one transaction"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help="number of processes")
+        parser.add_argument('--batch-size', type=int, default=50, help="number of jobs graded together")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="seconds to wait, when there are no pending jobs")
+        parser.add_argument('--stale-after', type=float, default=600,
+                            help="seconds, after which running jobs are taken as abandoned and are graded again")
+        parser.add_argument('--once', action='store_true', help="exit, when there are no pending jobs")
+
+    def handle(self, *args, **options):
+        models_dict = {name: models for block in StudentPersonalView.models_dict.values()
+                       for name, models in block.items()}
+        requeued_number = grading_queue.requeue_stale_jobs(options["stale_after"])
+        if requeued_number:
+            self.stdout.write(f"{requeued_number} abandoned jobs are pending again")
+
+        workers_number = options["workers"]
+        arguments = (models_dict, options["batch_size"], options["poll_interval"], options["stale_after"],
+                     options["once"])
+        self.stdout.write(f"{workers_number} workers are grading answers")
+
+        if workers_number > 1:
+            connections.close_all()  # connections are not shared with worker processes
+            with ProcessPoolExecutor(max_workers=workers_number, initializer=django.setup) as executor:
+                results = list(executor.map(grading_queue.run_worker, *[[argument] * workers_number
+                                                                         for argument in arguments]))
+        else:
+            results = [grading_queue.run_worker(*arguments)]
+
+        graded_number = sum(graded for graded, failed in results)
+        failed_number = sum(failed for graded, failed in results)
+        self.stdout.write(f"{graded_number} jobs graded, {failed_number} of them failed")
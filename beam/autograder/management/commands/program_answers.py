@@ -1,38 +1,32 @@
-import os
-from django.core.exceptions import ObjectDoesNotExist
 from django.core.management.base import BaseCommand, CommandError
-from autograder.models import (Group, Student, VariantInfo,
-                               Concrete, Reinforcement,
-                               Cities, RoofLayers, FloorLayers,
-                               ConcreteStudentAnswers, ConcreteAnswersStatistics)
-from django.contrib.auth.models import User
-
-
-def get_concrete_parameters(students: list):
-    for student in students:
-        student_id = student.pk
-        student_variant = student.subgroup_variant_number
-        student_calc_variant = student.personal_variant_number
-        
-        
+from autograder.models import Group, Student
+from autograder.services import answer_key
 
 
 class Command(BaseCommand):
-    help = 'Defines answers which possible to get without user inputted data' \
-           'and inserts them to according "..._program_answers" tables in DB'
+    help = 'Defines answers which possible to get without user inputted data (materials of the variant) ' \
+           'and inserts them to "autograder_student_answer_key" table in DB. The saved answers are refreshed ' \
+           'by "variant_info" and "reference_information" commands'
 
     def add_arguments(self, parser):
         parser.add_argument('--group', type=str)
+        parser.add_argument('--all', action='store_true', help="all students")
 
     def handle(self, *args, **options):
         group_name = options["group"]
 
-        try:
-            group_id = Group.objects.get(group_name=group_name)
-        except Group.ObjectDoesNotExist as e:
-            print(e)
-            quit()
-        
-        student_list = Student.objects.filter(group_id=group_id)
-        
-        get_concrete_parameters(student_list)
+        if options["all"]:
+            student_list = Student.objects.all()
+        elif group_name:
+            try:
+                group = Group.objects.get(group_name=group_name)
+            except Group.DoesNotExist:
+                raise CommandError(f"There is no group {group_name}")
+            student_list = Student.objects.filter(group=group)
+        else:
+            raise CommandError("Choose students with --group or --all")
+
+        saved_number, skipped_students_ids = answer_key.save_answer_keys(student_list)
+        if skipped_students_ids:
+            self.stdout.write(f"Students without variant data: {skipped_students_ids}")
+        self.stdout.write(f"Answer keys of {saved_number} students are saved")
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from autograder.models import Group
+from autograder.services import cohort_statistics
+
+
+class Command(BaseCommand):
+    help = "Counts students' statistics of the groups again and replaces the counters, which are updated " \
+           "on grading (e.g. after the table is created or statistics were changed in admin or with SQL)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=str, help="name of the group")
+        parser.add_argument('--all', action='store_true', help="all groups")
+
+    def handle(self, *args, **options):
+        group_name = options["group"]
+
+        if options["all"]:
+            groups_ids = None
+        elif group_name:
+            try:
+                groups_ids = [Group.objects.get(group_name=group_name).pk]
+            except Group.DoesNotExist:
+                raise CommandError(f"There is no group {group_name}")
+        else:
+            raise CommandError("Choose groups with --group or --all")
+
+        counters_number = cohort_statistics.rebuild_group_statistics(groups_ids)
+        self.stdout.write(f"{counters_number} counters of fields are saved")
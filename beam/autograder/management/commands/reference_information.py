@@ -3,6 +3,7 @@ import sys
 import pandas as pd
 import numpy as np
 from django.core.management.base import BaseCommand, CommandError
+from autograder.services import reference_cache, answer_key
 from autograder.models import (Concrete, ConcreteCreepCoefficient, Reinforcement,
                                ReinforcementBarsDiameters, ReinforcementWiresDiameters,
                                ReinforcementStrandsGeneralDiameters, ReinforcementStrandsCrimpedDiameters,
@@ -316,3 +317,7 @@ class Command(BaseCommand):
                 choose_and_execute_function(path_to_file + '/' + file_name)
         elif os.path.isfile(path_to_file):
             choose_and_execute_function(path_to_file)
+
+        reference_cache.bump_version()  # processes should reload cached reference tables
+        refreshed_number = answer_key.refresh_answer_keys()  # keys keep copies of the reference values
+        print(f"Answer keys of {refreshed_number} students are refreshed")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from autograder.models import Group, Student
+from autograder.services import bar_layouts
+
+
+class Command(BaseCommand):
+    help = 'Shows layouts of bars with the least area of steel for the reinforcement, which is required ' \
+           'by the program, in every calculated section of the students (reference for checking of the drawings)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=str)
+        parser.add_argument('--all', action='store_true', help="all students")
+
+    def handle(self, *args, **options):
+        group_name = options["group"]
+
+        if options["all"]:
+            student_list = Student.objects.all()
+        elif group_name:
+            try:
+                group = Group.objects.get(group_name=group_name)
+            except Group.DoesNotExist:
+                raise CommandError(f"There is no group {group_name}")
+            student_list = Student.objects.filter(group=group)
+        else:
+            raise CommandError("Choose students with --group or --all")
+
+        for student, layouts in bar_layouts.get_reference_layouts(student_list).items():
+            sections_layouts = ", ".join(f"{section}-{section}: {layout}" for section, layout in sorted(layouts.items()))
+            self.stdout.write(f"{student}: {sections_layouts or 'reinforcement is not calculated'}")
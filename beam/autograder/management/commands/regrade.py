@@ -0,0 +1,76 @@
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from autograder.models import Student
+from autograder.services import regrade
+from autograder.views import StudentPersonalView
+
+
+class Command(BaseCommand):
+    help = "Recalculates program answers and statistics of existing students (e.g. after formulas are fixed) " \
+           "in parallel processes, students are split into shards, which are saved in separate transactions"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--group', type=str, help="name of the group")
+        parser.add_argument('--year', type=int, help="year of the groups")
+        parser.add_argument('--all', action='store_true', help="regrade all students")
+        parser.add_argument('--workers', type=int, default=os.cpu_count(), help="number of processes")
+        parser.add_argument('--shard-size', type=int, default=100, help="number of students in a shard")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="don't save anything, show statistics, which would be changed")
+
+    def get_students_ids(self, options):
+        if not (options["group"] or options["year"] or options["all"]):
+            raise CommandError("Choose students with --group, --year or --all")
+
+        students = Student.objects.order_by("pk")
+        if options["group"]:
+            students = students.filter(group__group_name=options["group"])
+        if options["year"]:
+            students = students.filter(group__group_year=options["year"])
+        return list(students.values_list("pk", flat=True))
+
+    def handle(self, *args, **options):
+        students_ids = self.get_students_ids(options)
+        shard_size = options["shard_size"]
+        shards = [students_ids[start:start + shard_size] for start in range(0, len(students_ids), shard_size)]
+        models_dict = {name: models for block in StudentPersonalView.models_dict.values()
+                       for name, models in block.items()}
+
+        regraded_number = 0
+        skipped_students_ids = list()
+        flipped_flags = Counter()
+        start = time.perf_counter()
+
+        if options["workers"] > 1 and len(shards) > 1:
+            connections.close_all()  # connections are not shared with worker processes
+            executor = ProcessPoolExecutor(max_workers=options["workers"], initializer=django.setup)
+            results = executor.map(regrade.regrade_shard, shards, [models_dict] * len(shards),
+                                   [options["dry_run"]] * len(shards))
+        else:
+            executor = None
+            results = (regrade.regrade_shard(shard, models_dict, options["dry_run"]) for shard in shards)
+
+        try:
+            for shard_regraded_number, shard_skipped_students_ids, shard_flipped_flags in results:
+                regraded_number += shard_regraded_number
+                skipped_students_ids += shard_skipped_students_ids
+                flipped_flags.update(shard_flipped_flags)
+                self.stdout.write(f"{regraded_number + len(skipped_students_ids)}/{len(students_ids)} students")
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        total_time = time.perf_counter() - start
+
+        if options["dry_run"]:
+            self.stdout.write("Statistics, which would be changed (nothing is saved):")
+            for (model_name, field_name, previous_value, value), number in sorted(flipped_flags.items(), key=str):
+                self.stdout.write(f"  {model_name}.{field_name}: {previous_value} -> {value} for {number} students")
+        if skipped_students_ids:
+            self.stdout.write(f"Skipped (missing data or not implemented cases): {skipped_students_ids}")
+        self.stdout.write(f"{regraded_number} students regraded in {total_time:.2f} s "
+                          f"({regraded_number / total_time if total_time else 0:.1f} students/s)")
@@ -8,6 +8,7 @@ from django.core.management.base import BaseCommand, CommandError
 from autograder.models import (Group, Student, VariantInfo,
                                Concrete, Reinforcement,
                                Cities, RoofLayers, FloorLayers)
+from autograder.services import answer_key
 from django.contrib.auth.models import User
 from pathlib import Path
 
@@ -295,3 +296,5 @@ class Command(BaseCommand):
 
             print(f"Variants data for group {group_name} inserted into DB")
 
+        refreshed_number = answer_key.refresh_answer_keys()  # materials of the variants could be changed
+        print(f"Answer keys of {refreshed_number} students are refreshed")
@@ -0,0 +1,63 @@
+import asyncio
+import logging
+from django.conf import settings
+from autograder.services.query_stats import record_queries, get_query_budget, QUERY_BUDGETS
+
+logger = logging.getLogger(__name__)
+
+
+def get_view_name(request):
+    resolver_match = getattr(request, "resolver_match", None)
+    if resolver_match is None:
+        return None
+    view_class = getattr(resolver_match.func, "view_class", None)
+    if view_class is not None:
+        return view_class.__name__
+    return resolver_match.func.__name__
+
+
+class QueryStatsMiddleware:
+    """ Records SQL queries of instrumented sync views (see QUERY_BUDGETS). In DEBUG mode statistics
+    are added to response headers and logged; requests over budget are logged as warnings """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine  # async views are not switched to thread
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+
+        with record_queries() as query_stats:
+            response = self.get_response(request)
+        return self.process_query_stats(request, response, query_stats)
+
+    async def __acall__(self, request):
+        # queries of async views are run with sync_to_async in the other threads, so they can't be recorded
+        # here and the views are not checked against the budgets
+        return await self.get_response(request)
+
+    def process_query_stats(self, request, response, query_stats):
+        view_name = get_view_name(request)
+        if view_name not in QUERY_BUDGETS:
+            return response
+
+        budget = get_query_budget(view_name, request.method)
+        if budget is not None and query_stats.count > budget:
+            logger.warning("%s %s is over query budget (%s): %s", request.method, request.path, budget,
+                           query_stats.get_summary())
+
+        if settings.DEBUG:
+            response["X-Query-Count"] = query_stats.count
+            response["X-Query-Time"] = f"{query_stats.time * 1000:.1f}"
+            response["X-Query-Duplicates"] = query_stats.get_duplicates_number()
+            for event_name, number in query_stats.events.items():
+                response[f"X-{event_name}"] = number
+            for cache_name, hit_rate in query_stats.get_hit_rates().items():
+                response[f"X-{cache_name}-Hit-Rate"] = f"{hit_rate:.2f}"
+            logger.debug("%s %s: %s", request.method, request.path, query_stats.get_summary())
+
+        return response
@@ -574,6 +574,34 @@ class SlabHeight(models.Model):
         return self.slab_height
 
 
+class StudentAnswerKey(models.Model):
+    """ Answers, which depend on student's variant only (not on the other answers); are calculated
+    beforehand by "program_answers" command. Values are the ones, which student should enter """
+    student = models.OneToOneField("Student", on_delete=models.CASCADE, null=False)
+
+    concrete_class = models.ForeignKey("Concrete", on_delete=models.DO_NOTHING)
+    R_b_n = models.FloatField()
+    R_bt_n = models.FloatField()
+    R_b = models.FloatField()
+    R_bt = models.FloatField()
+    E_b = models.FloatField()
+
+    reinforcement_class = models.ForeignKey("Reinforcement", on_delete=models.DO_NOTHING)
+    R_s_ser = models.FloatField()
+    R_s = models.FloatField()
+    R_sc_l = models.FloatField()
+    R_sc_sh = models.FloatField()
+    R_sw = models.FloatField(null=True)
+    alpha_R = models.DecimalField(null=True, blank=True, max_digits=4, decimal_places=3)
+    xi_R = models.DecimalField(null=True, blank=True, max_digits=4, decimal_places=3)
+
+    class Meta:
+        db_table = "autograder_student_answer_key"
+
+    def __str__(self):
+        return f"{self.student}"
+
+
 class GirderGeometry(models.Model):
     student = models.OneToOneField("Student", on_delete=models.CASCADE, null=False)
     slab = models.ForeignKey(SlabHeight, on_delete=models.DO_NOTHING, null=True)  # is necessary?
@@ -820,6 +848,8 @@ class CalculatedReinforcementMiddleProgram(models.Model):
     is_compressed_zone_capacity_sufficient_middle = models.BooleanField()
     reinforcement_area_middle = models.FloatField()
 
+    inputs_fingerprint = models.CharField(max_length=64, blank=True, default="")  # see calculation_kernel
+
     class Meta:
         db_table = "autograder_calculated_reinforcement_middle_program"
 
@@ -870,6 +900,8 @@ class CalculatedReinforcementLeftProgram(models.Model):
     is_compressed_zone_capacity_sufficient_left = models.BooleanField()
     reinforcement_area_left = models.FloatField()
 
+    inputs_fingerprint = models.CharField(max_length=64, blank=True, default="")  # see calculation_kernel
+
     class Meta:
         db_table = "autograder_calculated_reinforcement_left_program"
 
@@ -924,6 +956,8 @@ class CalculatedReinforcementRightProgram(models.Model):
     is_compressed_zone_capacity_sufficient_right = models.BooleanField()
     reinforcement_area_right = models.FloatField()
 
+    inputs_fingerprint = models.CharField(max_length=64, blank=True, default="")  # see calculation_kernel
+
     class Meta:
         db_table = "autograder_calculated_reinforcement_right_program"
 
@@ -1079,6 +1113,8 @@ class CalculatedReinforcement(models.Model):
 class StudentOpenForms(models.Model):
     student = models.OneToOneField("Student", on_delete=models.CASCADE, null=False)
     max_opened_form_number = models.SmallIntegerField(default=5)
+    # bit "i" is set, when i-th form of the student's page is filled (see services/opened_blocks.py)
+    filled_forms = models.PositiveIntegerField(default=0)
 
     class Meta:
         db_table = "autograder_student_open_forms"
@@ -1087,6 +1123,53 @@ class StudentOpenForms(models.Model):
         return f"{self.max_opened_form_number} opened to {self.student}"
 
 
+class GradingJob(models.Model):
+    """ Saved forms of the student, which wait for grading by "grade_worker" (see services/grading_queue.py) """
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = [(PENDING, PENDING), (RUNNING, RUNNING), (DONE, DONE), (FAILED, FAILED)]
+
+    student = models.ForeignKey("Student", on_delete=models.CASCADE)
+    forms_names = models.CharField(max_length=1000)  # separated with commas
+    status = models.CharField(max_length=7, choices=STATUSES, default=PENDING)
+    worker = models.CharField(max_length=100, blank=True, default="")  # name of the worker, which took the job
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = "autograder_grading_job"
+        indexes = [models.Index(fields=["status", "id"]), models.Index(fields=["student", "id"])]
+        # forms of the student, which are submitted before the job is taken by a worker, are added to it
+        constraints = [models.UniqueConstraint(fields=["student"], condition=models.Q(status="pending"),
+                                               name="unique_pending_grading_job")]
+
+    def __str__(self):
+        return f"{self.forms_names} of {self.student}: {self.status}"
+
+
+class GroupFieldStatistics(models.Model):
+    """ Numbers of the group's students, whose answer to the field of *Statistics model is graded, correct
+    and wrong; are updated with statistics (see services/cohort_statistics.py) """
+    group = models.ForeignKey("Group", on_delete=models.CASCADE)
+    statistics_model = models.CharField(max_length=100)  # name of the model, e.g. ConcreteAnswersStatistics
+    field = models.CharField(max_length=100)
+    attempted = models.IntegerField(default=0)
+    passed = models.IntegerField(default=0)
+    failed = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = "autograder_group_field_statistics"
+        constraints = [models.UniqueConstraint(fields=["group", "statistics_model", "field"],
+                                               name="unique_group_field_statistics")]
+
+    def __str__(self):
+        return f"{self.group} {self.statistics_model}.{self.field}: {self.passed}/{self.attempted}"
+
+
 # MIDDLE BOT
 class BearingCapacityMiddleBotStudent(models.Model):
     student = models.OneToOneField("Student", on_delete=models.CASCADE)
@@ -1115,6 +1198,8 @@ class BearingCapacityMiddleBotProgram(models.Model):
     bearing_capacity_b_middle_bot = models.FloatField()
     bearing_capacity_middle_bot = models.FloatField()
 
+    inputs_fingerprint = models.CharField(max_length=64, blank=True, default="")  # see calculation_kernel
+
     class Meta:
         db_table = "autograder_bearing_capacity_middle_bot_program"
 
@@ -1167,6 +1252,8 @@ class BearingCapacityLeftBotProgram(models.Model):
     bearing_capacity_b_left_bot = models.FloatField()
     bearing_capacity_left_bot = models.FloatField()
 
+    inputs_fingerprint = models.CharField(max_length=64, blank=True, default="")  # see calculation_kernel
+
     class Meta:
         db_table = "autograder_bearing_capacity_left_bot_program"
 
@@ -1219,6 +1306,8 @@ class BearingCapacityRightBotProgram(models.Model):
     bearing_capacity_b_right_bot = models.FloatField()
     bearing_capacity_right_bot = models.FloatField()
 
+    inputs_fingerprint = models.CharField(max_length=64, blank=True, default="")  # see calculation_kernel
+
     class Meta:
         db_table = "autograder_bearing_capacity_right_bot_program"
 
@@ -1277,6 +1366,8 @@ class BearingCapacityMiddleTopProgram(models.Model):
     bearing_capacity_b_middle_top = models.FloatField()
     bearing_capacity_middle_top = models.FloatField()
 
+    inputs_fingerprint = models.CharField(max_length=64, blank=True, default="")  # see calculation_kernel
+
     class Meta:
         db_table = "autograder_bearing_capacity_middle_top_program"
 
@@ -1338,6 +1429,8 @@ class BearingCapacityLeftTopProgram(models.Model):
     bearing_capacity_b_left_top = models.FloatField()
     bearing_capacity_left_top = models.FloatField()
 
+    inputs_fingerprint = models.CharField(max_length=64, blank=True, default="")  # see calculation_kernel
+
     class Meta:
         db_table = "autograder_bearing_capacity_left_top_program"
 
@@ -1399,6 +1492,8 @@ class BearingCapacityRightTopProgram(models.Model):
     bearing_capacity_b_right_top = models.FloatField()
     bearing_capacity_right_top = models.FloatField()
 
+    inputs_fingerprint = models.CharField(max_length=64, blank=True, default="")  # see calculation_kernel
+
     class Meta:
         db_table = "autograder_bearing_capacity_right_top_program"
 
@@ -0,0 +1,59 @@
+from django.db import transaction
+from autograder.models import Student, StudentAnswerKey
+from .student_context import StudentContext, get_variants_info, bulk_upsert
+
+# answers are given in kN/cm2 (reference tables are in MPa), the coefficients are given as they are
+CONCRETE_FIELDS = ("R_b_n", "R_bt_n", "R_b", "R_bt", "E_b")
+REINFORCEMENT_FIELDS = ("R_s_ser", "R_s", "R_sc_l", "R_sc_sh", "R_sw")
+REINFORCEMENT_COEFFICIENTS = ("alpha_R", "xi_R")
+
+
+def to_answer_units(value):
+    return value / 10 if value is not None else None
+
+
+def get_answer_key(student_context: StudentContext):
+    """ Answers of the student, which depend on the variant only """
+    concrete = student_context.girder_concrete
+    reinforcement = student_context.girder_reinforcement
+
+    answer_key = StudentAnswerKey(student=student_context.student, concrete_class=concrete,
+                                  reinforcement_class=reinforcement)
+    for field_name in CONCRETE_FIELDS:
+        setattr(answer_key, field_name, to_answer_units(getattr(concrete, field_name)))
+    for field_name in REINFORCEMENT_FIELDS:
+        setattr(answer_key, field_name, to_answer_units(getattr(reinforcement, field_name)))
+    for field_name in REINFORCEMENT_COEFFICIENTS:
+        setattr(answer_key, field_name, getattr(reinforcement, field_name))
+    return answer_key
+
+
+def save_answer_keys(students):
+    """ Calculates answer keys of the students (queryset) and saves them with one query. Variants
+    and reference tables are loaded once for all students. Returns number of saved keys and ids of the
+    students without variant data """
+    students = list(students.select_related("group"))
+    variants_info = get_variants_info(students)
+
+    answer_keys = list()
+    skipped_students_ids = list()
+    for student in students:
+        student_context = StudentContext(student)
+        student_context.variant_info = variants_info.get((student.group_id, student.subgroup_variant_number))
+        if student_context.variant_info is None or student_context.personal_variant is None:
+            skipped_students_ids.append(student.pk)
+            continue
+        answer_keys.append(get_answer_key(student_context))
+
+    bulk_upsert(StudentAnswerKey, answer_keys)
+    return len(answer_keys), skipped_students_ids
+
+
+def refresh_answer_keys():
+    """ Calculates the saved answer keys again, e.g. after reference tables or variants are reloaded (keys
+    keep copies of materials, so they would be stale otherwise); keys of the students without variant data are deleted.
+    Returns number of refreshed keys """
+    with transaction.atomic():
+        saved_number, skipped_students_ids = save_answer_keys(Student.objects.filter(studentanswerkey__isnull=False))
+        StudentAnswerKey.objects.filter(student_id__in=skipped_students_ids).delete()
+    return saved_number
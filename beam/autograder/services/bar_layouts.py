@@ -0,0 +1,116 @@
+from bisect import bisect_left
+from dataclasses import dataclass
+from typing import Optional
+from autograder.models import Student, CalculatedReinforcement, ReinforcementBarsDiameters
+from . import reference_cache
+from .reiforcement_calculation import PROGRAM_MODELS
+from .student_context import StudentContext
+
+# surface of the section, which is in tension (its reinforcement is calculated by student)
+TENSILE_SURFACES = {1: "bot", 2: "top", 3: "top"}
+SUGGESTED_LAYOUTS_NUMBER = 3
+
+
+@dataclass(frozen=True, slots=True)
+class BarLayout:
+    """ Bars near one surface of the section, like in CalculatedReinforcement (bars are None,
+    if there are no bars of the position). Area is in cm2 """
+    area: float
+    d_external: Optional[ReinforcementBarsDiameters]
+    n_external: int
+    d_internal: Optional[ReinforcementBarsDiameters]
+    n_internal: int
+
+    def __str__(self):
+        bars = [f"{number}{bar}" for bar, number in ((self.d_external, self.n_external),
+                                                     (self.d_internal, self.n_internal)) if number]
+        return f"{' + '.join(bars)} ({self.area:.2f} см²)"
+
+
+class LayoutsTable:
+    """ All layouts, which are allowed by CalculatedReinforcement, sorted by area (and by number
+    of bars for equal areas), so the layouts for required area are found with binary search """
+
+    def __init__(self, bars: list):
+        self.bars = bars
+        layouts = list()
+        for n_external, _ in CalculatedReinforcement.NUMBER_EXTERNAL_BARS:
+            for n_internal, _ in CalculatedReinforcement.NUMBER_INTERNAL_BARS:
+                if n_external == 0:  # internal bars are placed between external ones, in corners of stirrups
+                    continue
+                for d_external in bars:
+                    for d_internal in bars if n_internal else [None]:
+                        layouts.append(BarLayout(area=get_layout_area(d_external, n_external, d_internal, n_internal),
+                                                 d_external=d_external, n_external=n_external,
+                                                 d_internal=d_internal, n_internal=n_internal))
+
+        self.layouts = sorted(layouts, key=lambda layout: (layout.area, layout.n_external + layout.n_internal,
+                                                           str(layout)))
+        self.areas = [layout.area for layout in self.layouts]
+
+    def get_layouts(self, required_area: float, number: int = SUGGESTED_LAYOUTS_NUMBER):
+        """ Layouts with the least area, which is not less than required one """
+        start = bisect_left(self.areas, required_area)
+        return self.layouts[start:start + number]
+
+
+def get_layout_area(d_external, n_external: int, d_internal, n_internal: int):
+    """ Like InitialReinforcement.get_reinforcement_area: areas of bars are in mm2, layout's area is in cm2 """
+    area = 0
+    if d_external is not None:
+        area += d_external.cross_section_area * n_external
+    if d_internal is not None:
+        area += d_internal.cross_section_area * n_internal
+    return area / 100
+
+
+layouts_table = None
+
+
+def get_layouts_table():
+    """ The table is built once per process and again after the bars are reloaded by reference cache """
+    global layouts_table
+    bars = reference_cache.get_table(ReinforcementBarsDiameters).all()
+    if layouts_table is None or layouts_table.bars is not bars:
+        layouts_table = LayoutsTable(bars)
+    return layouts_table
+
+
+def get_layouts(required_area: float, number: int = SUGGESTED_LAYOUTS_NUMBER):
+    return get_layouts_table().get_layouts(required_area, number)
+
+
+def get_required_areas(student_context: StudentContext):
+    """ Section -> reinforcement area, which is required by the program (sections, which are
+    not calculated yet or are not implemented, are left out) """
+    required_areas = dict()
+    for section, (program_model, postfix) in PROGRAM_MODELS.items():
+        program_answers = student_context.get_row(program_model)
+        if program_answers is not None:
+            required_area = getattr(program_answers, "reinforcement_area" + postfix)
+            if required_area is not None and required_area > 0:  # -1 for not implemented cases
+                required_areas[section] = required_area
+    return required_areas
+
+
+def get_suggested_layouts(student_context: StudentContext):
+    """ Section -> layouts with the least area, which is not less than required one """
+    return {section: get_layouts(required_area)
+            for section, required_area in get_required_areas(student_context).items()}
+
+
+def get_reference_layouts(students: list):
+    """ Student -> section -> layout with the least area for the students, whose reinforcement
+    is calculated; program answers of all students are loaded with one query """
+    accessors = [program_model._meta.get_field("student").remote_field.get_accessor_name()
+                 for program_model, _ in PROGRAM_MODELS.values()]
+    students = Student.objects.select_related(*accessors).filter(pk__in=[student.pk for student in students])
+
+    reference_layouts = dict()
+    for student in students.order_by("pk"):
+        student_context = StudentContext(student)
+        for (program_model, _), accessor in zip(PROGRAM_MODELS.values(), accessors):
+            student_context.rows[program_model] = getattr(student, accessor, None)
+        reference_layouts[student] = {section: layouts[0] for section, layouts
+                                      in get_suggested_layouts(student_context).items() if layouts}
+    return reference_layouts
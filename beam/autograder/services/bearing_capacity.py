@@ -1,41 +1,43 @@
-from autograder.models import (Student, CalculatedReinforcement,
+from autograder.models import (CalculatedReinforcement,
                                BearingCapacityMiddleBotProgram, BearingCapacityMiddleTopProgram,
                                BearingCapacityLeftBotProgram, BearingCapacityLeftTopProgram,
                                BearingCapacityRightBotProgram, BearingCapacityRightTopProgram,
                                )
+from typing import Optional
 from django.core.exceptions import ObjectDoesNotExist
 from . import reiforcement_calculation as rc
+from . import calculation_kernel as kernel
+from .calculation_kernel import BarsLayer, CapacityResult
+from .student_context import StudentContext
 
-VALID_SECTIONS = {1, 2, 3}
-VALID_SURFACES = {"top", "bot"}
+VALID_SECTIONS = kernel.VALID_SECTIONS
+VALID_SURFACES = kernel.VALID_SURFACES
+OPPOSITE_SURFACES = {"top": "bot", "bot": "top"}
 
 
-def get_calculated_reinforcement(student_id: int):
-    calculated_reinforcement = CalculatedReinforcement.objects.filter(student_id=student_id).first()
-    section_geometry = rc.get_section_geometry(student_id)
-    if section_geometry is not None:
-        h = section_geometry["h"]
-    else:
-        raise ObjectDoesNotExist("You should fill InitialGeometry form first!")
+def get_calculated_reinforcement(student_context: StudentContext):
+    """ Dict (section, surface) -> reinforcement layer or None, if reinforcement is not calculated yet """
+    return student_context.get_calculation_data("calculated_reinforcement",
+                                                lambda: build_calculated_reinforcement(student_context))
 
-    reinforcement = dict()
 
-    if calculated_reinforcement is not None:
-        for section in VALID_SECTIONS:
-            for surface in VALID_SURFACES:
-                reinforcement[f"A_{section}_{surface}"] = \
-                    float(getattr(calculated_reinforcement, f"section_{section}_{surface}_reinforcement_area"))
-                reinforcement[f"a_s_{section}_{surface}"] = float(getattr(calculated_reinforcement,
-                                                                          f"section_{section}_{surface}_distance"))
-                reinforcement[f"h_0_{section}_{surface}"] = h - reinforcement[f"a_s_{section}_{surface}"]
-    else:
-        reinforcement["reinforcement"] = None
+def build_calculated_reinforcement(student_context: StudentContext):
+    if rc.get_section_geometry(student_context) is None:
+        raise ObjectDoesNotExist("You should fill InitialGeometry form first!")
+    return get_calculated_reinforcement_from_row(student_context.get_row(CalculatedReinforcement))
 
-    return reinforcement
 
+def get_calculated_reinforcement_from_row(calculated_reinforcement: CalculatedReinforcement):
+    if calculated_reinforcement is None:
+        return None
 
-def is_data_for_calculations(data_to_check: dict):
-    return None not in data_to_check.values()
+    reinforcement = dict()
+    for section in VALID_SECTIONS:
+        for surface in VALID_SURFACES:
+            reinforcement[(section, surface)] = BarsLayer(
+                A=float(getattr(calculated_reinforcement, f"section_{section}_{surface}_reinforcement_area")),
+                a=float(getattr(calculated_reinforcement, f"section_{section}_{surface}_distance")))
+    return reinforcement
 
 
 def get_section_name(section: int):
@@ -67,92 +69,43 @@ def get_program_answers_model(section: int, surface: str):
     return model
 
 
-def calculate_bearing_capacity(student: Student, surface: str):
-    student_id = student.pk
-    d = dict()
-    d.update(rc.get_materials_properties(student_id))
-    d.update(rc.get_section_geometry(student_id))
-    d.update(get_calculated_reinforcement(student_id))
-
+def get_program_answers_keys(surface: str):
+    keys = ["compressed_zone_height_a", "relative_compressed_zone_height_a", "bearing_capacity_a",
+            "compressed_zone_height_b", "bearing_capacity_b", "bearing_capacity"]
     if surface == "top":
-        opp_surface = "bot"
-        d["b"] = d["b_f"]
-    else:
-        opp_surface = "top"
-        d["b"] = d["b_w"]
-
-    defaults = dict()
-
-    if is_data_for_calculations(d):
-        for section in VALID_SECTIONS:
-            section_name = get_section_name(section)
-            model = get_program_answers_model(section=section, surface=surface)
-            if surface == "top":
-                ultimate_tensile_force = d["R_s"] * d[f"A_{section}_{surface}"]
-                ultimate_compressive_force = d["R_b"] * d["b_f"] * d["h_f"] + \
-                                             d["R_sc"] * d[f"A_{section}_{opp_surface}"]
-                defaults[f"ultimate_tensile_force_{section_name}_{surface}"] = ultimate_tensile_force
-                defaults[f"ultimate_compressive_force_{section_name}_{surface}"] = ultimate_compressive_force
-
-                if ultimate_tensile_force > ultimate_compressive_force:
-                    raise ValueError(f"Case Rs*As > Rsc*Asc + Rb*bf*hf is not implemented")
-
-            compressed_zone_height = (d["R_s"] * d[f"A_{section}_{surface}"] -
-                                      d["R_sc"] * d[f"A_{section}_{opp_surface}"]) / (d["R_b"] * d["b"])
-
-            relative_compressed_zone_height = compressed_zone_height / d[f"h_0_{section}_{surface}"]
-
-            if compressed_zone_height < d[f"a_s_{section}_{opp_surface}"] * 1.01:
-                bearing_capacity_a = d["R_s"] * d[f"A_{section}_{surface}"] * (d[f"h_0_{section}_{surface}"] -
-                                                                               d[f"a_s_{section}_{opp_surface}"])
-            else:
-                bearing_capacity_a = d["R_b"] * d["b"] * compressed_zone_height * (d[f"h_0_{section}_{surface}"] -
-                                                                                   compressed_zone_height / 2) + \
-                    d["R_sc"] * d[f"A_{section}_{opp_surface}"] * (d[f"h_0_{section}_{surface}"] -
-                                                                               d[f"a_s_{section}_{opp_surface}"])
-
-            compressed_zone_height_b = (d["R_s"] * d[f"A_{section}_{surface}"]) / (d["R_b"] * d["b"])
-
-            if compressed_zone_height_b < 2 * d[f"a_s_{section}_{opp_surface}"]:
-                bearing_capacity_b = d["R_s"] * d[f"A_{section}_{surface}"] * (d[f"h_0_{section}_{surface}"] -
-                                                                               compressed_zone_height_b / 2)
-            else:
-                bearing_capacity_b = 0
-
-            if bearing_capacity_b != 0:
-                ultimate_bearing_capacity = min(bearing_capacity_a, bearing_capacity_b)
-            else:
-                ultimate_bearing_capacity = bearing_capacity_a
-
-            defaults[f"compressed_zone_height_a_{section_name}_{surface}"] = compressed_zone_height
-            defaults[f"relative_compressed_zone_height_a_{section_name}_{surface}"] = relative_compressed_zone_height
-            defaults[f"bearing_capacity_a_{section_name}_{surface}"] = bearing_capacity_a
-            defaults[f"compressed_zone_height_b_{section_name}_{surface}"] = compressed_zone_height_b
-            defaults[f"bearing_capacity_b_{section_name}_{surface}"] = bearing_capacity_b
-            defaults[f"bearing_capacity_{section_name}_{surface}"] = ultimate_bearing_capacity
-
-            model.objects.update_or_create(student=student,
-                                           defaults={**defaults})
-            defaults.clear()
+        keys = ["ultimate_tensile_force", "ultimate_compressive_force"] + keys
+    return keys
 
-    else:
-        for section in VALID_SECTIONS:
-            section_name = get_section_name(section)
-            model = get_program_answers_model(section=section, surface=surface)
 
-            if surface == "top":
-                defaults[f"ultimate_tensile_force_{section_name}_{surface}"] = None
-                defaults[f"ultimate_compressive_force_{section_name}_{surface}"] = None
+def get_program_answers(result: CapacityResult, surface: str, postfix: str):
+    return {key + postfix: getattr(result, key) for key in get_program_answers_keys(surface)}
+
+
+def get_layers(reinforcement: Optional[dict], section: int, surface: str):
+    """ Tensile and compressed reinforcement of the section (None, if reinforcement is not calculated) """
+    if reinforcement is None:
+        return None
+    return reinforcement[(section, surface)], reinforcement[(section, OPPOSITE_SURFACES[surface])]
+
 
-            defaults[f"compressed_zone_height_a_{section_name}_{surface}"] = None
-            defaults[f"relative_compressed_zone_height_a_{section_name}_{surface}"] = None
-            defaults[f"bearing_capacity_a_{section_name}_{surface}"] = None
-            defaults[f"compressed_zone_height_b_{section_name}_{surface}"] = None
-            defaults[f"bearing_capacity_b_{section_name}_{surface}"] = None
-            defaults[f"bearing_capacity_{section_name}_{surface}"] = None
+def calculate_bearing_capacity(student_context: StudentContext, surface: str, sections=VALID_SECTIONS):
+    materials = rc.get_materials_properties(student_context)
+    geometry = rc.get_section_geometry(student_context)
+    reinforcement = get_calculated_reinforcement(student_context)
 
-            model.objects.update_or_create(student=student,
-                                           defaults={**defaults})
-            defaults.clear()
+    for section in sections:
+        model = get_program_answers_model(section=section, surface=surface)
+        layers = get_layers(reinforcement, section, surface)
+        fingerprint = kernel.get_inputs_fingerprint(surface, materials, geometry, layers)
+        if rc.is_fingerprint_saved(student_context, model, fingerprint):
+            continue
 
+        if None in (materials, geometry, layers):
+            # there is not enough data for calculations; program answers are not nullable,
+            # so they are not saved (None values raised IntegrityError)
+            continue
+        tensile, compressed = layers
+        result = kernel.calculate_bearing_capacity(materials, geometry, surface, tensile, compressed)
 
+        defaults = get_program_answers(result, surface, f"_{get_section_name(section)}_{surface}")
+        student_context.save_row(model, {**defaults, "inputs_fingerprint": fingerprint})
@@ -0,0 +1,246 @@
+import numpy as np
+from autograder.models import (Student,
+                               BearingCapacityMiddleBotProgram, BearingCapacityMiddleTopProgram,
+                               BearingCapacityLeftBotProgram, BearingCapacityLeftTopProgram,
+                               BearingCapacityRightBotProgram, BearingCapacityRightTopProgram,
+                               )
+from . import bar_layouts
+from . import calculation_kernel as kernel
+from .bearing_capacity import get_calculated_reinforcement_from_row, get_layers, get_program_answers_keys
+from .reiforcement_calculation import get_section_geometry_from_row, get_materials_from_rows
+from .reinforcement_batch import get_materials
+from .student_context import get_variants_info, bulk_upsert
+
+SECTIONS = (1, 2, 3)
+SURFACES = ("bot", "top")  # index of the opposite surface is 1 - index
+SECTIONS_NAMES = {1: "middle", 2: "left", 3: "right"}
+PROGRAM_MODELS = {(1, "bot"): BearingCapacityMiddleBotProgram, (1, "top"): BearingCapacityMiddleTopProgram,
+                  (2, "bot"): BearingCapacityLeftBotProgram, (2, "top"): BearingCapacityLeftTopProgram,
+                  (3, "bot"): BearingCapacityRightBotProgram, (3, "top"): BearingCapacityRightTopProgram}
+
+# student's rows with input data (reverse OneToOne accessors)
+INPUT_ROWS = ("girdergeometry", "calculatedreinforcement")
+
+
+def get_student_calculation_data(student: Student, variants_info: dict):
+    """ Materials, geometry and calculated reinforcement, which are built by bearing_capacity
+    (so fingerprints are the same), or None, if there is no variant info or geometry (bearing_capacity
+    raises errors then) """
+    girder_geometry, calculated_reinforcement = (getattr(student, accessor, None) for accessor in INPUT_ROWS)
+    materials_rows = get_materials(student, variants_info)
+    if materials_rows is None or girder_geometry is None:
+        return None
+    return (get_materials_from_rows(*materials_rows), get_section_geometry_from_row(girder_geometry),
+            get_calculated_reinforcement_from_row(calculated_reinforcement))
+
+
+def get_student_inputs(materials, geometry, reinforcement):
+    """ Input values of one student or None, if some data is missing """
+    if None in (materials, geometry, reinforcement):
+        return None
+
+    return {
+        "R_s": materials.R_s,
+        "R_sc": materials.R_sc,
+        "R_b": materials.R_b,
+        "b_w": geometry.b_w,
+        "b_f": geometry.b_f,
+        "h_f": geometry.h_f,
+        "h": geometry.h,
+        # sections 1, 2, 3 x surfaces bot, top
+        "A": [[reinforcement[(section, surface)].A for surface in SURFACES] for section in SECTIONS],
+        "a_s": [[reinforcement[(section, surface)].a for surface in SURFACES] for section in SECTIONS],
+    }
+
+
+def get_fingerprints(materials, geometry, reinforcement):
+    """ Inputs fingerprints of the sections x surfaces, the same as in bearing_capacity """
+    return [[kernel.get_inputs_fingerprint(surface, materials, geometry, get_layers(reinforcement, section, surface))
+             for surface in SURFACES] for section in SECTIONS]
+
+
+def get_cohort_inputs(students):
+    """ Arrays of input data for N students: materials and geometry have shape (N,), reinforcement
+    has shape (N, 3, 2) (sections x surfaces). Students without data get zeros and False in "has_data" mask,
+    the ones without variant info or geometry are also marked in "is_skipped" mask (bearing_capacity raises
+    errors for them); "fingerprints" are inputs fingerprints of sections x surfaces (list of N lists,
+    None without data) """
+    students = list(students)
+    variants_info = get_variants_info(students)
+
+    calculation_data = [get_student_calculation_data(student, variants_info) for student in students]
+    students_inputs = [get_student_inputs(*data) if data is not None else None for data in calculation_data]
+    inputs = {"student_id": np.array([student.pk for student in students]),
+              "has_data": np.array([student_inputs is not None for student_inputs in students_inputs], dtype=bool),
+              "is_skipped": np.array([data is None for data in calculation_data], dtype=bool),
+              "fingerprints": [get_fingerprints(*data) if student_inputs is not None else None
+                               for data, student_inputs in zip(calculation_data, students_inputs)]}
+
+    for key in ("R_s", "R_sc", "R_b", "b_w", "b_f", "h_f", "h"):
+        inputs[key] = np.array([student_inputs[key] if student_inputs is not None else 0.0
+                                for student_inputs in students_inputs], dtype=float)
+    no_data = [[0.0] * len(SURFACES)] * len(SECTIONS)
+    for key in ("A", "a_s"):
+        inputs[key] = np.array([student_inputs[key] if student_inputs is not None else no_data
+                                for student_inputs in students_inputs],
+                               dtype=float).reshape(-1, len(SECTIONS), len(SURFACES))
+    return inputs
+
+
+def get_capacity(R_s, R_sc, R_b, b, b_f, h_f, h_0, A, A_opp, a_s_opp):
+    """ Cases of bearing_capacity.calculate_bearing_capacity for arrays of any (broadcastable) shape:
+    compressed zone below 1.01 * a_s', case b and the least of cases a and b """
+    with np.errstate(divide="ignore", invalid="ignore"):  # students without data give zeros
+        ultimate_tensile_force = R_s * A
+        ultimate_compressive_force = R_b * b_f * h_f + R_sc * A_opp
+
+        compressed_zone_height = (R_s * A - R_sc * A_opp) / (R_b * b)
+        relative_compressed_zone_height = compressed_zone_height / h_0
+
+        bearing_capacity_a = np.where(compressed_zone_height < a_s_opp * 1.01,
+                                      R_s * A * (h_0 - a_s_opp),
+                                      R_b * b * compressed_zone_height * (h_0 - compressed_zone_height / 2) +
+                                      R_sc * A_opp * (h_0 - a_s_opp))
+
+        compressed_zone_height_b = (R_s * A) / (R_b * b)
+        bearing_capacity_b = np.where(compressed_zone_height_b < 2 * a_s_opp,
+                                      R_s * A * (h_0 - compressed_zone_height_b / 2),
+                                      0.0)
+
+    bearing_capacity = np.where(bearing_capacity_b != 0, np.minimum(bearing_capacity_a, bearing_capacity_b),
+                                bearing_capacity_a)
+
+    return {
+        "ultimate_tensile_force": ultimate_tensile_force,
+        "ultimate_compressive_force": ultimate_compressive_force,
+        "compressed_zone_height_a": compressed_zone_height,
+        "relative_compressed_zone_height_a": relative_compressed_zone_height,
+        "bearing_capacity_a": bearing_capacity_a,
+        "compressed_zone_height_b": compressed_zone_height_b,
+        "bearing_capacity_b": bearing_capacity_b,
+        "bearing_capacity": bearing_capacity,
+    }
+
+
+def get_students_values(inputs: dict, dimensions: int):
+    """ Materials and geometry of the students (N,) as arrays with given number of dimensions,
+    which are the same for all sections, surfaces... """
+    return (inputs[key].reshape((-1,) + (1,) * (dimensions - 1))
+            for key in ("R_s", "R_sc", "R_b", "b_w", "b_f", "h_f", "h"))
+
+
+def calculate_bearing_capacity_batch(inputs: dict):
+    """ The same calculations as bearing_capacity.calculate_bearing_capacity for N students x 3 sections
+    x 2 surfaces in one pass. Arrays of results have shape (N, 3, 2); case Rs*As > Rsc*Asc + Rb*bf*hf
+    for top surface, which is not implemented there (and raises ValueError), is reported as mask """
+    # values of the student are the same for all sections and surfaces
+    R_s, R_sc, R_b, b_w, b_f, h_f, h = get_students_values(inputs, dimensions=3)
+    is_top = np.array(SURFACES) == "top"
+    b = np.where(is_top, b_f, b_w)  # compressed flange for top surface in tension
+
+    A = inputs["A"]
+    a_s = inputs["a_s"]
+    A_opp = A[..., ::-1]  # reinforcement near the opposite (compressed) surface
+    a_s_opp = a_s[..., ::-1]
+
+    results = get_capacity(R_s, R_sc, R_b, b, b_f, h_f, h - a_s, A, A_opp, a_s_opp)
+    has_data = inputs["has_data"][:, np.newaxis, np.newaxis]
+    results["not_implemented"] = has_data & is_top & \
+        (results["ultimate_tensile_force"] > results["ultimate_compressive_force"])
+    return results
+
+
+def get_catalog_areas():
+    """ Areas of tensile reinforcement (all layouts of the bar catalog) and of compressed one
+    (two external bars, like in most of the girders), cm2 """
+    layouts = bar_layouts.get_layouts_table().layouts
+    tensile_areas = np.unique([layout.area for layout in layouts])
+    compressed_areas = np.unique([layout.area for layout in layouts if layout.n_internal == 0])
+    return tensile_areas, compressed_areas
+
+
+def calculate_capacity_curves(inputs: dict, tensile_areas=None, compressed_areas=None):
+    """ Bearing capacity M_ult(As, As') of every section and surface of N students on the grid
+    of reinforcement areas (bar catalog by default); distances to reinforcement are the students' ones.
+    "bearing_capacity" has shape (N, 3, 2, len(tensile_areas), len(compressed_areas)) and is kept in float32;
+    it is NaN for students without data and for not implemented case (see calculate_bearing_capacity_batch) """
+    if tensile_areas is None or compressed_areas is None:
+        catalog_tensile_areas, catalog_compressed_areas = get_catalog_areas()
+        tensile_areas = catalog_tensile_areas if tensile_areas is None else tensile_areas
+        compressed_areas = catalog_compressed_areas if compressed_areas is None else compressed_areas
+    A = np.asarray(tensile_areas, dtype=float)[:, np.newaxis]
+    A_opp = np.asarray(compressed_areas, dtype=float)[np.newaxis, :]
+
+    # students x sections x surfaces x tensile areas x compressed areas
+    R_s, R_sc, R_b, b_w, b_f, h_f, h = get_students_values(inputs, dimensions=5)
+    is_top = (np.array(SURFACES) == "top")[:, np.newaxis, np.newaxis]
+    b = np.where(is_top, b_f, b_w)
+    a_s = inputs["a_s"][..., np.newaxis, np.newaxis]
+    a_s_opp = inputs["a_s"][..., ::-1, np.newaxis, np.newaxis]
+
+    results = get_capacity(R_s, R_sc, R_b, b, b_f, h_f, h - a_s, A, A_opp, a_s_opp)
+    not_implemented = is_top & (results["ultimate_tensile_force"] > results["ultimate_compressive_force"])
+    is_calculated = inputs["has_data"].reshape(-1, 1, 1, 1, 1) & ~not_implemented
+
+    return {
+        "tensile_areas": A[:, 0],
+        "compressed_areas": A_opp[0],
+        "bearing_capacity": np.where(is_calculated, results["bearing_capacity"], np.nan).astype(np.float32),
+    }
+
+
+def get_not_calculated(inputs: dict, results: dict):
+    """ Mask (N, 3, 2) of sections and surfaces without program answers: students without data
+    and not implemented case """
+    return ~inputs["has_data"][:, np.newaxis, np.newaxis] | results["not_implemented"]
+
+
+def get_program_rows(inputs: dict, results: dict, section: int, surface: str):
+    """ Program answers for the section and surface, the same as from bearing_capacity.calculate_bearing_capacity;
+    students without data and with not implemented case are skipped """
+    model = PROGRAM_MODELS[(section, surface)]
+    postfix = f"_{SECTIONS_NAMES[section]}_{surface}"
+    keys = get_program_answers_keys(surface)
+
+    section_index, surface_index = section - 1, SURFACES.index(surface)
+    index = (slice(None), section_index, surface_index)
+    not_calculated = get_not_calculated(inputs, results)[index]
+    values = {key: results[key][index].tolist() for key in keys}
+
+    fingerprints = inputs["fingerprints"]
+    return [model(student_id=student_id, inputs_fingerprint=fingerprints[number][section_index][surface_index],
+                  **{key + postfix: values[key][number] for key in keys})
+            for number, student_id in enumerate(inputs["student_id"].tolist()) if not not_calculated[number]]
+
+
+def get_students_program_rows(students: list):
+    """ Program answers of the students (list of Student with INPUT_ROWS) calculated in one pass:
+    (section, surface) -> rows aligned with the students (None without data or if the calculation fails)
+    and (section, surface) -> flags of failed calculations (bearing_capacity raises errors for them) """
+    inputs = get_cohort_inputs(students)
+    results = calculate_bearing_capacity_batch(inputs)
+    not_calculated = get_not_calculated(inputs, results)
+    failed = results["not_implemented"] | inputs["is_skipped"][:, np.newaxis, np.newaxis]
+
+    students_rows = dict()
+    students_failed = dict()
+    for section, surface in PROGRAM_MODELS.keys():
+        index = (slice(None), section - 1, SURFACES.index(surface))
+        rows = iter(get_program_rows(inputs, results, section, surface))
+        students_rows[(section, surface)] = [None if is_not_calculated else next(rows)
+                                             for is_not_calculated in not_calculated[index].tolist()]
+        students_failed[(section, surface)] = failed[index].tolist()
+    return students_rows, students_failed
+
+
+def calculate_bearing_capacity_for_students(students):
+    """ Calculates program answers for all sections and both surfaces of given students (queryset or list
+    of Student) and saves them with one query per table. Returns inputs, results and mask (N, 3, 2)
+    of the sections, which were not calculated """
+    students = students.select_related(*INPUT_ROWS) if hasattr(students, "select_related") else students
+    inputs = get_cohort_inputs(students)
+    results = calculate_bearing_capacity_batch(inputs)
+
+    for section, surface in PROGRAM_MODELS.keys():
+        bulk_upsert(PROGRAM_MODELS[(section, surface)], get_program_rows(inputs, results, section, surface))
+    return inputs, results, get_not_calculated(inputs, results)
@@ -0,0 +1,175 @@
+import hashlib
+from dataclasses import dataclass
+from typing import Optional
+
+# Calculations of girder's sections without DB access: inputs and results are plain immutable objects,
+# so they could be cached, batched, sent to other processes and benchmarked separately from DB
+
+VALID_SECTIONS = {1, 2, 3}
+VALID_SURFACES = {"top", "bot"}
+CALCULATIONS_VERSION = 1  # is to be increased, when formulas are changed, so saved results are not reused
+
+
+@dataclass(frozen=True, slots=True)
+class Materials:
+    """ Design resistances of girder's concrete and reinforcement, kN/cm2 """
+    R_s: float
+    R_sc: float
+    R_b: float
+    alpha_R: float
+
+
+@dataclass(frozen=True, slots=True)
+class SectionGeometry:
+    """ Dimensions of girder's cross-section, cm """
+    b_w: float  # wall width
+    b_f: float  # effective flange width
+    h_f: float  # flange height
+    h: float  # girder height
+
+
+@dataclass(frozen=True, slots=True)
+class BarsLayer:
+    """ Reinforcement near one surface of the section: area (cm2) and distance from the surface
+    to the centre of bars (cm) """
+    A: float
+    a: float
+
+
+@dataclass(frozen=True, slots=True)
+class ReinforcementResult:
+    alpha_m: float
+    is_compressed_zone_capacity_sufficient: bool
+    reinforcement_area: float
+    # for support sections only (sections 2 and 3)
+    fully_compressed_flange_moment: Optional[float] = None
+    is_neutral_axis_in_flange: Optional[bool] = None
+    section_widths_for_calculation: Optional[float] = None
+    overhanging_flange_area: Optional[float] = None
+
+
+@dataclass(frozen=True, slots=True)
+class CapacityResult:
+    compressed_zone_height_a: float
+    relative_compressed_zone_height_a: float
+    bearing_capacity_a: float
+    compressed_zone_height_b: float
+    bearing_capacity_b: float
+    bearing_capacity: float
+    # for top surface in tension only
+    ultimate_tensile_force: Optional[float] = None
+    ultimate_compressive_force: Optional[float] = None
+
+
+def get_inputs_fingerprint(*inputs):
+    """ Hash of the inputs of calculation (dataclasses, numbers, None): results, which were saved
+    with the same fingerprint, could be reused """
+    return hashlib.sha256(repr((CALCULATIONS_VERSION,) + inputs).encode()).hexdigest()
+
+
+def is_section_valid(section: int):
+    if section not in VALID_SECTIONS:
+        raise ValueError(f"Only {VALID_SECTIONS} could be used!")
+
+
+def calculate_alpha_m(materials: Materials, b: float, M: float, h_0: float, compressed: BarsLayer):
+    m = materials
+    return (M - m.R_sc * compressed.A * (h_0 - compressed.a)) / (m.R_b * b * h_0 ** 2)
+
+
+def calculate_reinforcement_area(materials: Materials, b: float, M: float, h_0: float, compressed: BarsLayer,
+                                 alpha_m: float):
+    m = materials
+
+    if alpha_m > 0:
+        return m.R_b * b * h_0 * (1 - (1 - 2 * alpha_m) ** 0.5) / m.R_s + \
+               compressed.A * m.R_sc / m.R_s
+    else:
+        return M / (m.R_s * (h_0 - compressed.a))
+
+
+def calculate_section_moment_full_flange_compressed(materials: Materials, b: float, h_f: float, h_0: float,
+                                                    compressed: BarsLayer):
+    m = materials
+    return m.R_b * b * h_f * (h_0 - h_f / 2) + \
+           m.R_sc * compressed.A * (h_0 - compressed.a)
+
+
+def calculate_reinforcement(materials: Materials, geometry: SectionGeometry, section: int,
+                            M: float, h_0: float, compressed: BarsLayer):
+    """ Required area of tensile reinforcement: bottom one for the middle section (1),
+    top one for support sections (2, 3); compressed reinforcement is taken into account """
+    is_section_valid(section)
+    b = geometry.b_w if section == 1 else geometry.b_f
+
+    support_values = dict()
+    # special values for sections 2 and 3
+    if section != 1:
+        fully_compressed_flange_moment = calculate_section_moment_full_flange_compressed(materials, b, geometry.h_f,
+                                                                                         h_0, compressed)
+        if fully_compressed_flange_moment > M:  # neutral axis is in flange
+            support_values = {"fully_compressed_flange_moment": fully_compressed_flange_moment,
+                              "is_neutral_axis_in_flange": True,
+                              "section_widths_for_calculation": b,
+                              "overhanging_flange_area": 0}
+        else:
+            raise ValueError(f"Case M_f < M is not implemented!")
+
+    # common values (for sections 2 and 3 for case when M < M_f only!)
+    alpha_m = calculate_alpha_m(materials, b, M, h_0, compressed)
+    if alpha_m > materials.alpha_R:
+        raise ValueError(f"Case alpha_m > alpha_R is not implemented!")
+
+    return ReinforcementResult(alpha_m=alpha_m,
+                               is_compressed_zone_capacity_sufficient=True,
+                               reinforcement_area=calculate_reinforcement_area(materials, b, M, h_0, compressed,
+                                                                               alpha_m),
+                               **support_values)
+
+
+def calculate_bearing_capacity(materials: Materials, geometry: SectionGeometry, surface: str,
+                               tensile: BarsLayer, compressed: BarsLayer):
+    """ Bearing capacity of the section with given surface in tension """
+    m = materials
+    b = geometry.b_f if surface == "top" else geometry.b_w
+    h_0 = geometry.h - tensile.a
+
+    forces = dict()
+    if surface == "top":
+        ultimate_tensile_force = m.R_s * tensile.A
+        ultimate_compressive_force = m.R_b * geometry.b_f * geometry.h_f + m.R_sc * compressed.A
+        forces = {"ultimate_tensile_force": ultimate_tensile_force,
+                  "ultimate_compressive_force": ultimate_compressive_force}
+
+        if ultimate_tensile_force > ultimate_compressive_force:
+            raise ValueError(f"Case Rs*As > Rsc*Asc + Rb*bf*hf is not implemented")
+
+    compressed_zone_height = (m.R_s * tensile.A - m.R_sc * compressed.A) / (m.R_b * b)
+
+    relative_compressed_zone_height = compressed_zone_height / h_0
+
+    if compressed_zone_height < compressed.a * 1.01:
+        bearing_capacity_a = m.R_s * tensile.A * (h_0 - compressed.a)
+    else:
+        bearing_capacity_a = m.R_b * b * compressed_zone_height * (h_0 - compressed_zone_height / 2) + \
+            m.R_sc * compressed.A * (h_0 - compressed.a)
+
+    compressed_zone_height_b = (m.R_s * tensile.A) / (m.R_b * b)
+
+    if compressed_zone_height_b < 2 * compressed.a:
+        bearing_capacity_b = m.R_s * tensile.A * (h_0 - compressed_zone_height_b / 2)
+    else:
+        bearing_capacity_b = 0
+
+    if bearing_capacity_b != 0:
+        ultimate_bearing_capacity = min(bearing_capacity_a, bearing_capacity_b)
+    else:
+        ultimate_bearing_capacity = bearing_capacity_a
+
+    return CapacityResult(compressed_zone_height_a=compressed_zone_height,
+                          relative_compressed_zone_height_a=relative_compressed_zone_height,
+                          bearing_capacity_a=bearing_capacity_a,
+                          compressed_zone_height_b=compressed_zone_height_b,
+                          bearing_capacity_b=bearing_capacity_b,
+                          bearing_capacity=ultimate_bearing_capacity,
+                          **forces)
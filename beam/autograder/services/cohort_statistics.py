@@ -0,0 +1,142 @@
+from collections import defaultdict
+from django.db import connection, transaction
+from django.db.models import Count, Q
+from autograder.models import Student, GroupFieldStatistics
+
+COUNTERS = ("attempted", "passed", "failed")
+# INSERT ... ON CONFLICT parameters of one row are (group id, model, field) + COUNTERS;
+# rows are inserted in chunks, so the query fits SQLite limit of 999 parameters
+UPSERT_CHUNK_SIZE = 150
+
+
+def is_statistics_model(db_model):
+    return db_model.__name__.endswith("Statistics")
+
+
+def get_statistics_models():
+    """ *Statistics models of the students' forms (reverse OneToOne relations of Student) """
+    return [relation.related_model for relation in Student._meta.related_objects
+            if relation.one_to_one and is_statistics_model(relation.related_model)]
+
+
+def get_fields_names(db_model):
+    return [field.attname for field in db_model._meta.concrete_fields if field.name not in ("id", "student")]
+
+
+def get_counts(value):
+    """ (attempted, passed, failed) for a value of statistics; None means that the field is not graded """
+    if value is None:
+        return 0, 0, 0
+    return 1, int(bool(value)), int(not value)
+
+
+def add_deltas(deltas: dict, group_id: int, db_model, previous_values: dict, values: dict):
+    """ Adds changes of the group's counters, which are made by new statistics of a student, to
+    deltas: (group id, model name, field) -> [attempted, passed, failed]. previous_values are empty,
+    if the student's answers were not graded before """
+    for field_name in get_fields_names(db_model):
+        previous_counts = get_counts(previous_values.get(field_name))
+        counts = get_counts(values.get(field_name))
+        if counts != previous_counts:
+            key = (group_id, db_model.__name__, field_name)
+            field_deltas = deltas.setdefault(key, [0] * len(COUNTERS))
+            for index, (count, previous_count) in enumerate(zip(counts, previous_counts)):
+                field_deltas[index] += count - previous_count
+
+
+def get_deltas(students_groups: dict, statistics_rows: dict):
+    """ Changes of the groups' counters (see add_deltas), which are made by new statistics rows
+    (model -> rows) of the students (student id -> group id), compared with the rows, which are saved now.
+    Is called in the transaction, where statistics are saved: rows of the students are locked first,
+    so concurrent gradings of a student wait for each other and every change is counted once """
+    list(Student.objects.select_for_update().filter(pk__in=sorted(students_groups.keys()))
+         .order_by("pk").values_list("pk", flat=True))
+
+    deltas = dict()
+    for db_model, rows in statistics_rows.items():
+        fields_names = get_fields_names(db_model)
+        saved_values = {values["student_id"]: values for values in
+                        db_model.objects.filter(student_id__in=[row.student_id for row in rows]).values()}
+        for row in rows:
+            add_deltas(deltas, students_groups[row.student_id], db_model, saved_values.get(row.student_id, dict()),
+                       {field_name: getattr(row, field_name) for field_name in fields_names})
+    return deltas
+
+
+def save_deltas(deltas: dict):
+    """ Adds deltas (see add_deltas) to the counters with one INSERT ... ON CONFLICT per chunk of fields.
+    Is called in the transaction, where statistics are saved, so the counters are changed with them """
+    # ORM cannot increment values on conflict (bulk_create sets them to the inserted ones)
+    rows = [key + tuple(field_deltas) for key, field_deltas in sorted(deltas.items())
+            if any(field_deltas)]  # rows are locked in the same order by all workers
+    if not rows:
+        return
+
+    quote_name = connection.ops.quote_name
+    table = quote_name(GroupFieldStatistics._meta.db_table)
+    columns = ["group_id", "statistics_model", "field", *COUNTERS]
+    row_placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    updates = ", ".join(f"{quote_name(counter)} = {table}.{quote_name(counter)} + EXCLUDED.{quote_name(counter)}"
+                        for counter in COUNTERS)
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            chunk = rows[start:start + UPSERT_CHUNK_SIZE]
+            cursor.execute(
+                f"INSERT INTO {table} ({', '.join(quote_name(column) for column in columns)}) "
+                f"VALUES {', '.join([row_placeholders] * len(chunk))} "
+                f"ON CONFLICT ({', '.join(quote_name(column) for column in columns[:3])}) DO UPDATE SET {updates}",
+                [value for row in chunk for value in row])
+
+
+def count_group_statistics(groups_ids: list = None):
+    """ Counters of the groups (all groups, if groups_ids is None) calculated from *Statistics tables
+    with one query per table: list of unsaved GroupFieldStatistics """
+    group_statistics = list()
+    for db_model in get_statistics_models():
+        fields_names = get_fields_names(db_model)
+        aggregates = dict()
+        for field_name in fields_names:
+            aggregates[f"passed_{field_name}"] = Count("pk", filter=Q(**{field_name: True}))
+            aggregates[f"failed_{field_name}"] = Count("pk", filter=Q(**{field_name: False}))
+
+        rows = db_model.objects.all()
+        if groups_ids is not None:
+            rows = rows.filter(student__group_id__in=groups_ids)
+        for group_counts in rows.values("student__group_id").annotate(**aggregates).order_by("student__group_id"):
+            for field_name in fields_names:
+                passed = group_counts[f"passed_{field_name}"]
+                failed = group_counts[f"failed_{field_name}"]
+                group_statistics.append(GroupFieldStatistics(
+                    group_id=group_counts["student__group_id"], statistics_model=db_model.__name__,
+                    field=field_name, attempted=passed + failed, passed=passed, failed=failed))
+    return group_statistics
+
+
+def rebuild_group_statistics(groups_ids: list = None):
+    """ Replaces the counters of the groups (all groups, if groups_ids is None) with the ones counted
+    from *Statistics tables (e.g. after statistics were changed without StudentContext).
+    Returns number of saved counters. Students of the groups are locked as in get_deltas, so gradings
+    wait for the rebuild and their deltas are added to the rebuilt counters """
+    with transaction.atomic():
+        students = Student.objects.select_for_update()
+        if groups_ids is not None:
+            students = students.filter(group_id__in=groups_ids)
+        list(students.order_by("pk").values_list("pk", flat=True))
+
+        group_statistics = count_group_statistics(groups_ids)
+        saved_statistics = GroupFieldStatistics.objects.all()
+        if groups_ids is not None:
+            saved_statistics = saved_statistics.filter(group_id__in=groups_ids)
+        saved_statistics.delete()
+        GroupFieldStatistics.objects.bulk_create(group_statistics)
+    return len(group_statistics)
+
+
+def get_group_statistics(group_id: int):
+    """ Counters of the group: model name -> field -> {"attempted": ..., "passed": ..., "failed": ...}
+    (a row per field instead of a row per student and form) """
+    group_statistics = defaultdict(dict)
+    for row in GroupFieldStatistics.objects.filter(group_id=group_id).order_by("statistics_model", "pk"):
+        group_statistics[row.statistics_model][row.field] = {counter: getattr(row, counter) for counter in COUNTERS}
+    return dict(group_statistics)
@@ -0,0 +1,58 @@
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable
+from autograder.models import GirderGeometry, MomentsForces, InitialReinforcement, CalculatedReinforcement
+from . import reiforcement_calculation, bearing_capacity
+from .reiforcement_calculation import SECTIONS_FIELDS
+from .bearing_capacity import VALID_SECTIONS, OPPOSITE_SURFACES, get_section_name
+
+# Checks (forms), whose program answers are calculated from student's answers of the other forms.
+# Every check declares the fields of the answers, which are read by its calculation, so the check
+# is recalculated and graded again only when one of these fields is changed:
+#   GirderGeometry, MomentsForces, InitialReinforcement -> CalculatedReinforcement{Middle,Left,Right}
+#   GirderGeometry, CalculatedReinforcement -> BearingCapacity{Middle,Left,Right}{Bot,Top}
+
+# fields of GirderGeometry, which give the width of the compressed zone (wall or flange)
+WALL_FIELDS = ("girder_wall_width",)
+FLANGE_FIELDS = ("girder_effective_flange_width", "girder_flange_bevel_height", "girder_flange_slab_height")
+
+
+@dataclass(frozen=True)
+class Check:
+    inputs: dict  # answers model -> names of the fields, which are read
+    calculate: Callable  # calculates and saves program answers of the check (takes StudentContext)
+
+
+def get_reinforcement_check(section: int):
+    moment_field, *initial_reinforcement_fields = SECTIONS_FIELDS[section]
+    return Check(inputs={GirderGeometry: WALL_FIELDS if section == 1 else FLANGE_FIELDS,
+                         MomentsForces: (moment_field,),
+                         InitialReinforcement: tuple(initial_reinforcement_fields)},
+                 calculate=partial(reiforcement_calculation.calculate_reinforcement, section=section))
+
+
+def get_capacity_check(section: int, surface: str):
+    """ Tensile reinforcement near the surface and compressed one near the opposite surface are read """
+    reinforcement_fields = tuple(f"section_{section}_{layer_surface}_{value}"
+                                 for layer_surface in (surface, OPPOSITE_SURFACES[surface])
+                                 for value in ("reinforcement_area", "distance"))
+    geometry_fields = ("girder_height",) + (FLANGE_FIELDS if surface == "top" else WALL_FIELDS)
+    return Check(inputs={GirderGeometry: geometry_fields, CalculatedReinforcement: reinforcement_fields},
+                 calculate=partial(bearing_capacity.calculate_bearing_capacity, surface=surface,
+                                   sections=[section]))
+
+
+CHECKS = {f"CalculatedReinforcement{get_section_name(section).capitalize()}": get_reinforcement_check(section)
+          for section in sorted(VALID_SECTIONS)}
+CHECKS.update({f"BearingCapacity{get_section_name(section).capitalize()}{surface.capitalize()}":
+               get_capacity_check(section, surface)
+               for surface in ("bot", "top") for section in sorted(VALID_SECTIONS)})
+
+
+def is_check_changed(check: Check, changed_fields: dict):
+    return any(changed_fields.get(model, set()).intersection(fields) for model, fields in check.inputs.items())
+
+
+def get_changed_checks(changed_fields: dict):
+    """ Names of the checks, which read some of the changed fields (answers model -> set of fields) """
+    return [name for name, check in CHECKS.items() if is_check_changed(check, changed_fields)]
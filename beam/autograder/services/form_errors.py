@@ -0,0 +1,97 @@
+import pickle
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.db import connections, router
+from django.utils.datastructures import MultiValueDict
+
+FORM_ERRORS_CACHE = "form_errors"  # alias in settings.CACHES
+MAX_FORMS_PER_USER = 5  # forms with errors kept for a user, the least recently used are evicted
+MAX_ENTRY_SIZE = 16 * 1024  # bytes; submitted data of a single form is much smaller
+
+
+def get_cache():
+    return caches[FORM_ERRORS_CACHE]
+
+
+def get_max_memory_size():
+    """ Upper bound of memory (bytes), which is needed by the store: number of users is limited
+    by MAX_ENTRIES of the cache, forms of a user are limited both in number and in size """
+    return get_cache()._max_entries * MAX_FORMS_PER_USER * MAX_ENTRY_SIZE
+
+
+def get_memory_size():
+    """ Number of users with forms with errors and memory (bytes), which is occupied by them now
+    (is known for DatabaseCache only, None otherwise) """
+    cache = get_cache()
+    if not isinstance(cache, DatabaseCache):
+        return None
+    connection = connections[router.db_for_read(cache.cache_model_class)]
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*), SUM(LENGTH(value)) FROM {connection.ops.quote_name(cache._table)}")
+        users_number, size = cursor.fetchone()
+    return users_number, size or 0
+
+
+def get_entry_size(payload: dict):
+    return len(pickle.dumps(payload, pickle.HIGHEST_PROTOCOL))
+
+
+class FormErrorsStore:
+    """ Submitted data of forms, which were not saved because of errors. Data of all forms of a user
+    is kept in one entry of Django cache (shared by all worker processes), so the form with errors could
+    be shown after redirect. Entries expire after cache TIMEOUT and are culled by the cache, when there
+    are more than its MAX_ENTRIES; forms of a user are kept in LRU order, the least recently used ones
+    are evicted after MAX_FORMS_PER_USER. Only requests of the same user write the entry """
+
+    def __init__(self, user_id: int):
+        self.user_id = user_id
+        self.cache = get_cache()
+
+    def get_key(self):
+        return f"user:{self.user_id}"
+
+    def get_forms(self):
+        """ form name -> submitted data (as dict of lists), the least recently used first """
+        return self.cache.get(self.get_key(), dict())
+
+    def set_forms(self, forms: dict):
+        if forms:
+            self.cache.set(self.get_key(), forms)
+        else:
+            self.cache.delete(self.get_key())
+
+    def get_many(self, forms_names: list):
+        """ Returns dict form_name -> submitted data for forms with errors """
+        forms = self.get_forms()
+        used_forms_names = [form_name for form_name in forms.keys() if form_name in forms_names]
+        if used_forms_names and list(forms.keys())[-len(used_forms_names):] != used_forms_names:
+            for form_name in used_forms_names:  # moved to the end of LRU order
+                forms[form_name] = forms.pop(form_name)
+            self.set_forms(forms)
+        return {form_name: MultiValueDict(forms[form_name]) for form_name in used_forms_names}
+
+    def update(self, forms_data: dict, discarded_forms_names: list = ()):
+        """ Keeps submitted data of the forms with errors (form name -> data) and discards the forms,
+        which are saved now, with one read and one write of the entry """
+        forms = self.get_forms()
+        changed = False
+        for form_name in discarded_forms_names:
+            changed = forms.pop(form_name, None) is not None or changed
+
+        for form_name, data in forms_data.items():
+            payload = dict(data.lists())
+            forms.pop(form_name, None)
+            changed = True
+            if get_entry_size(payload) <= MAX_ENTRY_SIZE:  # something odd was posted otherwise, do not keep it
+                forms[form_name] = payload
+
+        if changed:
+            for form_name in list(forms.keys())[:max(len(forms) - MAX_FORMS_PER_USER, 0)]:
+                del forms[form_name]
+            self.set_forms(forms)
+
+    def save(self, form_name: str, data: MultiValueDict):
+        self.update({form_name: data})
+
+    def discard(self, form_name: str):
+        self.update(dict(), [form_name])
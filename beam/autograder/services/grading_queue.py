@@ -0,0 +1,228 @@
+import logging
+import os
+import socket
+import time
+import uuid
+from datetime import timedelta
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from autograder.models import GradingJob
+from . import validation, reinforcement_batch, bearing_capacity_batch
+from .bearing_capacity import get_section_name
+from .regrade import get_shard_contexts, grade_program_answers
+from .reiforcement_calculation import is_fingerprint_saved
+from .student_context import StudentContext, get_field_values, save_students_deferred_rows
+
+logger = logging.getLogger(__name__)
+
+FORMS_SEPARATOR = ","
+# all checks (see dependency_graph) are calculated for the students of the batch at once:
+# check name -> (batch engine, key of its rows)
+BATCH_CHECKS = {f"CalculatedReinforcement{get_section_name(section).capitalize()}": (reinforcement_batch, section)
+                for section in reinforcement_batch.SECTIONS}
+BATCH_CHECKS.update({f"BearingCapacity{get_section_name(section).capitalize()}{surface.capitalize()}":
+                     (bearing_capacity_batch, (section, surface))
+                     for section, surface in bearing_capacity_batch.PROGRAM_MODELS.keys()})
+
+
+def add_forms(job: GradingJob, forms_names: list):
+    job_forms_names = job.forms_names.split(FORMS_SEPARATOR)
+    job.forms_names = FORMS_SEPARATOR.join(job_forms_names + [name for name in forms_names
+                                                              if name not in job_forms_names])
+    job.save(update_fields=["forms_names"])
+
+
+def add_to_pending_job(student_id: int, forms_names: list):
+    """ Adds the forms to the pending job of the student or creates new job """
+    with transaction.atomic():
+        job = GradingJob.objects.select_for_update().filter(student_id=student_id, status=GradingJob.PENDING).first()
+        if job is None:
+            return GradingJob.objects.create(student_id=student_id, forms_names=FORMS_SEPARATOR.join(forms_names))
+        add_forms(job, forms_names)
+        return job
+
+
+def enqueue(student_context: StudentContext, forms_names: list):
+    """ Adds the forms to the pending job of the student or creates new job, so several submissions
+    of the student, which are made before the job is taken by a worker, are graded once """
+    try:
+        return add_to_pending_job(student_context.student_id, forms_names)
+    except IntegrityError:  # pending job was created by a concurrent request (there is one pending job per student)
+        return add_to_pending_job(student_context.student_id, forms_names)
+
+
+def get_latest_job(user_name: str):
+    return GradingJob.objects.filter(student__user__username=user_name).order_by("-pk").first()
+
+
+def claim_jobs(worker_name: str, batch_size: int):
+    """ Marks the oldest pending jobs as taken by the worker; jobs of the students, whose answers
+    are being graded by other workers, wait, so the newer answers are not overwritten by the older ones """
+    running_jobs = GradingJob.objects.filter(student_id=OuterRef("student_id"), status=GradingJob.RUNNING)
+    jobs_ids = list(GradingJob.objects.filter(status=GradingJob.PENDING).filter(~Exists(running_jobs))
+                    .order_by("pk").values_list("pk", flat=True)[:batch_size])
+    if not jobs_ids:
+        return list()
+
+    # the job could be taken by another worker between the queries
+    GradingJob.objects.filter(pk__in=jobs_ids, status=GradingJob.PENDING).update(
+        status=GradingJob.RUNNING, worker=worker_name, started_at=timezone.now())
+    return list(GradingJob.objects.filter(pk__in=jobs_ids, status=GradingJob.RUNNING, worker=worker_name)
+                .order_by("pk"))
+
+
+def save_program_row(student_context: StudentContext, row):
+    """ Keeps the row of batch engine in deferred rows of the context, unless the saved one is calculated
+    from the same inputs (like the scalar calculations) """
+    if not is_fingerprint_saved(student_context, type(row), row.inputs_fingerprint):
+        values = get_field_values(row)
+        del values["id"], values["student_id"]
+        student_context.save_row(type(row), values)
+
+
+def calculate_checks(checked_contexts: dict):
+    """ Calculates program answers of the checks (check name -> contexts of the students, whose answers
+    are graded with it) with one pass of every batch engine for all students; rows are kept in deferred rows
+    of the contexts. Returns student id -> names of the checks, which could not be calculated for the student
+    (not implemented cases or missing data, which raise errors in the scalar calculations) """
+    failed_checks = dict()
+    for engine in dict.fromkeys(BATCH_CHECKS[name][0] for name in checked_contexts.keys()):
+        names = [name for name in checked_contexts.keys() if BATCH_CHECKS[name][0] is engine]
+        contexts = list({student_context.student_id: student_context
+                         for name in names for student_context in checked_contexts[name]}.values())
+        numbers = {student_context.student_id: number for number, student_context in enumerate(contexts)}
+        students_rows, students_failed = engine.get_students_program_rows([student_context.student
+                                                                           for student_context in contexts])
+        for name in names:
+            key = BATCH_CHECKS[name][1]
+            for student_context in checked_contexts[name]:
+                number = numbers[student_context.student_id]
+                if students_failed[key][number]:
+                    failed_checks.setdefault(student_context.student_id, list()).append(name)
+                elif students_rows[key][number] is not None:
+                    save_program_row(student_context, students_rows[key][number])
+    return failed_checks
+
+
+def grade_jobs(jobs: list, models_dict: dict):
+    """ Grades the jobs with contexts of the students, which are loaded with two queries, and saves
+    program answers and statistics of all students (and counters of their groups' statistics) with
+    one query per table in one transaction. Program answers of the checks are calculated by batch engines
+    and graded with matrices for all students at once, the other forms are graded student by student.
+    Returns number of failed jobs """
+    students_contexts = {student_context.student_id: student_context
+                         for student_context in get_shard_contexts([job.student_id for job in jobs])}
+    errors = dict()  # job -> error (e.g. answers with not implemented cases or missing data)
+    checked_contexts = dict()  # check name -> contexts of the students, whose answers are graded with it
+
+    for job in jobs:
+        student_context = students_contexts[job.student_id]
+        try:
+            for name in validation.get_graded_forms_names(student_context, models_dict,
+                                                          job.forms_names.split(FORMS_SEPARATOR)):
+                if name in BATCH_CHECKS:
+                    checked_contexts.setdefault(name, list()).append(student_context)
+                else:
+                    validation.grade_form_answers(student_context, name, models_dict[name])
+        except Exception as error:  # one job should not stop the worker
+            errors[job] = f"{type(error).__name__}: {error}"
+            student_context.discard_deferred_rows()
+
+    failed_students_ids = {job.student_id for job in errors.keys()}
+    checked_contexts = {name: [student_context for student_context in contexts
+                               if student_context.student_id not in failed_students_ids]
+                        for name, contexts in checked_contexts.items()}
+    failed_checks = calculate_checks(checked_contexts)
+    for job in jobs:
+        if job.student_id in failed_checks:
+            errors[job] = f"ValueError: program answers of {', '.join(failed_checks[job.student_id])} " \
+                          f"could not be calculated (not implemented case or missing data)"
+            students_contexts[job.student_id].discard_deferred_rows()
+
+    for name, contexts in checked_contexts.items():
+        contexts = [student_context for student_context in contexts
+                    if student_context.student_id not in failed_checks]
+        if contexts:
+            grade_program_answers(name, contexts, models_dict[name])
+
+    with transaction.atomic():
+        save_students_deferred_rows(list(students_contexts.values()))
+        GradingJob.objects.filter(pk__in=[job.pk for job in jobs if job not in errors]).update(
+            status=GradingJob.DONE, finished_at=timezone.now())
+        for job, error in errors.items():
+            GradingJob.objects.filter(pk=job.pk).update(status=GradingJob.FAILED, error=error,
+                                                        finished_at=timezone.now())
+    return len(errors)
+
+
+def requeue_job(job: GradingJob):
+    """ Makes the running job pending again; its forms are added to the pending job of the student,
+    if there is one, and the job is failed. Returns False, if the job is not running anymore """
+    with transaction.atomic():
+        pending_job = GradingJob.objects.select_for_update().filter(student_id=job.student_id,
+                                                                    status=GradingJob.PENDING).first()
+        if pending_job is None:
+            return GradingJob.objects.filter(pk=job.pk, status=GradingJob.RUNNING).update(
+                status=GradingJob.PENDING, worker="") > 0
+
+        is_requeued = GradingJob.objects.filter(pk=job.pk, status=GradingJob.RUNNING).update(
+            status=GradingJob.FAILED, error=f"Abandoned, forms are graded with job {pending_job.pk}",
+            finished_at=timezone.now()) > 0
+        if is_requeued:
+            add_forms(pending_job, job.forms_names.split(FORMS_SEPARATOR))
+        return is_requeued
+
+
+def requeue_stale_jobs(stale_after: float):
+    """ Jobs of the workers, which were stopped while grading, are given to other workers.
+    Returns number of requeued jobs """
+    requeued_number = 0
+    for job in GradingJob.objects.filter(status=GradingJob.RUNNING,
+                                         started_at__lt=timezone.now() - timedelta(seconds=stale_after)):
+        try:
+            requeued_number += requeue_job(job)
+        except IntegrityError:  # pending job of the student was created concurrently
+            requeued_number += requeue_job(job)
+    return requeued_number
+
+
+def fail_jobs(jobs: list, error: Exception):
+    """ Marks the jobs of the batch, which could not be graded, as failed; if it is not possible
+    (e.g. the database is not available), the jobs are requeued, when they are stale """
+    close_old_connections()  # connection could be broken by the error
+    try:
+        GradingJob.objects.filter(pk__in=[job.pk for job in jobs], status=GradingJob.RUNNING).update(
+            status=GradingJob.FAILED, error=f"{type(error).__name__}: {error}", finished_at=timezone.now())
+    except Exception:
+        logger.exception("Jobs %s are left running", [job.pk for job in jobs])
+
+
+def run_worker(models_dict: dict, batch_size: int, poll_interval: float, stale_after: float, once: bool = False):
+    """ Grades pending jobs in batches until it is stopped (or until the queue is empty, if once is set);
+    stale jobs of the stopped workers are requeued every stale_after / 2 seconds.
+    models_dict is form name -> models of the form, like in StudentPersonalView.
+    Returns numbers of graded and failed jobs """
+    worker_name = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    graded_number = 0
+    failed_number = 0
+    requeued_at = time.monotonic()
+
+    while True:
+        if time.monotonic() - requeued_at >= stale_after / 2:
+            requeue_stale_jobs(stale_after)
+            requeued_at = time.monotonic()
+
+        jobs = claim_jobs(worker_name, batch_size)
+        if jobs:
+            try:
+                failed_number += grade_jobs(jobs, models_dict)
+            except Exception as error:  # the batch should not stop the worker
+                logger.exception("Batch of jobs %s is not graded", [job.pk for job in jobs])
+                fail_jobs(jobs, error)
+                failed_number += len(jobs)
+            graded_number += len(jobs)
+        elif once:
+            return graded_number, failed_number
+        else:
+            time.sleep(poll_interval)
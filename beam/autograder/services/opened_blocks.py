@@ -0,0 +1,77 @@
+from django.db import transaction
+from autograder.models import Student, StudentOpenForms
+from .student_context import StudentContext
+
+
+def get_forms_names(models_dict: dict):
+    """ Names of all forms on the student's page in the order of blocks """
+    return [model_name for block_models in models_dict.values() for model_name in block_models.keys()]
+
+
+def get_form_bit(models_dict: dict, form_name: str):
+    return 1 << get_forms_names(models_dict).index(form_name)
+
+
+def get_block_mask(models_dict: dict, block_name: str):
+    block_mask = 0
+    for model_name in models_dict[block_name].keys():
+        block_mask |= get_form_bit(models_dict, model_name)
+    return block_mask
+
+
+def count_filled_blocks(models_dict: dict, filled_forms: int):
+    filled_blocks_number = 0
+    for block_name in models_dict.keys():
+        block_mask = get_block_mask(models_dict, block_name)
+        if filled_forms & block_mask == block_mask:  # all models in block are filled
+            filled_blocks_number += 1
+    return filled_blocks_number
+
+
+def get_filled_forms_from_answers(student_context: StudentContext, models_dict: dict):
+    """ Bitmask of filled forms built from student's answers (for students, who filled forms
+    before the bitmask was introduced) """
+    filled_forms = 0
+    for block_models in models_dict.values():
+        for model_name, models_list in block_models.items():
+            if student_context.get_row(models_list[0]) is not None:
+                filled_forms |= get_form_bit(models_dict, model_name)
+    return filled_forms
+
+
+def get_locked_blocks(student: Student):
+    """ StudentOpenForms row of the student locked till the end of the transaction. If there is no row yet,
+    the student is locked, so the row is created once, and it is looked for again after the lock is got """
+    current_blocks = StudentOpenForms.objects.select_for_update().filter(student=student).first()
+    if current_blocks is None:
+        list(Student.objects.select_for_update().filter(pk=student.pk).values_list("pk", flat=True))
+        current_blocks = StudentOpenForms.objects.select_for_update().filter(student=student).first()
+    return current_blocks
+
+
+def mark_forms_filled(student_context: StudentContext, models_dict: dict, forms_names: list):
+    """ Updates opened blocks after the answers for the forms are saved (one update for all of them);
+    should be called in the same transaction as the answers are saved. The bitmask is read again
+    with the row locked, so concurrent submits of the student do not lose each other's forms """
+    current_blocks = student_context.get_row(StudentOpenForms)
+    forms_bits = 0
+    for form_name in forms_names:
+        forms_bits |= get_form_bit(models_dict, form_name)
+
+    if current_blocks is not None and current_blocks.filled_forms & forms_bits == forms_bits:  # nothing has changed
+        return
+
+    with transaction.atomic():
+        current_blocks = get_locked_blocks(student_context.student)
+        if current_blocks is None or current_blocks.filled_forms == 0:
+            filled_forms = get_filled_forms_from_answers(student_context, models_dict)
+        else:
+            filled_forms = current_blocks.filled_forms
+        filled_forms |= forms_bits
+
+        if current_blocks is None:
+            current_blocks = StudentOpenForms(student=student_context.student)
+        current_blocks.filled_forms = filled_forms
+        current_blocks.max_opened_form_number = count_filled_blocks(models_dict, filled_forms)
+        current_blocks.save()
+    student_context.set_row(current_blocks)
@@ -0,0 +1,96 @@
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import connection
+
+# maximum number of SQL queries per request for instrumented views
+QUERY_BUDGETS = {
+    "StudentPersonalView": {"GET": 20, "POST": 35},
+    "StudentFormSubmitView": {"POST": 35},
+    "StudentFormsBatchSubmitView": {"POST": 100},
+    "StudentGradingStatusView": {"GET": 5},
+    "GroupStatisticsView": {"GET": 3},
+}
+
+current_query_stats = ContextVar("current_query_stats", default=None)
+
+
+class QueryStats:
+    """ Counts SQL queries, their total time and duplicated statements
+    (is used as database execute wrapper) """
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.statements = Counter()
+        self.events = Counter()  # other countable things, which happened during the request
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - start
+            self.count += 1
+            self.statements[(sql, repr(params))] += 1
+
+    def get_duplicates(self):
+        """ Statements (with the same parameters), which were executed more than once """
+        return {sql: number for (sql, params), number in self.statements.items() if number > 1}
+
+    def get_duplicates_number(self):
+        return sum(number - 1 for number in self.get_duplicates().values())
+
+    def get_hit_rates(self):
+        """ Cache name -> share of hits, for caches which count "<name>-Hits" and "<name>-Misses" events """
+        hit_rates = dict()
+        for event_name in self.events.keys():
+            if event_name.endswith(("-Hits", "-Misses")):
+                cache_name = event_name.rsplit("-", 1)[0]
+                hits, misses = self.events[f"{cache_name}-Hits"], self.events[f"{cache_name}-Misses"]
+                hit_rates[cache_name] = hits / (hits + misses)
+        return hit_rates
+
+    def get_summary(self):
+        summary = f"{self.count} queries in {self.time * 1000:.1f} ms, {self.get_duplicates_number()} duplicates"
+        for cache_name, hit_rate in self.get_hit_rates().items():
+            summary += f", {cache_name} hit rate {hit_rate:.0%}"
+        return summary
+
+
+def count_event(event_name: str, number: int = 1):
+    """ Adds event to statistics of the current request (if it is recorded) """
+    query_stats = current_query_stats.get()
+    if query_stats is not None:
+        query_stats.events[event_name] += number
+
+
+@contextmanager
+def record_queries():
+    query_stats = QueryStats()
+    token = current_query_stats.set(query_stats)
+    try:
+        with connection.execute_wrapper(query_stats):
+            yield query_stats
+    finally:
+        current_query_stats.reset(token)
+
+
+def get_query_budget(view_name: str, method: str):
+    return QUERY_BUDGETS.get(view_name, dict()).get(method)
+
+
+@contextmanager
+def assert_query_budget(view_name: str, method: str = "GET"):
+    """ Fails if code inside the block runs more queries than the budget of the view allows """
+    with record_queries() as query_stats:
+        yield query_stats
+
+    budget = get_query_budget(view_name, method)
+    if budget is None:
+        raise AssertionError(f"There is no query budget for {method} {view_name}")
+    if query_stats.count > budget:
+        duplicates = "\n".join(f"{number} x {sql}" for sql, number in query_stats.get_duplicates().items())
+        raise AssertionError(f"{method} {view_name}: {query_stats.get_summary()}, budget is {budget} queries.\n"
+                             f"Duplicated queries:\n{duplicates}")
@@ -0,0 +1,102 @@
+import time
+import uuid
+from django.core.cache import caches
+from django.forms.models import ModelChoiceIteratorValue
+from autograder.models import (Concrete, Reinforcement, ReinforcementBarsDiameters, Cities,
+                               PersonalVariantsCivilEngineers, PersonalVariantsArchitects)
+
+REFERENCE_TABLES_CACHE = "reference_tables"  # alias in settings.CACHES, shared by all processes
+VERSION_KEY = "version"
+CHECK_INTERVAL = 30  # seconds between checks of the version in the shared cache
+
+
+class ReferenceTable:
+    """ Rows of a reference table, which are kept in memory of the process and indexed
+    by primary key and by natural key. Rows are loaded from DB on first use """
+
+    def __init__(self, db_model, natural_key: str):
+        self.db_model = db_model
+        self.natural_key = natural_key
+        self.rows = None
+        self.rows_by_pk = None
+        self.rows_by_natural_key = None
+        self.choices = None
+
+    def load(self):
+        rows = list(self.db_model.objects.order_by("pk"))
+        self.rows_by_pk = {row.pk: row for row in rows}
+        self.rows_by_natural_key = {getattr(row, self.natural_key): row for row in rows}
+        self.choices = None
+        self.rows = rows
+
+    def clear(self):
+        self.rows = None
+        self.choices = None
+
+    def all(self):
+        check_version()
+        if self.rows is None:
+            self.load()
+        return self.rows
+
+    def get_choices(self):
+        """ Choices for select widgets, which are built once and shared by all form fields
+        referring to the table """
+        rows = self.all()
+        if self.choices is None:
+            self.choices = [(ModelChoiceIteratorValue(row.pk, row), str(row)) for row in rows]
+        return self.choices
+
+    def get(self, pk: int):
+        self.all()
+        return self.rows_by_pk.get(pk)
+
+    def get_by_natural_key(self, value):
+        self.all()
+        return self.rows_by_natural_key.get(value)
+
+
+REFERENCE_TABLES = {
+    Concrete: ReferenceTable(Concrete, "concrete_class"),
+    Reinforcement: ReferenceTable(Reinforcement, "reinforcement_class"),
+    ReinforcementBarsDiameters: ReferenceTable(ReinforcementBarsDiameters, "diameter"),
+    Cities: ReferenceTable(Cities, "city_name"),
+    PersonalVariantsCivilEngineers: ReferenceTable(PersonalVariantsCivilEngineers, "personal_variant"),
+    PersonalVariantsArchitects: ReferenceTable(PersonalVariantsArchitects, "personal_variant"),
+}
+
+loaded_version = None
+version_checked_at = None
+
+
+def get_table(db_model):
+    return REFERENCE_TABLES[db_model]
+
+
+def clear_tables():
+    for table in REFERENCE_TABLES.values():
+        table.clear()
+
+
+def check_version():
+    """ Drops loaded tables if reference information was changed by another process """
+    global loaded_version, version_checked_at
+
+    now = time.monotonic()
+    if version_checked_at is not None and now - version_checked_at < CHECK_INTERVAL:
+        return
+    version_checked_at = now
+
+    version = caches[REFERENCE_TABLES_CACHE].get(VERSION_KEY)
+    if version != loaded_version:
+        clear_tables()
+        loaded_version = version
+
+
+def bump_version():
+    """ Should be called after reference tables are changed """
+    global version_checked_at
+
+    caches[REFERENCE_TABLES_CACHE].set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+    version_checked_at = None
+    clear_tables()
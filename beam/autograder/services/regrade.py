@@ -0,0 +1,111 @@
+from collections import Counter, defaultdict
+from django.core.exceptions import ObjectDoesNotExist
+from autograder.models import Student
+from . import validation
+from .dependency_graph import CHECKS
+from .student_context import (StudentContext, get_student_relations, get_accessors, get_field_values,
+                              get_variants_info, save_students_deferred_rows)
+
+
+def get_shard_contexts(students_ids: list):
+    """ Contexts of the students with all their rows and variants, loaded with two queries """
+    relations = get_student_relations()
+    students = list(Student.objects.select_related("group", *get_accessors(relations))
+                    .filter(pk__in=students_ids).order_by("pk"))
+    variants_info = get_variants_info(students)
+
+    students_contexts = list()
+    for student in students:
+        student_context = StudentContext(student, defer_writes=True)
+        student_context.set_loaded_rows(student, relations)
+        variant_info = variants_info.get((student.group_id, student.subgroup_variant_number))
+        if variant_info is not None:  # otherwise it is looked up (and not found) by the context
+            student_context.variant_info = variant_info
+        students_contexts.append(student_context)
+    return students_contexts
+
+
+def regrade_student(student_context: StudentContext, models_dict: dict):
+    """ Recalculates program answers of all forms, which student has answered, and grades the forms,
+    which are not graded with program answers (rows are kept in deferred rows of the context).
+    Returns names of the forms to be graded with grade_program_answers and statistics model ->
+    values of the fields before regrading """
+    graded_forms = {name: models for name, models in models_dict.items() if len(models) > 2}
+    for name in CHECKS.keys():  # formulas could be changed, so saved results are not reused
+        if name in graded_forms:
+            program_answers = student_context.get_row(graded_forms[name][2])
+            if program_answers is not None:
+                program_answers.inputs_fingerprint = ""
+
+    answered_forms_names = [name for name, models in graded_forms.items()
+                            if student_context.get_row(models[0]) is not None]
+    previous_statistics = {models[3]: get_field_values(student_context.get_row(models[3]))
+                           for models in graded_forms.values()}
+
+    checked_forms_names = [name for name in answered_forms_names if name in CHECKS]
+    validation.validate_forms_answers(student_context, models_dict,
+                                      [name for name in answered_forms_names if name not in CHECKS])
+    for name in checked_forms_names:
+        CHECKS[name].calculate(student_context)
+    return checked_forms_names, previous_statistics
+
+
+def grade_program_answers(name: str, students_contexts: list, models: list):
+    """ Grades answers of the form of all students at once with matrices of values """
+    student_answers_model, _, program_answers_model, statistics_model = models
+    fields = validation.get_grading_spec(name, student_answers_model).fields
+    statistics = validation.validate_program_answers_matrix(
+        [student_context.get_row(student_answers_model) for student_context in students_contexts],
+        [student_context.get_row(program_answers_model) for student_context in students_contexts],
+        fields)
+
+    fields_names = [field.name for field in fields]
+    for student_context, student_statistics in zip(students_contexts, statistics.tolist()):
+        student_context.save_row(statistics_model, dict(zip(fields_names, student_statistics)))
+
+
+def get_flipped_flags(student_context: StudentContext, previous_statistics: dict):
+    """ Counter of (statistics model name, field, previous value, new value) for changed statistics """
+    flipped_flags = Counter()
+    for statistics_model, previous_values in previous_statistics.items():
+        statistics = student_context.deferred_rows.get(statistics_model)
+        if statistics is None or not previous_values:  # answers are graded for the first time
+            continue
+        for field_name, value in get_field_values(statistics).items():
+            if field_name in previous_values and previous_values[field_name] != value:
+                flipped_flags[(statistics_model.__name__, field_name, previous_values[field_name], value)] += 1
+    return flipped_flags
+
+
+def regrade_shard(students_ids: list, models_dict: dict, dry_run: bool = False):
+    """ Regrades the students and saves their program answers and statistics (and counters of their
+    groups' statistics) with one query per table in one transaction (is run in worker processes).
+    models_dict is form name -> models of the form, like in StudentPersonalView. Returns number of regraded students, ids of skipped ones
+    (with missing data or not implemented cases) and flipped statistics flags """
+    flipped_flags = Counter()
+    skipped_students_ids = list()
+
+    students_contexts = get_shard_contexts(students_ids)
+    regraded_contexts = list()
+    checked_contexts = defaultdict(list)  # form name -> contexts of the students, who answered it
+    for student_context in students_contexts:
+        try:
+            checked_forms_names, previous_statistics = regrade_student(student_context, models_dict)
+        except (ValueError, ObjectDoesNotExist):
+            skipped_students_ids.append(student_context.student_id)
+            continue
+
+        regraded_contexts.append((student_context, previous_statistics))
+        for name in checked_forms_names:
+            checked_contexts[name].append(student_context)
+
+    for name, form_contexts in checked_contexts.items():
+        grade_program_answers(name, form_contexts, models_dict[name])
+
+    for student_context, previous_statistics in regraded_contexts:
+        flipped_flags.update(get_flipped_flags(student_context, previous_statistics))
+
+    if not dry_run:
+        save_students_deferred_rows([student_context for student_context, _ in regraded_contexts])
+
+    return len(students_contexts) - len(skipped_students_ids), skipped_students_ids, flipped_flags
@@ -1,223 +1,141 @@
-from autograder.models import (Student, VariantInfo,
-                               Concrete, Reinforcement,
-                               GirderGeometry, MomentsForces, InitialReinforcement,
+from autograder.models import (GirderGeometry, MomentsForces, InitialReinforcement,
                                CalculatedReinforcementMiddleProgram,
                                CalculatedReinforcementLeftProgram,
                                CalculatedReinforcementRightProgram
                                )
+from .student_context import StudentContext
+from .query_stats import count_event
+from .calculation_kernel import Materials, SectionGeometry, BarsLayer, ReinforcementResult
+from . import calculation_kernel as kernel
 
-VALID_SECTIONS = {1, 2, 3}
+VALID_SECTIONS = kernel.VALID_SECTIONS
 
+# section -> (moment, effective depth, area and distance of compressed reinforcement) fields
+SECTIONS_FIELDS = {
+    1: ("middle_section_moment_bot", "section_1_bot_effective_depth",
+        "section_1_top_reinforcement_area", "section_1_top_distance"),
+    2: ("left_support_moment_top", "section_2_top_effective_depth",
+        "section_2_bot_reinforcement_area", "section_2_bot_distance"),
+    3: ("right_support_moment_top", "section_3_top_effective_depth",
+        "section_3_bot_reinforcement_area", "section_3_bot_distance"),
+}
+PROGRAM_MODELS = {1: (CalculatedReinforcementMiddleProgram, "_middle"),
+                  2: (CalculatedReinforcementLeftProgram, "_left"),
+                  3: (CalculatedReinforcementRightProgram, "_right")}
 
-def get_section_geometry(student_id: int):
-    girder_geometry = GirderGeometry.objects.filter(student_id=student_id).first()
-    geometry = dict()
-    if girder_geometry is not None:
-        geometry["b_w"] = float(girder_geometry.girder_wall_width)
-        geometry["b_f"] = float(girder_geometry.girder_effective_flange_width)
-        geometry["h_f"] = float(girder_geometry.girder_flange_bevel_height +
-                                girder_geometry.girder_flange_slab_height)
-        geometry["h"] = float(girder_geometry.girder_height)
-    else:
-        geometry["geometry"] = None
-
-    return geometry
-
-
-def get_moments(student_id: int):
-    moments_forces = MomentsForces.objects.filter(student_id=student_id).first()
-    moments = dict()
-    if moments_forces is not None:
-        moments["M_1_bot"] = float(moments_forces.middle_section_moment_bot)
-        moments["M_1_top"] = float(moments_forces.middle_section_moment_top)
-
-        moments["M_2_bot"] = float(moments_forces.left_support_moment_bot)
-        moments["M_2_top"] = float(moments_forces.left_support_moment_top)
-
-        moments["M_3_bot"] = float(moments_forces.right_support_moment_bot)
-        moments["M_3_top"] = float(moments_forces.right_support_moment_top)
-    else:
-        moments["moments"] = None
-
-    return moments
-
-
-def get_initial_reinforcement(student_id: int):
-    initial_reinforcement = InitialReinforcement.objects.filter(student_id=student_id).first()
-    reinforcement = dict()
-
-    if initial_reinforcement is not None:
-        reinforcement["A_sc_1"] = float(initial_reinforcement.section_1_top_reinforcement_area)
-        reinforcement["h_0_1"] = float(initial_reinforcement.section_1_bot_effective_depth)
-        reinforcement["a_sc_1"] = float(initial_reinforcement.section_1_top_distance)
-
-        reinforcement["A_sc_2"] = float(initial_reinforcement.section_2_bot_reinforcement_area)
-        reinforcement["h_0_2"] = float(initial_reinforcement.section_2_top_effective_depth)
-        reinforcement["a_sc_2"] = float(initial_reinforcement.section_2_bot_distance)
-
-        reinforcement["A_sc_3"] = float(initial_reinforcement.section_3_bot_reinforcement_area)
-        reinforcement["h_0_3"] = float(initial_reinforcement.section_3_top_effective_depth)
-        reinforcement["a_sc_3"] = float(initial_reinforcement.section_3_bot_distance)
-    else:
-        reinforcement["reinforcement"] = None
-
-    return reinforcement
 
+def get_section_geometry(student_context: StudentContext):
+    return student_context.get_calculation_data("geometry", lambda: build_section_geometry(student_context))
 
-def get_materials_properties(student_id: int):
-    materials = dict()
 
-    student = Student.objects.filter(pk=student_id).first()
+def get_materials_properties(student_context: StudentContext):
+    return student_context.get_calculation_data("materials", lambda: build_materials_properties(student_context))
 
-    if student is not None:
-        student_subgroup_variant = student.subgroup_variant_number
-        student_variant_data = VariantInfo.objects.get(variant_number=student_subgroup_variant)
-        concrete_id = student_variant_data.girder_concrete_id
-        reinforcement_id = student_variant_data.girder_reinforcement_id
-        concrete = Concrete.objects.filter(pk=concrete_id).first()
-        reinforcement = Reinforcement.objects.filter(pk=reinforcement_id).first()
 
-        if reinforcement is not None and concrete is not None:
-            materials["R_s"] = float(reinforcement.R_s / 10)
-            materials["R_sc"] = float(reinforcement.R_sc_sh / 10)
-            materials["alpha_R"] = float(reinforcement.alpha_R)
-            materials["R_b"] = float(concrete.R_b / 10)
-        else:
-            materials["materials"] = None
-    else:
-        materials["materials"] = None
-
-    return materials
-
-
-def is_data_for_calculations(data_to_check: dict):
-    return None not in data_to_check.values()
+def build_section_geometry(student_context: StudentContext):
+    return get_section_geometry_from_row(student_context.get_row(GirderGeometry))
 
 
-def get_data_for_reinforcement_calculation(student_id: int):
-    data_for_reinforcement_calculation = dict()
+def get_section_geometry_from_row(girder_geometry: GirderGeometry):
+    if girder_geometry is None:
+        return None
 
-    data_for_reinforcement_calculation.update(get_section_geometry(student_id))
-    data_for_reinforcement_calculation.update(get_materials_properties(student_id))
-    data_for_reinforcement_calculation.update(get_moments(student_id))
-    data_for_reinforcement_calculation.update(get_initial_reinforcement(student_id))
+    return SectionGeometry(b_w=float(girder_geometry.girder_wall_width),
+                           b_f=float(girder_geometry.girder_effective_flange_width),
+                           h_f=float(girder_geometry.girder_flange_bevel_height +
+                                     girder_geometry.girder_flange_slab_height),
+                           h=float(girder_geometry.girder_height))
 
-    return data_for_reinforcement_calculation
 
+def build_materials_properties(student_context: StudentContext):
+    return get_materials_from_rows(student_context.girder_concrete, student_context.girder_reinforcement)
 
-def is_section_valid(section: int):
-    if section not in VALID_SECTIONS:
-        raise ValueError(f"Only {VALID_SECTIONS} could be used!")
 
+def get_materials_from_rows(concrete, reinforcement):
+    if reinforcement is None or concrete is None:
+        return None
 
-def filter_data_for_section(data: dict, section: int):
-    is_section_valid(section)
+    return Materials(R_s=float(reinforcement.R_s / 10),
+                     R_sc=float(reinforcement.R_sc_sh / 10),
+                     R_b=float(concrete.R_b / 10),
+                     alpha_R=float(reinforcement.alpha_R))
 
-    filtered_data = dict()
-    filtered_data["R_s"] = data["R_s"]
-    filtered_data["R_sc"] = data["R_sc"]
-    filtered_data["alpha_R"] = data["alpha_R"]
-    filtered_data["R_b"] = data["R_b"]
-    filtered_data["h_0"] = data[f"h_0_{section}"]
-    filtered_data["h_f"] = data[f"h_f"]
-    filtered_data["a_sc"] = data[f"a_sc_{section}"]
-    filtered_data["A_sc"] = data[f"A_sc_{section}"]
 
-    if section == 1:
-        filtered_data["M"] = data["M_1_bot"]
-        filtered_data["b"] = data["b_w"]
-    else:
-        filtered_data["M"] = data[f"M_{section}_top"]
-        filtered_data["b"] = data["b_f"]
-
-    return filtered_data
+def get_section_loads(student_context: StudentContext, section: int):
+    """ Moment, effective depth and compressed reinforcement of the section (None, if there is no data) """
+    return student_context.get_calculation_data(("loads", section),
+                                                lambda: build_section_loads(student_context, section))
 
 
-def calculate_alpha_m(filtered_data: dict):
-    d = filtered_data
-    return (d["M"] - d["R_sc"] * d["A_sc"] * (d["h_0"] - d["a_sc"])) / (d["R_b"] * d["b"] * d["h_0"] ** 2)
+def build_section_loads(student_context: StudentContext, section: int):
+    return get_section_loads_from_rows(student_context.get_row(MomentsForces),
+                                       student_context.get_row(InitialReinforcement), section)
 
 
-def calculate_reinforcement_area(filtered_data: dict, alpha_m: float):
-    d = filtered_data
-
-    if alpha_m > 0:
-        return d["R_b"] * d["b"] * d["h_0"] * (1 - (1 - 2 * alpha_m) ** 0.5) / d["R_s"] + \
-               d["A_sc"] * d["R_sc"] / d["R_s"]
-    else:
-        return d["M"] / (d["R_s"] * (d["h_0"] - d["a_sc"]))
+def get_section_loads_from_rows(moments_forces: MomentsForces, initial_reinforcement: InitialReinforcement,
+                                section: int):
+    if moments_forces is None or initial_reinforcement is None:
+        return None
 
+    moment_field, effective_depth_field, area_field, distance_field = SECTIONS_FIELDS[section]
+    return (float(getattr(moments_forces, moment_field)),
+            float(getattr(initial_reinforcement, effective_depth_field)),
+            BarsLayer(A=float(getattr(initial_reinforcement, area_field)),
+                      a=float(getattr(initial_reinforcement, distance_field))))
 
-def calculate_section_moment_full_flange_compressed(filtered_data: dict):
-    d = filtered_data
-    return d["R_b"] * d["b"] * d["h_f"] * (d["h_0"] - d["h_f"] / 2) + \
-           d["R_sc"] * d["A_sc"] * (d["h_0"] - d["a_sc"])
-
-
-def calculate_reinforcement(student: Student, section: int):
-    is_section_valid(section)
-
-    if section == 1:
-        model = CalculatedReinforcementMiddleProgram
-        postfix = "_middle"
-    elif section == 2:
-        model = CalculatedReinforcementLeftProgram
-        postfix = "_left"
-    else:
-        model = CalculatedReinforcementRightProgram
-        postfix = "_right"
 
+def get_program_answers(result: ReinforcementResult, section: int, postfix: str):
     defaults = dict()
-
-    student_id = student.pk
-    data = get_data_for_reinforcement_calculation(student_id)
-
-    if is_data_for_calculations(data):
-        filtered_data = filter_data_for_section(data, section)
-
-        # special values for sections 2 and 3
-        if section != 1:
-            defaults["fully_compressed_flange_moment" + postfix] = \
-                calculate_section_moment_full_flange_compressed(filtered_data)
-            # is neutral axis in flange
-            if defaults["fully_compressed_flange_moment" + postfix] > filtered_data["M"]:
-                defaults["is_neutral_axis_in_flange" + postfix] = True
-            else:
-                defaults["is_neutral_axis_in_flange" + postfix] = False
-            # section width for calculations
-            if defaults["is_neutral_axis_in_flange" + postfix]:
-                defaults["section_widths_for_calculation" + postfix] = filtered_data["b"]
-                defaults["overhanging_flange_area" + postfix] = 0
-            else:
-                raise ValueError(f"Case M_f < M is not implemented!")
-
-        # common values (for sections 2 and 3 for case when M < M_f only!)
-        defaults["alpha_m" + postfix] = calculate_alpha_m(filtered_data)
-        if defaults["alpha_m" + postfix] <= filtered_data["alpha_R"]:
-            defaults["is_compressed_zone_capacity_sufficient" + postfix] = True
-        else:
-            raise ValueError(f"Case alpha_m > alpha_R is not implemented!")
-
-        defaults["reinforcement_area" + postfix] = calculate_reinforcement_area(filtered_data,
-                                                                                defaults["alpha_m" + postfix])
-
-        model.objects.update_or_create(student=student,
-                                       defaults={**defaults}
-                                       )
+    if section != 1:
+        defaults["fully_compressed_flange_moment" + postfix] = result.fully_compressed_flange_moment
+        defaults["is_neutral_axis_in_flange" + postfix] = result.is_neutral_axis_in_flange
+        defaults["section_widths_for_calculation" + postfix] = result.section_widths_for_calculation
+        defaults["overhanging_flange_area" + postfix] = result.overhanging_flange_area
+    defaults["alpha_m" + postfix] = result.alpha_m
+    defaults["is_compressed_zone_capacity_sufficient" + postfix] = result.is_compressed_zone_capacity_sufficient
+    defaults["reinforcement_area" + postfix] = result.reinforcement_area
+    return defaults
+
+
+def get_empty_program_answers(section: int, postfix: str):
+    """ Program answers, when there is not enough data for calculations """
+    defaults = dict()
+    if section != 1:
+        defaults["fully_compressed_flange_moment" + postfix] = -1
+        defaults["is_neutral_axis_in_flange" + postfix] = False
+        defaults["section_widths_for_calculation" + postfix] = -1
+        defaults["overhanging_flange_area" + postfix] = -1
+    defaults["alpha_m" + postfix] = -1
+    defaults["is_compressed_zone_capacity_sufficient" + postfix] = False
+    defaults["reinforcement_area" + postfix] = -1
+    return defaults
+
+
+def is_fingerprint_saved(student_context: StudentContext, program_answers_model, fingerprint: str):
+    """ Program answers were calculated from the same inputs, so calculation and saving could be skipped """
+    program_answers = student_context.get_row(program_answers_model)
+    is_saved = program_answers is not None and program_answers.inputs_fingerprint == fingerprint
+    count_event("Program-Answers-Hits" if is_saved else "Program-Answers-Misses")
+    return is_saved
+
+
+def calculate_reinforcement(student_context: StudentContext, section: int):
+    kernel.is_section_valid(section)
+    model, postfix = PROGRAM_MODELS[section]
+
+    materials = get_materials_properties(student_context)
+    geometry = get_section_geometry(student_context)
+    loads = get_section_loads(student_context, section)
+
+    fingerprint = kernel.get_inputs_fingerprint(section, materials, geometry, loads)
+    if is_fingerprint_saved(student_context, model, fingerprint):
+        return
+
+    if None not in (materials, geometry, loads):
+        M, h_0, compressed = loads
+        result = kernel.calculate_reinforcement(materials, geometry, section, M, h_0, compressed)
+        defaults = get_program_answers(result, section, postfix)
     else:
-        if section == 1:
-            defaults["alpha_m" + postfix] = -1
-            defaults["is_compressed_zone_capacity_sufficient" + postfix] = False
-            defaults["reinforcement_area" + postfix] = -1
-        else:
-            defaults["fully_compressed_flange_moment" + postfix] = -1
-            defaults["is_neutral_axis_in_flange" + postfix] = False
-            defaults["section_widths_for_calculation" + postfix] = -1
-            defaults["overhanging_flange_area" + postfix] = -1
-            defaults["alpha_m" + postfix] = -1
-            defaults["is_compressed_zone_capacity_sufficient" + postfix] = False
-            defaults["reinforcement_area" + postfix] = -1
-
-        model.objects.update_or_create(student=student,
-                                       defaults={**defaults}
-                                       )
+        defaults = get_empty_program_answers(section, postfix)
+
+    student_context.save_row(model, {**defaults, "inputs_fingerprint": fingerprint})
@@ -0,0 +1,188 @@
+import numpy as np
+from autograder.models import Student, Concrete, Reinforcement
+from . import reference_cache
+from . import calculation_kernel as kernel
+from .student_context import get_variants_info, bulk_upsert
+from .reiforcement_calculation import (PROGRAM_MODELS, get_empty_program_answers,
+                                       get_section_geometry_from_row, get_materials_from_rows,
+                                       get_section_loads_from_rows)
+
+SECTIONS = (1, 2, 3)
+
+# student's rows with input data (reverse OneToOne accessors)
+INPUT_ROWS = ("girdergeometry", "momentsforces", "initialreinforcement")
+
+
+def get_materials(student: Student, variants_info: dict):
+    """ Concrete and reinforcement of the student's girder; None, if there is no variant info
+    (StudentContext raises VariantInfo.DoesNotExist then) """
+    variant_info = variants_info.get((student.group_id, student.subgroup_variant_number))
+    if variant_info is None:
+        return None
+    concrete = reference_cache.get_table(Concrete).get(variant_info.girder_concrete_id)
+    reinforcement = reference_cache.get_table(Reinforcement).get(variant_info.girder_reinforcement_id)
+    return concrete, reinforcement
+
+
+def get_student_calculation_data(student: Student, variants_info: dict):
+    """ Materials, geometry and loads of the sections, which are built by reiforcement_calculation
+    (so fingerprints are the same), or None, if the student is skipped by it """
+    materials_rows = get_materials(student, variants_info)
+    if materials_rows is None:
+        return None
+    girder_geometry, moments_forces, initial_reinforcement = (getattr(student, accessor, None)
+                                                              for accessor in INPUT_ROWS)
+    return (get_materials_from_rows(*materials_rows), get_section_geometry_from_row(girder_geometry),
+            [get_section_loads_from_rows(moments_forces, initial_reinforcement, section) for section in SECTIONS])
+
+
+def get_student_inputs(materials, geometry, sections_loads: list):
+    """ Input values of one student or None, if some data is missing """
+    if materials is None or geometry is None or None in sections_loads:
+        return None
+
+    return {
+        "R_s": materials.R_s,
+        "R_sc": materials.R_sc,
+        "alpha_R": materials.alpha_R,
+        "R_b": materials.R_b,
+        "h_f": geometry.h_f,
+        # sections 1, 2, 3
+        "b": [geometry.b_w, geometry.b_f, geometry.b_f],
+        "M": [M for M, h_0, compressed in sections_loads],
+        "h_0": [h_0 for M, h_0, compressed in sections_loads],
+        "A_sc": [compressed.A for M, h_0, compressed in sections_loads],
+        "a_sc": [compressed.a for M, h_0, compressed in sections_loads],
+    }
+
+
+def get_cohort_inputs(students):
+    """ Arrays of input data for N students: materials and flange height have shape (N,),
+    section values have shape (N, 3). Students without data get zeros and False in "has_data" mask,
+    students without variant info are skipped ("is_skipped" mask); "fingerprints" are inputs fingerprints
+    of the sections (list of N lists) """
+    students = list(students)
+    variants_info = get_variants_info(students)
+
+    calculation_data = [get_student_calculation_data(student, variants_info) for student in students]
+    students_inputs = [get_student_inputs(*data) if data is not None else None for data in calculation_data]
+    inputs = {"student_id": np.array([student.pk for student in students]),
+              "has_data": np.array([student_inputs is not None for student_inputs in students_inputs], dtype=bool),
+              "is_skipped": np.array([data is None for data in calculation_data], dtype=bool),
+              "fingerprints": [[kernel.get_inputs_fingerprint(section, data[0], data[1], data[2][section - 1])
+                                for section in SECTIONS] if data is not None else None
+                               for data in calculation_data]}
+
+    for key in ("R_s", "R_sc", "alpha_R", "R_b", "h_f"):
+        inputs[key] = np.array([student_inputs[key] if student_inputs is not None else 0.0
+                                for student_inputs in students_inputs], dtype=float)
+    for key in ("b", "h_0", "a_sc", "A_sc", "M"):
+        inputs[key] = np.array([student_inputs[key] if student_inputs is not None else [0.0] * len(SECTIONS)
+                                for student_inputs in students_inputs], dtype=float).reshape(-1, len(SECTIONS))
+    return inputs
+
+
+def calculate_reinforcement_batch(inputs: dict):
+    """ The same calculations as reiforcement_calculation.calculate_reinforcement for N students x 3 sections
+    in one pass. Cases, which are not implemented there (and raise ValueError), are reported as masks """
+    has_data = inputs["has_data"][:, np.newaxis]
+    # materials and flange height are the same for all sections of the student
+    R_s, R_sc, alpha_R, R_b, h_f = (inputs[key][:, np.newaxis] for key in ("R_s", "R_sc", "alpha_R", "R_b", "h_f"))
+    b, h_0, a_sc, A_sc, M = (inputs[key] for key in ("b", "h_0", "a_sc", "A_sc", "M"))
+
+    with np.errstate(divide="ignore", invalid="ignore"):  # students without data give zeros
+        fully_compressed_flange_moment = R_b * b * h_f * (h_0 - h_f / 2) + R_sc * A_sc * (h_0 - a_sc)
+        alpha_m = (M - R_sc * A_sc * (h_0 - a_sc)) / (R_b * b * h_0 ** 2)
+        reinforcement_area = np.where(alpha_m > 0,
+                                      R_b * b * h_0 * (1 - (1 - 2 * alpha_m) ** 0.5) / R_s + A_sc * R_sc / R_s,
+                                      M / (R_s * (h_0 - a_sc)))
+
+    is_support_section = np.arange(len(SECTIONS)) > 0  # sections 2 and 3 have flange in compression zone
+    is_neutral_axis_in_flange = fully_compressed_flange_moment > M
+
+    return {
+        "fully_compressed_flange_moment": fully_compressed_flange_moment,
+        "is_neutral_axis_in_flange": is_neutral_axis_in_flange,
+        "alpha_m": alpha_m,
+        "is_compressed_zone_capacity_sufficient": alpha_m <= alpha_R,
+        "reinforcement_area": reinforcement_area,
+        # cases M_f < M and alpha_m > alpha_R are not implemented
+        "flange_not_implemented": has_data & is_support_section & ~is_neutral_axis_in_flange,
+        "capacity_not_implemented": has_data & (alpha_m > alpha_R),
+    }
+
+
+def get_not_implemented(inputs: dict, results: dict):
+    """ Mask (N, 3) of sections, which could not be calculated """
+    return results["flange_not_implemented"] | results["capacity_not_implemented"]
+
+
+def get_not_calculated(inputs: dict, results: dict):
+    """ Mask (N, 3) of sections without program answers: not implemented cases and skipped students """
+    return get_not_implemented(inputs, results) | inputs["is_skipped"][:, np.newaxis]
+
+
+def get_program_rows(inputs: dict, results: dict, section: int):
+    """ Program answers for the section, the same as from reiforcement_calculation.calculate_reinforcement
+    (with -1 for students without data); skipped students and not implemented cases get no rows """
+    model, postfix = PROGRAM_MODELS[section]
+    column = section - 1
+    not_calculated = get_not_calculated(inputs, results)[:, column]
+
+    rows = list()
+    for number, student_id in enumerate(inputs["student_id"].tolist()):
+        if not_calculated[number]:
+            continue
+
+        if inputs["has_data"][number]:
+            values = dict()
+            if section != 1:
+                values["fully_compressed_flange_moment"] = float(results["fully_compressed_flange_moment"][number,
+                                                                                                            column])
+                values["is_neutral_axis_in_flange"] = True
+                values["section_widths_for_calculation"] = float(inputs["b"][number, column])
+                values["overhanging_flange_area"] = 0
+            values["alpha_m"] = float(results["alpha_m"][number, column])
+            values["is_compressed_zone_capacity_sufficient"] = True
+            values["reinforcement_area"] = float(results["reinforcement_area"][number, column])
+            defaults = {key + postfix: value for key, value in values.items()}
+        else:
+            defaults = get_empty_program_answers(section, postfix)
+
+        rows.append(model(student_id=student_id, inputs_fingerprint=inputs["fingerprints"][number][column],
+                          **defaults))
+    return rows
+
+
+def save_program_rows(rows: list, section: int):
+    model = PROGRAM_MODELS[section][0]
+    bulk_upsert(model, rows)
+
+
+def get_students_program_rows(students: list):
+    """ Program answers of the students (list of Student with INPUT_ROWS) calculated in one pass:
+    section -> rows aligned with the students (None if the calculation fails) and section -> flags
+    of failed calculations (reiforcement_calculation raises errors for them) """
+    inputs = get_cohort_inputs(students)
+    results = calculate_reinforcement_batch(inputs)
+    not_calculated = get_not_calculated(inputs, results)
+
+    students_rows = dict()
+    students_failed = dict()
+    for section in SECTIONS:
+        rows = iter(get_program_rows(inputs, results, section))
+        students_failed[section] = not_calculated[:, section - 1].tolist()
+        students_rows[section] = [None if is_failed else next(rows) for is_failed in students_failed[section]]
+    return students_rows, students_failed
+
+
+def calculate_reinforcement_for_students(students):
+    """ Calculates program answers for all sections of given students (queryset or list of Student)
+    and saves them. Returns inputs, results and mask (N, 3) of the sections, which were not calculated """
+    students = students.select_related(*INPUT_ROWS) if hasattr(students, "select_related") else students
+    inputs = get_cohort_inputs(students)
+    results = calculate_reinforcement_batch(inputs)
+
+    for section in SECTIONS:
+        save_program_rows(get_program_rows(inputs, results, section), section)
+    return inputs, results, get_not_calculated(inputs, results)
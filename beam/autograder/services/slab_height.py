@@ -1,19 +1,13 @@
-from autograder.models import (PersonalVariantsCivilEngineers, PersonalVariantsArchitects,
-                               Student, Group, SlabHeight,)
+from autograder.models import PersonalVariantsCivilEngineers, SlabHeight
+from .student_context import StudentContext
+from . import reference_cache
 
 
-def get_slab(student: Student, group_name: str):
-    student_group_name = group_name
-    student_group_id = student.group.pk
-    student_subgroup_variant_number = student.subgroup_variant_number
-    student_personal_variant_number = student.personal_variant_number
-
-    if "ПГС" in student_group_name:
-        student_personal_variant = PersonalVariantsCivilEngineers.objects.filter(personal_variant=
-                                                                             student_personal_variant_number).first()
-    else:
-        student_personal_variant = PersonalVariantsArchitects.objects.filter(personal_variant=
-                                                                             student_personal_variant_number).first()
+def get_slab_key(student_context: StudentContext):
+    """ Group, subgroup variant and personal variant of the student, who designs the slab
+    for the girder of given student (None, if there is no personal variant with such slab) """
+    student = student_context.student
+    student_personal_variant = student_context.personal_variant
 
     girder_name = student_personal_variant.girder
 
@@ -22,11 +16,25 @@ def get_slab(student: Student, group_name: str):
     else:
         slab_floor = "РЭ"
 
-    slab_personal_variant = PersonalVariantsCivilEngineers.objects.filter(slab__contains=slab_floor).first()
+    slab_personal_variant = next((personal_variant for personal_variant in
+                                  reference_cache.get_table(PersonalVariantsCivilEngineers).all()
+                                  if slab_floor in personal_variant.slab), None)
+    if slab_personal_variant is None:
+        return None
     slab_personal_variant_number = slab_personal_variant.personal_variant
 
-    slab_student_id = Student.objects.filter(group__id=student_group_id,
-                                             subgroup_variant_number=student_subgroup_variant_number,
-                                             personal_variant_number=slab_personal_variant_number).first().pk
-
-    return SlabHeight.objects.get(student_id=slab_student_id)
+    # slab is designed by the student from the same subgroup, who has the slab on the same floor as the girder
+    return student.group_id, student.subgroup_variant_number, slab_personal_variant_number
+
+
+def get_slab(student_context: StudentContext):
+    """ SlabHeight of the student, who designs the slab (None, if the slab is not known yet) """
+    slab_key = get_slab_key(student_context)
+    if slab_key is None:
+        return None
+    group_id, subgroup_variant_number, personal_variant_number = slab_key
+    # several students could have the same variants, the first one designs the slab
+    return SlabHeight.objects.filter(student__group_id=group_id,
+                                     student__subgroup_variant_number=subgroup_variant_number,
+                                     student__personal_variant_number=personal_variant_number
+                                     ).order_by("student_id").first()
@@ -0,0 +1,227 @@
+from collections import defaultdict
+from decimal import Decimal
+from functools import cached_property
+from django.db import transaction
+from django.db.models import Model, DecimalField
+from autograder.models import (Student, VariantInfo, Concrete, Reinforcement,
+                               PersonalVariantsCivilEngineers, PersonalVariantsArchitects)
+from . import reference_cache, cohort_statistics
+
+# rows, which are needed to grade answers; they are loaded with a separate query
+GRADING_MODELS_SUFFIXES = ("Program", "Statistics", "AnswerKey")
+
+
+def get_student_relations():
+    """ Reverse OneToOne relations of Student (answers, program answers, statistics, opened forms...) """
+    return [relation for relation in Student._meta.related_objects if relation.one_to_one]
+
+
+def is_grading_model(db_model):
+    return db_model.__name__.endswith(GRADING_MODELS_SUFFIXES)
+
+
+def get_rows_relations(grading: bool):
+    return [relation for relation in get_student_relations() if is_grading_model(relation.related_model) == grading]
+
+
+def get_accessors(relations: list):
+    return [relation.get_accessor_name() for relation in relations]
+
+
+def get_variants_info(students: list):
+    """ (group id, variant number) -> VariantInfo for all groups of the students with one query """
+    return {(variant_info.group_id, variant_info.variant_number): variant_info
+            for variant_info in VariantInfo.objects.filter(group_id__in={student.group_id for student in students})}
+
+
+def get_field_values(row: Model):
+    """ Values of the row's fields (empty dict, if there is no row) """
+    if row is None:
+        return dict()
+    return {field.attname: field.value_from_object(row) for field in row._meta.concrete_fields}
+
+
+def set_field_values(row: Model, values: dict):
+    """ Restores values of the row's fields, which are taken by get_field_values """
+    for field_name, value in values.items():
+        setattr(row, field_name, value)
+
+
+def bulk_upsert(model, rows: list):
+    """ Inserts or updates rows (one per student) of students with one query """
+    # Django 4.1 puts names of the fields into SQL as they are, so column names (attnames) are used
+    update_fields = [field.attname for field in model._meta.concrete_fields if field.name not in ("id", "student")]
+    model.objects.bulk_create(rows, update_conflicts=True, unique_fields=["student_id"], update_fields=update_fields)
+
+
+def save_students_deferred_rows(students_contexts: list):
+    """ Saves the rows, which were deferred by save_row, of the students with one INSERT ... ON CONFLICT
+    per table and updates counters of their groups' statistics with them in one transaction """
+    rows = defaultdict(list)  # model -> rows of all students
+    for student_context in students_contexts:
+        for db_model, row in student_context.deferred_rows.items():
+            rows[db_model].append(row)
+
+    if rows:
+        statistics_rows = {db_model: model_rows for db_model, model_rows in rows.items()
+                           if cohort_statistics.is_statistics_model(db_model)}
+        students_groups = {student_context.student_id: student_context.student.group_id
+                           for student_context in students_contexts if student_context.deferred_rows}
+        with transaction.atomic():
+            # deltas are counted from the saved statistics, which are replaced, not from the loaded ones
+            deltas = cohort_statistics.get_deltas(students_groups, statistics_rows) if statistics_rows else dict()
+            for db_model, model_rows in rows.items():
+                bulk_upsert(db_model, model_rows)
+            cohort_statistics.save_deltas(deltas)
+    for student_context in students_contexts:
+        student_context.discard_deferred_rows()
+
+
+def round_decimal_fields(row: Model):
+    """ Values of DecimalFields are rounded by DB on save, but stay unrounded in saved instance """
+    for field in row._meta.concrete_fields:
+        if isinstance(field, DecimalField):
+            value = getattr(row, field.attname)
+            if value is not None:
+                value = field.to_python(value).quantize(Decimal(1).scaleb(-field.decimal_places))
+                setattr(row, field.attname, value)
+
+
+class StudentContext:
+    """ Student's data, which is needed by almost every view and service: Student, Group, VariantInfo
+    and personal variant. Everything is resolved once (with select_related or from reference cache)
+    and reused for the rest of the request """
+
+    def __init__(self, student: Student, defer_writes: bool = False):
+        self.student = student
+        self.rows = dict()  # model -> student's row (None if there is no row yet)
+        self.defer_writes = defer_writes  # save_row doesn't save rows, they are saved later with other students'
+        self.deferred_rows = dict()  # model -> row, which is to be saved
+        self.calculation_data = dict()  # inputs of calculations, see get_calculation_data
+        self.changed_fields = dict()  # answers model -> names of the fields, which were changed by submission
+
+    @classmethod
+    def from_user_name(cls, user_name: str):
+        """ Student's answers are loaded in the same query """
+        relations = get_rows_relations(grading=False)
+        student = Student.objects.select_related("user", "group", *get_accessors(relations)).get(
+            user__username=user_name)
+        student_context = cls(student)
+        student_context.set_loaded_rows(student, relations)
+        return student_context
+
+    @classmethod
+    async def afrom_user_name(cls, user_name: str):
+        """ The same as from_user_name with async ORM """
+        relations = get_rows_relations(grading=False)
+        student = await Student.objects.select_related("user", "group", *get_accessors(relations)).aget(
+            user__username=user_name)
+        student_context = cls(student)
+        student_context.set_loaded_rows(student, relations)
+        return student_context
+
+    @property
+    def student_id(self):
+        return self.student.pk
+
+    @property
+    def group(self):
+        return self.student.group
+
+    @property
+    def group_name(self):
+        return self.group.group_name
+
+    def is_civil_engineer(self):
+        return "ПГС" in self.group_name
+
+    @cached_property
+    def variant_info(self):
+        return VariantInfo.objects.get(group_id=self.student.group_id,
+                                       variant_number=self.student.subgroup_variant_number)
+
+    @cached_property
+    def personal_variant(self):
+        if self.is_civil_engineer():
+            personal_variants_model = PersonalVariantsCivilEngineers
+        else:
+            personal_variants_model = PersonalVariantsArchitects
+        return reference_cache.get_table(personal_variants_model).get_by_natural_key(
+            self.student.personal_variant_number)
+
+    @property
+    def girder_concrete(self):
+        return reference_cache.get_table(Concrete).get(self.variant_info.girder_concrete_id)
+
+    @property
+    def girder_reinforcement(self):
+        return reference_cache.get_table(Reinforcement).get(self.variant_info.girder_reinforcement_id)
+
+    def load_rows(self, grading: bool):
+        """ Loads all student's rows of one kind (answers or program answers & statistics)
+        in a single query with reverse select_related """
+        relations = get_rows_relations(grading)
+        student = Student.objects.select_related(*get_accessors(relations)).get(pk=self.student_id)
+        self.set_loaded_rows(student, relations)
+
+    async def aload_rows(self, grading: bool):
+        """ The same as load_rows with async ORM """
+        relations = get_rows_relations(grading)
+        student = await Student.objects.select_related(*get_accessors(relations)).aget(pk=self.student_id)
+        self.set_loaded_rows(student, relations)
+
+    def set_loaded_rows(self, student: Student, relations: list):
+        for relation, accessor in zip(relations, get_accessors(relations)):
+            self.rows[relation.related_model] = getattr(student, accessor, None)
+
+    def get_row(self, db_model):
+        if db_model not in self.rows:
+            self.load_rows(grading=is_grading_model(db_model))
+        return self.rows[db_model]
+
+    def set_row(self, row: Model):
+        """ Keeps loaded rows up to date after the row is saved """
+        round_decimal_fields(row)
+        self.rows[type(row)] = row
+        if not is_grading_model(type(row)):  # student's answers are changed
+            self.calculation_data.clear()
+
+    def set_changed_row(self, row: Model, previous_values: dict):
+        """ Like set_row for student's answers, also remembers which fields got new values """
+        self.set_row(row)
+        changed_fields = {name for name, value in get_field_values(row).items()
+                          if name not in previous_values or previous_values[name] != value}
+        self.changed_fields.setdefault(type(row), set()).update(changed_fields)
+
+    def save_row(self, db_model, values: dict):
+        """ Updates student's row with given values or creates it (like update_or_create, but
+        the row, which is loaded already, is not selected again) """
+        row = self.get_row(db_model)
+        if self.defer_writes:
+            row = row if row is not None else db_model(student=self.student)
+            for field_name, value in values.items():
+                setattr(row, field_name, value)
+            self.deferred_rows[db_model] = row
+        elif row is None or row.pk is None:  # primary key is not returned by bulk_upsert
+            row, created = db_model.objects.update_or_create(student=self.student, defaults=values)
+        else:
+            for field_name, value in values.items():
+                setattr(row, field_name, value)
+            row.save(update_fields=list(values.keys()))
+        self.set_row(row)
+        return row
+
+    def save_deferred_rows(self):
+        """ Saves the rows, which were deferred by save_row, with one INSERT ... ON CONFLICT per table
+        in one transaction """
+        save_students_deferred_rows([self])
+
+    def discard_deferred_rows(self):
+        self.deferred_rows = dict()
+
+    def get_calculation_data(self, key, build_data):
+        """ Inputs of calculations (materials, geometry, loads...) are built once and shared by all
+        calculations of the validation cascade; they are built again after student's answers are changed """
+        if key not in self.calculation_data:
+            self.calculation_data[key] = build_data()
+        return self.calculation_data[key]
@@ -1,179 +1,229 @@
-from autograder.models import VariantInfo, Student
-from django.forms.models import model_to_dict
-from . import reiforcement_calculation, bearing_capacity
-
-
-def validate_answers(student: Student, opened_models_dict: dict, button_name: str):
+import functools
+from dataclasses import dataclass
+from typing import Optional
+import numpy as np
+from autograder.models import StudentAnswerKey
+from .dependency_graph import CHECKS, get_changed_checks
+from .student_context import StudentContext
+
+
+# forms, which are graded with the variant's materials (or with the answer key, when it is calculated
+# for student) -> StudentContext property with the material
+MATERIALS_SOURCES = {"Concrete": "girder_concrete", "Reinforcement": "girder_reinforcement"}
+MATERIALS_COEFFICIENTS = ("alpha_R", "xi_R")
+
+
+def get_changed_fields(student_context: StudentContext, opened_models_dict: dict, submitted_forms_names: list):
+    """ Answers model -> changed fields; all fields are taken as changed, if the form was saved
+    without StudentContext.set_changed_row """
+    changed_fields = dict(student_context.changed_fields)
+    for form_name in submitted_forms_names:
+        answers_model = opened_models_dict[form_name][0]
+        if answers_model not in changed_fields:
+            changed_fields[answers_model] = {field.attname for field in answers_model._meta.concrete_fields}
+    return changed_fields
+
+
+def get_affected_forms_names(student_context: StudentContext, models_dict: dict, submitted_forms_names: list,
+                             changed_fields: dict):
+    """ Submitted forms and the forms, whose calculations read changed fields of the answers,
+    in the order of models_dict (program answers of the next forms depend on the previous ones) """
+    affected_forms_names = set(submitted_forms_names)
+    for name in get_changed_checks(changed_fields):
+        if name in models_dict.keys():  # is the form opened for student
+            if student_context.get_row(models_dict[name][0]) is not None:  # answer is there
+                affected_forms_names.add(name)
+
+    return [name for name in models_dict.keys() if name in affected_forms_names]
+
+
+def validate_forms_answers(student_context: StudentContext, opened_models_dict: dict, forms_names: list):
+    """ Grades answers of the submitted forms and runs the dependency cascade once for all of them;
+    program answers and statistics are saved together at the end of the cascade (unless writes
+    of the context are deferred by its owner already) """
+    if student_context.defer_writes:
+        grade_forms_answers(student_context, opened_models_dict, forms_names)
+        return
+
+    student_context.defer_writes = True
+    try:
+        grade_forms_answers(student_context, opened_models_dict, forms_names)
+    finally:
+        student_context.defer_writes = False
+    student_context.save_deferred_rows()
+
+
+def get_graded_forms_names(student_context: StudentContext, opened_models_dict: dict, forms_names: list):
+    """ Submitted forms and the forms affected by changed answers, which have statistics, in the order
+    of opened_models_dict; changed fields of the context are taken into account once """
     models_dict = dict()
-    button_names = list()
-
-    button_names.append(button_name)
 
     for model_name, models_list in opened_models_dict.items():
         if len(models_list) > 2:  # there are models for statistics
             models_dict[model_name] = models_list
 
-    student_id = student.pk
-    group_id = student.group
-    revalidate_reinforcement_list = ["CalculatedReinforcementMiddle", "CalculatedReinforcementLeft",
-                                     "CalculatedReinforcementRight"]
-    revalidate_capacity_list = ["BearingCapacityMiddleBot", "BearingCapacityLeftBot", "BearingCapacityRightBot",
-                                "BearingCapacityMiddleTop", "BearingCapacityLeftTop", "BearingCapacityRightTop"]
-
-    if "InitialReinforcement" in button_name or "GirderGeometry" in button_name:
-        for name in revalidate_reinforcement_list:
-            if name in models_dict.keys():  # do we have CalculatedReinforcement... models opened for student
-                if models_dict[name][0].objects.filter(student_id=student_id).first() is not None:  # answer is there
-                    button_names.append(name)  # revalidate reinforcement calculations
-
-    if "InitialReinforcement" in button_name or "GirderGeometry" in button_name or\
-            "CalculatedReinforcement" in button_name:
-        for name in revalidate_capacity_list:
-            if name in models_dict.keys():  # do we have BearingCapacity... models opened for student
-                if models_dict[name][0].objects.filter(student_id=student_id).first() is not None:  # answer is there
-                    button_names.append(name)  # revalidate bearing capacity calculations
-
-    for button_name in button_names:
-        if button_name in models_dict.keys():  # work with models that allow validation
-            student_subgroup_variant = student.subgroup_variant_number
-            student_personal_variant = student.personal_variant_number
-            student_variant_data = VariantInfo.objects.get(variant_number=student_subgroup_variant, group_id=group_id)
-
-            program_answers_model = models_dict[button_name][2]
-            student_answers_model = models_dict[button_name][0]
-            statistics_model = models_dict[button_name][3]
-
-            if "CalculatedReinforcementMiddle" in button_name:
-                reiforcement_calculation.calculate_reinforcement(student=student, section=1)
-            elif "CalculatedReinforcementLeft" in button_name:
-                reiforcement_calculation.calculate_reinforcement(student=student, section=2)
-            elif "CalculatedReinforcementRight" in button_name:
-                reiforcement_calculation.calculate_reinforcement(student=student, section=3)
-
-            if "BearingCapacity" in button_name:
-                if "Bot" in button_name:  # bot surface in tension
-                    bearing_capacity.calculate_bearing_capacity(student, surface="bot")
-                else:
-                    bearing_capacity.calculate_bearing_capacity(student, surface="top")
-
-            student_answer = student_answers_model.objects.get(student_id=student_id)
-
-            student_exclude = ["id", "student"]
-            if button_name == "Concrete":
-                program_exclude = ["id"]
-                student_material_id = student_variant_data.girder_concrete_id
-                program_answer = program_answers_model.objects.get(pk=student_material_id)
-            elif button_name == "Reinforcement":
-                program_exclude = ["id", "possible_diameters"]
-                student_material_id = student_variant_data.girder_reinforcement_id
-                program_answer = program_answers_model.objects.get(pk=student_material_id)
-            else:
-                program_exclude = ["id", "student"]
-                program_answer = program_answers_model.objects.get(student_id=student_id)
-
-            student_answers_dict = model_to_dict(student_answer, exclude=student_exclude)
-            program_answers_dict = model_to_dict(program_answer, exclude=program_exclude)
-
-            statistics = dict()
-
-            if button_name == "Concrete" or button_name == "Reinforcement":
-                statistics = validate_concrete_and_reinforcement(program_answers=program_answers_dict,
-                                                                 student_answers=student_answers_dict,
-                                                                 program_answer_id=program_answer.id)
-            else:
-                special_keys = list()
-                for key in student_answers_dict.keys():  # for fields, that contain True / False
-                    if str(key).startswith("is_"):
-                        special_keys.append(key)
-
-                if special_keys:
-                    statistics = strict_match_validation(program_answers=
-                                                         get_dict_for_special_validation(program_answers_dict,
-                                                                                         special_keys),
-                                                         student_answers=
-                                                         get_dict_for_special_validation(student_answers_dict,
-                                                                                         special_keys))
-
-                statistics.update(tolerant_match_validation(program_answers=program_answers_dict,
-                                                            student_answers=student_answers_dict,
-                                                            tolerance=0.01)
-                                  )
-            statistics_model.objects.update_or_create(student_id=student_id,
-                                                      defaults={**statistics}
-                                                      )
-
-
-def get_dict_for_special_validation(answers: dict, special_keys: list):
-    special_answers = dict()
-
-    for key in special_keys:
-        if answers.get(key) is not None:
-            special_answers[key] = answers.pop(key)
-
-    return special_answers
+    changed_fields = get_changed_fields(student_context, opened_models_dict, forms_names)
+    student_context.changed_fields.clear()
+    return [name for name in get_affected_forms_names(student_context, models_dict, forms_names, changed_fields)
+            if name in models_dict.keys()]  # work with models that allow validation
+
+
+def grade_forms_answers(student_context: StudentContext, opened_models_dict: dict, forms_names: list):
+    for button_name in get_graded_forms_names(student_context, opened_models_dict, forms_names):
+        if button_name in CHECKS:
+            CHECKS[button_name].calculate(student_context)
+        grade_form_answers(student_context, button_name, opened_models_dict[button_name])
+
+
+def grade_form_answers(student_context: StudentContext, button_name: str, models: list):
+    """ Grades answers of the form with its program answers (which are calculated already)
+    or with the answer key """
+    student_answers_model, _, program_answers_model, statistics_model = models
+
+    grading_spec = get_grading_spec(button_name, student_answers_model)
+    answer_key = student_context.get_row(StudentAnswerKey) if grading_spec.answer_key_fields else None
+    if answer_key is not None:  # answers are calculated beforehand, see "program_answers" command
+        statistics = grade_answers(student_context.get_row(student_answers_model), answer_key,
+                                   grading_spec.answer_key_fields)
+    else:
+        statistics = grade_answers(student_context.get_row(student_answers_model),
+                                   get_program_answer(student_context, grading_spec, program_answers_model),
+                                   grading_spec.fields)
+    student_context.save_row(statistics_model, statistics)
+
+
+@dataclass(frozen=True, slots=True)
+class FieldSpec:
+    """ How the field of student's answers is compared with program answer """
+    name: str  # field of student's answers and of statistics
+    attname: str  # attribute of student's answers
+    program_attname: Optional[str]  # attribute of program answer (None for its primary key)
+    tolerance: Optional[float] = None  # None for strict comparison
+    divisor: Optional[int] = None  # program answer is divided by it (units of reference tables)
+
+
+@dataclass(frozen=True, slots=True)
+class GradingSpec:
+    fields: tuple
+    program_source: Optional[str] = None  # StudentContext property with program answer (row of program model if None)
+    answer_key_fields: tuple = ()  # are used instead of fields, if student's answer key is calculated
+
+
+def get_answers_fields(student_answers_model):
+    return [field for field in student_answers_model._meta.concrete_fields if field.name not in ("id", "student")]
+
+
+def compile_program_spec(student_answers_model):
+    """ Fields for True / False (is_...) are compared strictly, the other ones with tolerance """
+    return GradingSpec(fields=tuple(FieldSpec(field.name, field.attname, field.attname,
+                                              tolerance=None if field.name.startswith("is_") else 0.01)
+                                    for field in get_answers_fields(student_answers_model)))
+
+
+def compile_materials_spec(student_answers_model, program_source: str):
+    """ Class of material is compared with primary key of the variant's one, design resistances
+    with values of reference table in kN/cm2 (or with the answer key), coefficients with tolerance """
+    fields = list()
+    answer_key_fields = list()
+    for field in get_answers_fields(student_answers_model):
+        if field.name in MATERIALS_COEFFICIENTS:
+            fields.append(FieldSpec(field.name, field.attname, field.attname, tolerance=0.005))
+            answer_key_fields.append(fields[-1])
+        elif field.is_relation:
+            fields.append(FieldSpec(field.name, field.attname, None))
+            answer_key_fields.append(FieldSpec(field.name, field.attname, field.attname))
+        else:
+            fields.append(FieldSpec(field.name, field.attname, field.attname, divisor=10))
+            answer_key_fields.append(FieldSpec(field.name, field.attname, field.attname))
+    return GradingSpec(fields=tuple(fields), program_source=program_source, answer_key_fields=tuple(answer_key_fields))
 
 
-def strict_match_validation(program_answers: dict, student_answers: dict):
-    statistics = dict()
+@functools.cache
+def get_grading_spec(form_name: str, student_answers_model):
+    """ Spec of the form is compiled once per process """
+    if form_name in MATERIALS_SOURCES:
+        return compile_materials_spec(student_answers_model, MATERIALS_SOURCES[form_name])
+    return compile_program_spec(student_answers_model)
 
-    for key, value in program_answers.items():
-        if student_answers[key] is not None and student_answers[key] == value:
-            statistics[key] = True
-        else:
-            statistics[key] = False
 
-    return statistics
+def get_program_answer(student_context: StudentContext, grading_spec: GradingSpec, program_answers_model):
+    if grading_spec.program_source is not None:
+        return getattr(student_context, grading_spec.program_source)
+    return student_context.get_row(program_answers_model)
 
 
-def tolerant_match_validation(program_answers: dict, student_answers: dict, tolerance: float):
+def grade_answers(student_answer, program_answer, fields: tuple):
+    """ Statistics of student's answers: field name -> answer is correct. Answers are incorrect, if there is
+    no program answer (its calculation is skipped, when the inputs are missing), as in the batch grading """
     statistics = dict()
-    min_bound = 1 - tolerance
-    max_bound = 1 + tolerance
-
-    for key, value in program_answers.items():
-        if student_answers[key] is not None:
-            if value >= 0:
-                if float(value) * min_bound <= student_answers[key] <= float(value) * max_bound:
-                    statistics[key] = True
-                else:
-                    statistics[key] = False
-            else:
-                if float(value) * min_bound >= student_answers[key] >= float(value) * max_bound:
-                    statistics[key] = True
-                else:
-                    statistics[key] = False
+    for field in fields:
+        student_value = getattr(student_answer, field.attname)
+        if program_answer is None:
+            program_value = None
+        elif field.program_attname is None:
+            program_value = program_answer.pk
         else:
-            statistics[key] = False
+            program_value = getattr(program_answer, field.program_attname)
+            if field.divisor is not None and program_value is not None:
+                program_value = program_value / field.divisor
 
+        if field.tolerance is None:
+            statistics[field.name] = is_strict_match(program_value, student_value)
+        else:
+            statistics[field.name] = is_tolerant_match(program_value, student_value, field.tolerance)
     return statistics
 
 
-def validate_concrete_and_reinforcement(program_answers: dict, student_answers: dict, program_answer_id: int):
-    statistics = dict()
-    student_special_values = dict()
-    program_special_values = dict()
-    special_keys = ["alpha_R", "xi_R"]
-
-    if special_keys[0] in program_answers.keys() and special_keys[1] in program_answers.keys():
-        for key in special_keys:
-            student_special_values[key] = student_answers.pop(key)
-            program_special_values[key] = program_answers.pop(key)
-
-    if program_special_values:
-        statistics.update(tolerant_match_validation(program_answers=program_special_values,
-                                                    student_answers=student_special_values,
-                                                    tolerance=0.005))
-
-    for key, value in program_answers.items():
-        if key in ["reinforcement_class", "concrete_class"]:
-            if student_answers[key] == program_answer_id:
-                statistics[key] = True
-            else:
-                statistics[key] = False
-        else:
-            if student_answers[key] == value / 10:
-                statistics[key] = True
-            else:
-                statistics[key] = False
+def is_strict_match(program_value, student_value):
+    return student_value is not None and student_value == program_value
 
-    return statistics
+
+def is_tolerant_match(program_value, student_value, tolerance: float):
+    if student_value is None or program_value is None:
+        return False
+    if program_value >= 0:
+        return float(program_value) * (1 - tolerance) <= student_value <= float(program_value) * (1 + tolerance)
+    else:
+        return float(program_value) * (1 - tolerance) >= student_value >= float(program_value) * (1 + tolerance)
+
+
+def strict_match_validation(program_answers: dict, student_answers: dict):
+    return {key: is_strict_match(value, student_answers[key]) for key, value in program_answers.items()}
+
+
+def tolerant_match_validation(program_answers: dict, student_answers: dict, tolerance: float):
+    return {key: is_tolerant_match(value, student_answers[key], tolerance) for key, value in program_answers.items()}
+
+
+def get_values_matrix(rows: list, fields: tuple):
+    """ Values of the fields (columns) of the rows (lines) as float matrix; None values
+    and missing rows are NaN, which doesn't match anything """
+    return np.array([[np.nan if row is None or getattr(row, field.attname) is None
+                      else float(getattr(row, field.attname)) for field in fields] for row in rows],
+                    dtype=float).reshape(len(rows), len(fields))
+
+
+def strict_match_matrix(program_values: np.ndarray, student_values: np.ndarray):
+    """ strict_match_validation for aligned matrices of values (students x fields) """
+    return program_values == student_values
+
+
+def tolerant_match_matrix(program_values: np.ndarray, student_values: np.ndarray, tolerance):
+    """ tolerant_match_validation for aligned matrices of values (students x fields): bounds
+    are swapped for negative program values; tolerance could be an array of fields' tolerances """
+    min_bound = program_values * (1 - tolerance)
+    max_bound = program_values * (1 + tolerance)
+    return np.where(program_values >= 0,
+                    (min_bound <= student_values) & (student_values <= max_bound),
+                    (min_bound >= student_values) & (student_values >= max_bound))
+
+
+def validate_program_answers_matrix(student_answers_rows: list, program_answers_rows: list, fields: tuple):
+    """ Statistics of many students for the form, which is graded with program answers (like
+    grade_answers for fields of its GradingSpec). Returns boolean matrix (students x fields) """
+    student_values = get_values_matrix(student_answers_rows, fields)
+    program_values = get_values_matrix(program_answers_rows, fields)
+    is_strict = np.array([field.tolerance is None for field in fields], dtype=bool)
+    tolerance = np.array([field.tolerance or 0 for field in fields], dtype=float)
+    return np.where(is_strict, strict_match_matrix(program_values, student_values),
+                    tolerant_match_matrix(program_values, student_values, tolerance))
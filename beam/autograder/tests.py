@@ -1,3 +1,1002 @@
-from django.test import TestCase
+from django.test import SimpleTestCase, TestCase, RequestFactory, override_settings
+from django.contrib.auth.models import User
+from django.urls import reverse
+from django.forms.models import model_to_dict
+from django.core.management import call_command
+from django.core.cache import caches
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from io import StringIO
+from decimal import Decimal
+from datetime import timedelta
+from unittest import mock
+from django.utils import timezone
+from django.utils.datastructures import MultiValueDict
+import numpy as np
+import autograder.models as md
+from autograder.services.query_stats import assert_query_budget, record_queries
+from autograder.services import (reference_cache, reiforcement_calculation, reinforcement_batch, dependency_graph,
+                                 bearing_capacity, bearing_capacity_batch, validation)
+from autograder.services import calculation_kernel as kernel
+from autograder.services.student_context import StudentContext, save_students_deferred_rows
+from autograder.services import (regrade, answer_key, bar_layouts, grading_queue, form_errors, slab_height,
+                                 cohort_statistics, opened_blocks)
+from autograder.views import StudentPersonalView, StudentFormsBatchSubmitView
+from autograder.forms import GirderGeometryForm, InitialReinforcementForm, BAR_DIAMETER_FIELDS
 
-# Create your tests here.
+BAR_DIAMETERS = [(10, 78.5), (12, 113.1), (14, 153.9), (16, 201.1), (18, 254.5), (20, 314.2), (22, 380.1), (25, 490.9)]
+
+
+def create_student(user_name: str):
+    """ Creates a student with all reference data, which is needed to open the personal page """
+    group = md.Group.objects.create(group_year=2022, group_name="ПГС-1")
+    city = md.Cities.objects.create(city_name="Москва")
+    roof_layer = md.RoofLayers.objects.create(layer_name="roof layer")
+    floor_layer = md.FloorLayers.objects.create(layer_name="floor layer")
+    concrete = md.Concrete.objects.create(concrete_class="B25", R_b_n=185, R_bt_n=15.5, R_b=145, R_bt=10.5,
+                                          E_b=30000)
+    reinforcement = md.Reinforcement.objects.create(reinforcement_class="A400", possible_diameters="6-40",
+                                                    R_s_ser=400, R_s=350, R_sc_l=350, R_sc_sh=400, R_sw=280,
+                                                    alpha_R=0.39, xi_R=0.531)
+    for diameter, area in BAR_DIAMETERS:
+        md.ReinforcementBarsDiameters.objects.create(diameter=diameter, cross_section_area=area, meter_mass=1)
+
+    references = dict()
+    for field in md.VariantInfo._meta.get_fields():
+        if field.many_to_one and field.name != "group":
+            references[field.name] = {md.Cities: city, md.RoofLayers: roof_layer, md.FloorLayers: floor_layer,
+                                      md.Concrete: concrete, md.Reinforcement: reinforcement}[field.related_model]
+    md.VariantInfo.objects.create(group=group, variant_number=1, num_of_floors=3, floor_height=4,
+                                  building_length=30, building_width=18, girder_length=6, girder_type="t",
+                                  frames_spacing=6, roof_slab_width=1.5, top_slab_width=1.5, usual_slab_width=1.5,
+                                  roof_load_full=1, roof_load_long=1, top_floor_load_full=1, top_floor_load_long=1,
+                                  usual_floor_load_full=1, usual_floor_load_long=1, ground_natural=1,
+                                  ground_unnatural=1, **references)
+    md.PersonalVariantsCivilEngineers.objects.create(personal_variant=1, slab="ВЭ", truss="t", girder="ВЭ крайний",
+                                                     column="c", foundation="f", girder_detail="g",
+                                                     column_detail="c")
+
+    user = User.objects.create_user(user_name, password="password")
+    student = md.Student.objects.create(user=user, full_name="Student", subgroup_variant_number=1,
+                                        personal_variant_number=1, group=group)
+    md.SlabHeight.objects.create(student=student, slab_height=400)
+    return student
+
+
+def create_input_row(model, student, **values):
+    """ Creates the student's row with given values, other required fields are filled with 1 """
+    for field in model._meta.concrete_fields:
+        if field.name not in ("id", "student") and not field.null and not field.has_default():
+            values.setdefault(field.attname, 1)
+    return model.objects.create(student=student, **values)
+
+
+def create_girder_geometry(student):
+    return create_input_row(md.GirderGeometry, student, girder_wall_width=30, girder_effective_flange_width=45,
+                            girder_flange_bevel_height=10, girder_flange_slab_height=5, girder_height=60)
+
+
+def create_reinforcement_inputs(student, left_moment: float = 10000):
+    """ Answers, which are read by the calculations of reinforcement (cases with M > 500000 are not implemented) """
+    create_girder_geometry(student)
+    create_input_row(md.MomentsForces, student, middle_section_moment_bot=5000,
+                     left_support_moment_top=left_moment, right_support_moment_top=12000)
+    create_input_row(md.InitialReinforcement, student, section_1_bot_effective_depth=55,
+                     section_1_top_reinforcement_area=Decimal("1.57"), section_1_top_distance=5,
+                     section_2_top_effective_depth=54, section_2_bot_reinforcement_area=Decimal("2.26"),
+                     section_2_bot_distance=5, section_3_top_effective_depth=54,
+                     section_3_bot_reinforcement_area=Decimal("2.26"), section_3_bot_distance=5)
+
+
+def get_program_rows(student, models: list):
+    return [model_to_dict(model.objects.get(student=student), exclude=["id"]) for model in models]
+
+
+class StudentPersonalViewQueryBudgetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student("student")
+
+    def setUp(self):
+        reference_cache.clear_tables()  # rows of other tests could be cached
+        self.client.login(username="student", password="password")
+        self.url = reverse("grader:student_personal", args=["student"])
+
+    def test_get_is_within_budget(self):
+        with assert_query_budget("StudentPersonalView", "GET"):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_post_is_within_budget(self):
+        data = {"GirderGeometry": "Submit", "girder_flange_bevel_height": 15, "girder_flange_slab_height": 10,
+                "girder_wall_height": 40, "girder_wall_width": 30, "girder_flange_bevel_width": 15,
+                "girder_length": 536}
+        with assert_query_budget("StudentPersonalView", "POST"):
+            response = self.client.post(self.url, data)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(md.GirderGeometry.objects.filter(student=self.student).exists())
+
+
+class StudentFormSubmitViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student("student")
+
+    def setUp(self):
+        reference_cache.clear_tables()
+        self.client.login(username="student", password="password")
+
+    def get_url(self, form_name: str, user_name: str = "student"):
+        return reverse("grader:student_form_submit", args=[user_name, form_name])
+
+    def test_valid_form_is_saved_and_graded(self):
+        concrete = md.Concrete.objects.get()
+        data = {"concrete_class": concrete.pk, "R_b_n": 18.5, "R_bt_n": 1.55, "R_b": 14.5, "R_bt": 1.05, "E_b": 3000}
+        response = self.client.post(self.get_url("Concrete"), data)
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertTrue(result["saved"])
+        self.assertEqual(result["errors"], {})
+        self.assertTrue(all(result["statistics"]["Concrete"].values()))
+
+    def test_statistics_are_saved_with_one_upsert(self):
+        data = {"concrete_class": md.Concrete.objects.get().pk, "R_b_n": 18.5, "R_bt_n": 1.55, "R_b": 14.5,
+                "R_bt": 1.05, "E_b": 3000}
+        self.client.post(self.get_url("Concrete"), data)
+        with record_queries() as query_stats:
+            self.client.post(self.get_url("Concrete"), {**data, "R_b": 15})
+        writes = [sql for sql, params in query_stats.statements if sql.startswith(("INSERT", "UPDATE")) and
+                  md.ConcreteAnswersStatistics._meta.db_table in sql]
+        self.assertEqual(len(writes), 1)
+        self.assertIn("ON CONFLICT", writes[0])
+        self.assertFalse(md.ConcreteAnswersStatistics.objects.get(student=self.student).R_b)
+
+    def test_form_with_errors_is_not_saved(self):
+        response = self.client.post(self.get_url("Concrete"), {"R_b_n": "text"})
+        result = response.json()
+        self.assertFalse(result["saved"])
+        self.assertIn("R_b_n", result["errors"])
+        self.assertFalse(md.ConcreteStudentAnswers.objects.filter(student=self.student).exists())
+
+    def test_closed_form_is_not_found(self):
+        response = self.client.post(self.get_url("BearingCapacityMiddleBot"), {})
+        self.assertEqual(response.status_code, 404)
+
+    def test_other_student_cannot_submit(self):
+        User.objects.create_user("other", password="password")
+        self.client.login(username="other", password="password")
+        response = self.client.post(self.get_url("Concrete"), {})
+        self.assertEqual(response.status_code, 403)
+
+    def test_batch_saves_valid_forms_and_keeps_errors(self):
+        concrete = md.Concrete.objects.get()
+        data = {"forms": ["Concrete", "Reinforcement"], "Concrete-concrete_class": concrete.pk,
+                "Concrete-R_b_n": 18.5, "Concrete-R_bt_n": 1.55, "Concrete-R_b": 14.5, "Concrete-R_bt": 1.05,
+                "Concrete-E_b": 3000, "Reinforcement-R_s": "text"}
+        response = self.client.post(reverse("grader:student_forms_submit", args=["student"]), data)
+        result = response.json()
+        self.assertTrue(result["forms"]["Concrete"]["saved"])
+        self.assertFalse(result["forms"]["Reinforcement"]["saved"])
+        self.assertIn("R_s", result["forms"]["Reinforcement"]["errors"])
+        self.assertTrue(all(result["statistics"]["Concrete"].values()))
+        self.assertTrue(md.ConcreteStudentAnswers.objects.filter(student=self.student).exists())
+
+
+class StudentFormsBatchSubmitViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student("student")
+
+    def setUp(self):
+        reference_cache.clear_tables()
+
+    def test_invalid_form_does_not_change_saved_answers(self):
+        create_girder_geometry(self.student)
+        md.StudentOpenForms.objects.create(student=self.student,
+                                           max_opened_form_number=len(StudentPersonalView.models_dict))
+        data = {"forms": "GirderGeometry", "GirderGeometry-girder_flange_bevel_height": 20,
+                "GirderGeometry-girder_flange_slab_height": 10, "GirderGeometry-girder_wall_height": 40,
+                "GirderGeometry-girder_wall_width": 999, "GirderGeometry-girder_flange_bevel_width": 15,
+                "GirderGeometry-girder_length": 536}
+        request = RequestFactory().post(reverse("grader:student_forms_submit", args=["student"]), data)
+        request.user = self.student.user
+        view = StudentFormsBatchSubmitView()
+        view.setup(request, user_name="student")
+        forms = view.submit_forms(["GirderGeometry"], view.get_student_models_dict(), prefixed=True)
+
+        self.assertFalse(forms["GirderGeometry"].is_valid())
+        self.assertEqual(view.student_context.get_row(md.GirderGeometry).girder_flange_bevel_height, 10)
+        self.assertEqual(md.GirderGeometry.objects.get().girder_flange_bevel_height, 10)
+
+
+class OpenedBlocksTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student("student")
+
+    def test_forms_filled_by_concurrent_submit_are_kept(self):
+        models_dict = StudentPersonalView.models_dict
+        forms_names = opened_blocks.get_forms_names(models_dict)[:3]
+        first_bit, second_bit, third_bit = (opened_blocks.get_form_bit(models_dict, name) for name in forms_names)
+        md.StudentOpenForms.objects.create(student=self.student, filled_forms=first_bit, max_opened_form_number=0)
+        student_context = StudentContext.from_user_name("student")
+        student_context.get_row(md.StudentOpenForms)  # the row is cached before the other submit
+        md.StudentOpenForms.objects.update(filled_forms=first_bit | second_bit)
+
+        opened_blocks.mark_forms_filled(student_context, models_dict, [forms_names[2]])
+        self.assertEqual(md.StudentOpenForms.objects.get().filled_forms, first_bit | second_bit | third_bit)
+
+
+class FormErrorsStoreTest(TestCase):
+    def setUp(self):
+        self.store = form_errors.FormErrorsStore(user_id=1)
+
+    def test_entries_expire(self):
+        self.store.save("Concrete", MultiValueDict({"R_b": ["text"]}))
+        self.assertEqual(self.store.get_many(["Concrete"])["Concrete"]["R_b"], "text")
+
+        later = timezone.now() + timedelta(seconds=form_errors.get_cache().default_timeout + 1)
+        with mock.patch("django.core.cache.backends.db.tz_now", return_value=later):
+            self.assertEqual(self.store.get_many(["Concrete"]), {})
+
+    def test_least_recently_used_forms_are_evicted(self):
+        forms_names = [f"Form{number}" for number in range(form_errors.MAX_FORMS_PER_USER)]
+        for form_name in forms_names:
+            self.store.save(form_name, MultiValueDict({"field": [form_name]}))
+        self.store.get_many(["Form0"])  # Form1 is the least recently used now
+        self.store.save("Concrete", MultiValueDict({"R_b": ["text"]}))
+
+        kept_forms = self.store.get_many(forms_names + ["Concrete"])
+        self.assertNotIn("Form1", kept_forms)
+        self.assertEqual(len(kept_forms), form_errors.MAX_FORMS_PER_USER)
+        self.assertEqual(form_errors.FormErrorsStore(user_id=2).get_many(forms_names), {})  # other user
+
+    def test_large_and_saved_forms_are_not_kept(self):
+        self.store.save("Concrete", MultiValueDict({"R_b": ["text"]}))
+        self.store.update({"Reinforcement": MultiValueDict({"R_s": ["x" * form_errors.MAX_ENTRY_SIZE]})},
+                          ["Concrete"])
+        self.assertEqual(self.store.get_many(["Concrete", "Reinforcement"]), {})
+
+    def test_command_reports_memory(self):
+        self.store.save("Concrete", MultiValueDict({"R_b": ["text"]}))
+        output = StringIO()
+        call_command("form_errors_memory", stdout=output)
+        self.assertIn("upper bound:", output.getvalue())
+        self.assertIn("for 1 users", output.getvalue())
+
+
+class StudentContextTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student("student")
+
+    def setUp(self):
+        reference_cache.clear_tables()
+        self.student_context = StudentContext.from_user_name("student")
+
+    def test_answers_are_loaded_with_student(self):
+        with self.assertNumQueries(0):
+            slab_height = self.student_context.get_row(md.SlabHeight)
+        self.assertEqual(slab_height.slab_height, 400)
+
+    def test_loaded_row_is_updated_without_select(self):
+        with self.assertNumQueries(1):
+            self.student_context.save_row(md.SlabHeight, {"slab_height": 500})
+        self.assertEqual(md.SlabHeight.objects.get(student=self.student).slab_height, 500)
+
+    def test_calculation_data_is_rebuilt_after_answers_change(self):
+        calls = list()
+
+        def build_data():
+            calls.append(1)
+            return len(calls)
+
+        self.assertEqual(self.student_context.get_calculation_data("key", build_data), 1)
+        self.assertEqual(self.student_context.get_calculation_data("key", build_data), 1)
+        self.student_context.save_row(md.SlabHeight, {"slab_height": 450})
+        self.assertEqual(self.student_context.get_calculation_data("key", build_data), 2)
+
+
+class ReferenceCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student("student")
+
+    def setUp(self):
+        reference_cache.clear_tables()
+        reference_cache.version_checked_at = None
+
+    def test_tables_are_reloaded_after_version_is_bumped_by_other_process(self):
+        concrete = md.Concrete.objects.get()
+        self.assertEqual(reference_cache.get_table(md.Concrete).get(concrete.pk).R_b, 145)
+
+        md.Concrete.objects.update(R_b=150)
+        # reference_information in another process: the version is changed in the shared cache only
+        caches[reference_cache.REFERENCE_TABLES_CACHE].set(reference_cache.VERSION_KEY, "other", timeout=None)
+        with self.assertNumQueries(0):  # the version is not checked again before CHECK_INTERVAL
+            self.assertEqual(reference_cache.get_table(md.Concrete).get(concrete.pk).R_b, 145)
+
+        checked_at = reference_cache.version_checked_at
+        with mock.patch("autograder.services.reference_cache.time.monotonic",
+                        return_value=checked_at + reference_cache.CHECK_INTERVAL):
+            self.assertEqual(reference_cache.get_table(md.Concrete).get(concrete.pk).R_b, 150)
+
+    def test_bump_version_drops_tables_of_this_process(self):
+        concrete = md.Concrete.objects.get()
+        reference_cache.get_table(md.Concrete).all()
+        md.Concrete.objects.update(R_b=150)
+        reference_cache.bump_version()
+        self.assertEqual(reference_cache.get_table(md.Concrete).get(concrete.pk).R_b, 150)
+
+
+class ReferenceModelChoiceFieldTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student("student")
+
+    def setUp(self):
+        reference_cache.clear_tables()
+        self.diameter = md.ReinforcementBarsDiameters.objects.get(diameter=16)
+        self.data = dict()
+        for section in range(1, 4):
+            for surface in ("top", "bot"):
+                self.data.update({f"section_{section}_{surface}_d_external": self.diameter.pk,
+                                  f"section_{section}_{surface}_n_external": 2,
+                                  f"section_{section}_{surface}_d_internal": self.diameter.pk,
+                                  f"section_{section}_{surface}_n_internal": 0,
+                                  f"section_{section}_{surface}_distance": 4})
+
+    def get_form(self, data: dict):
+        return InitialReinforcementForm(data, initial=dict.fromkeys(BAR_DIAMETER_FIELDS, self.diameter.pk),
+                                        girder_height=60)
+
+    def test_choices_are_shared_and_validated_without_queries(self):
+        reference_cache.get_table(md.ReinforcementBarsDiameters).all()  # the table is loaded once per process
+        with self.assertNumQueries(0):
+            forms = [self.get_form(self.data) for _ in range(2)]
+            for form in forms:
+                for field_name in BAR_DIAMETER_FIELDS:
+                    str(form[field_name])
+            self.assertTrue(all(form.is_valid() for form in forms))
+        invalid_form = self.get_form({**self.data, "section_1_top_d_external": 9999})
+        self.assertFalse(invalid_form.is_valid())
+
+        first_choices = list(forms[0].fields["section_1_top_d_external"].choices)
+        other_choices = list(forms[1].fields["section_2_bot_d_internal"].choices)
+        self.assertTrue(all(first[0] is other[0] for first, other in zip(first_choices[1:], other_choices[1:])))
+        self.assertEqual(forms[0].cleaned_data["section_1_top_d_external"].diameter, 16)
+        self.assertIn("section_1_top_d_external", invalid_form.errors)
+
+
+class SlabHeightTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student("student")
+
+    def setUp(self):
+        reference_cache.clear_tables()
+
+    def test_slab_is_none_until_it_is_designed(self):
+        md.SlabHeight.objects.all().delete()
+        student_context = StudentContext.from_user_name("student")
+        self.assertIsNone(slab_height.get_slab(student_context))
+
+        form = GirderGeometryForm({"girder_wall_height": 40}, slab=None, girder_length=536)
+        self.assertFalse(form.is_valid())
+        self.assertIn("girder_wall_height", form.errors)
+
+    def test_missing_slab_variant_gives_none(self):
+        md.PersonalVariantsCivilEngineers.objects.update(slab="other")
+        self.assertIsNone(slab_height.get_slab(StudentContext.from_user_name("student")))
+
+
+class ProgramAnswersFingerprintTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student("student")
+
+    def setUp(self):
+        reference_cache.clear_tables()
+
+    def test_calculation_is_skipped_for_the_same_inputs(self):
+        reiforcement_calculation.calculate_reinforcement(StudentContext(self.student), section=1)
+        student_context = StudentContext(self.student)
+        student_context.load_rows(grading=True)
+        student_context.load_rows(grading=False)
+        with record_queries() as query_stats:
+            reiforcement_calculation.calculate_reinforcement(student_context, section=1)
+        self.assertFalse([sql for sql, params in query_stats.statements if sql.startswith("UPDATE")])
+        self.assertEqual(query_stats.get_hit_rates(), {"Program-Answers": 1.0})
+
+    def test_changed_inputs_are_calculated_again(self):
+        student_context = StudentContext(self.student)
+        reiforcement_calculation.calculate_reinforcement(student_context, section=1)
+        row = student_context.get_row(md.CalculatedReinforcementMiddleProgram)
+        row.inputs_fingerprint = "other inputs"
+        with record_queries() as query_stats:
+            reiforcement_calculation.calculate_reinforcement(student_context, section=1)
+        self.assertEqual(query_stats.get_hit_rates(), {"Program-Answers": 0.0})
+        self.assertNotEqual(md.CalculatedReinforcementMiddleProgram.objects.get().inputs_fingerprint, "other inputs")
+
+
+class RegradeTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student("student")
+
+    def setUp(self):
+        reference_cache.clear_tables()
+        self.client.login(username="student", password="password")
+        data = {"concrete_class": md.Concrete.objects.get().pk, "R_b_n": 18.5, "R_bt_n": 1.55, "R_b": 14.5,
+                "R_bt": 1.05, "E_b": 3000}
+        self.client.post(reverse("grader:student_form_submit", args=["student", "Concrete"]), data)
+        md.ConcreteStudentAnswers.objects.update(R_b=15)  # as if grading of R_b was changed
+        self.models_dict = {name: models for block in StudentPersonalView.models_dict.values()
+                            for name, models in block.items()}
+
+    def test_dry_run_reports_flipped_flags_without_saving(self):
+        regraded_number, skipped_students_ids, flipped_flags = regrade.regrade_shard(
+            [self.student.pk], self.models_dict, dry_run=True)
+        self.assertEqual((regraded_number, skipped_students_ids), (1, []))
+        self.assertEqual(flipped_flags, {("ConcreteAnswersStatistics", "R_b", True, False): 1})
+        self.assertTrue(md.ConcreteAnswersStatistics.objects.get().R_b)
+
+    def test_command_saves_statistics(self):
+        output = StringIO()
+        call_command("regrade", "--all", "--workers", "1", stdout=output)
+        self.assertIn("1 students regraded", output.getvalue())
+        self.assertFalse(md.ConcreteAnswersStatistics.objects.get().R_b)
+
+
+class AnswerKeyTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student("student")
+
+    def setUp(self):
+        reference_cache.clear_tables()
+        self.client.login(username="student", password="password")
+
+    def test_command_saves_variant_answers(self):
+        output = StringIO()
+        call_command("program_answers", "--group", "ПГС-1", stdout=output)
+        self.assertIn("Answer keys of 1 students are saved", output.getvalue())
+        key = md.StudentAnswerKey.objects.get(student=self.student)
+        self.assertEqual((key.R_b, key.R_s, key.alpha_R), (14.5, 35, Decimal("0.390")))
+
+    def test_answers_are_graded_with_answer_key(self):
+        answer_key.save_answer_keys(md.Student.objects.all())
+        data = {"concrete_class": md.Concrete.objects.get().pk, "R_b_n": 18.5, "R_bt_n": 1.55, "R_b": 15,
+                "R_bt": 1.05, "E_b": 3000}
+        with record_queries() as query_stats:
+            response = self.client.post(reverse("grader:student_form_submit", args=["student", "Concrete"]), data)
+        self.assertFalse([sql for sql, params in query_stats.statements if md.VariantInfo._meta.db_table in sql])
+        statistics = response.json()["statistics"]["Concrete"]
+        self.assertEqual([name for name, is_correct in statistics.items() if not is_correct], ["R_b"])
+
+    def test_keys_are_refreshed_after_reference_tables_are_changed(self):
+        answer_key.save_answer_keys(md.Student.objects.all())
+        md.Concrete.objects.update(R_b=170)
+        other_student = md.Student.objects.create(user=User.objects.create_user("other"), full_name="Other",
+                                                  subgroup_variant_number=2, personal_variant_number=1,
+                                                  group=self.student.group)
+        md.StudentAnswerKey.objects.create(**{**model_to_dict(md.StudentAnswerKey.objects.get(), exclude=["id"]),
+                                              "student": other_student, "concrete_class": md.Concrete.objects.get(),
+                                              "reinforcement_class": md.Reinforcement.objects.get()})
+        reference_cache.bump_version()
+
+        self.assertEqual(answer_key.refresh_answer_keys(), 1)
+        self.assertEqual(md.StudentAnswerKey.objects.get().R_b, 17)
+        self.assertFalse(md.StudentAnswerKey.objects.filter(student=other_student).exists())  # no variant 2
+
+
+@override_settings(DEFERRED_GRADING=True)
+class GradingQueueTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student("student")
+
+    def setUp(self):
+        reference_cache.clear_tables()
+        self.client.login(username="student", password="password")
+        self.status_url = reverse("grader:student_grading_status", args=["student"])
+
+    def submit_concrete(self, R_b: float):
+        data = {"concrete_class": md.Concrete.objects.get().pk, "R_b_n": 18.5, "R_bt_n": 1.55, "R_b": R_b,
+                "R_bt": 1.05, "E_b": 3000}
+        return self.client.post(reverse("grader:student_form_submit", args=["student", "Concrete"]), data).json()
+
+    def test_answers_are_graded_by_worker(self):
+        self.assertFalse(self.submit_concrete(R_b=15)["graded"])
+        self.submit_concrete(R_b=14.5)
+        job = md.GradingJob.objects.get()
+        self.assertEqual((job.status, job.forms_names), (md.GradingJob.PENDING, "Concrete"))
+        self.assertEqual(self.client.get(self.status_url).json(), {"status": "pending"})
+        self.assertFalse(md.ConcreteAnswersStatistics.objects.exists())
+
+        output = StringIO()
+        call_command("grade_worker", "--once", stdout=output)
+        self.assertIn("1 jobs graded, 0 of them failed", output.getvalue())
+        with assert_query_budget("StudentGradingStatusView", "GET"):
+            response = self.client.get(self.status_url).json()
+        self.assertEqual(response["status"], md.GradingJob.DONE)
+        self.assertTrue(all(response["statistics"]["Concrete"].values()))
+
+    def get_models_dict(self):
+        return {name: models for block in StudentPersonalView.models_dict.values() for name, models in block.items()}
+
+    def get_grading_rows(self, forms_names: list):
+        models_dict = self.get_models_dict()
+        return get_program_rows(self.student, [model for name in forms_names for model in models_dict[name][2:]])
+
+    def grade_job(self, forms_names: list):
+        md.GradingJob.objects.create(student=self.student, forms_names=",".join(forms_names))
+        return grading_queue.grade_jobs(grading_queue.claim_jobs("worker", batch_size=10), self.get_models_dict())
+
+    def test_checks_are_graded_by_batch_engines_like_by_scalar_validation(self):
+        create_reinforcement_inputs(self.student)
+        create_input_row(md.CalculatedReinforcementMiddleStudent, self.student, alpha_m_middle=0.01,
+                         is_compressed_zone_capacity_sufficient_middle=True, reinforcement_area_middle=2.5)
+        create_input_row(md.CalculatedReinforcementLeftStudent, self.student)
+        forms_names = ["CalculatedReinforcementMiddle", "CalculatedReinforcementLeft"]
+        with transaction.atomic():
+            validation.validate_forms_answers(StudentContext(self.student), self.get_models_dict(), forms_names)
+            scalar_rows = self.get_grading_rows(forms_names)
+            transaction.set_rollback(True)
+
+        with mock.patch.object(kernel, "calculate_reinforcement") as calculate_reinforcement:
+            self.assertEqual(self.grade_job(forms_names), 0)
+        calculate_reinforcement.assert_not_called()
+        self.assertEqual(self.get_grading_rows(forms_names), scalar_rows)
+
+    def test_jobs_with_not_implemented_cases_fail(self):
+        create_reinforcement_inputs(self.student, left_moment=1000000)
+        create_input_row(md.CalculatedReinforcementLeftStudent, self.student)
+        with self.assertRaises(ValueError):
+            reiforcement_calculation.calculate_reinforcement(StudentContext(self.student), section=2)
+        self.assertEqual(self.grade_job(["CalculatedReinforcementLeft"]), 1)
+        job = md.GradingJob.objects.get()
+        self.assertEqual(job.status, md.GradingJob.FAILED)
+        self.assertIn("CalculatedReinforcementLeft", job.error)
+        self.assertFalse(md.CalculatedReinforcementLeftStatistics.objects.exists())
+
+    def test_batch_checks_are_the_checks_of_dependency_graph(self):
+        self.assertEqual(grading_queue.BATCH_CHECKS.keys(), dependency_graph.CHECKS.keys())
+
+    def test_forms_are_added_to_pending_job_created_concurrently(self):
+        pending_job = md.GradingJob.objects.create(student=self.student, forms_names="Concrete")
+        # the job is not found by the request, which creates the second one
+        with mock.patch("django.db.models.query.QuerySet.first", side_effect=[None, pending_job]):
+            job = grading_queue.enqueue(StudentContext(self.student), ["Reinforcement"])
+        self.assertEqual(job.pk, pending_job.pk)
+        self.assertEqual(md.GradingJob.objects.get().forms_names, "Concrete,Reinforcement")
+
+    def test_stale_jobs_are_requeued_by_running_worker(self):
+        started_at = timezone.now() - timedelta(hours=1)
+        md.GradingJob.objects.create(student=self.student, forms_names="Concrete", status=md.GradingJob.RUNNING,
+                                     started_at=started_at, worker="stopped")
+        self.submit_concrete(R_b=14.5)
+        self.assertEqual(grading_queue.requeue_stale_jobs(stale_after=60), 1)
+        abandoned_job, pending_job = md.GradingJob.objects.order_by("pk")
+        self.assertEqual(abandoned_job.status, md.GradingJob.FAILED)  # its forms are graded with the pending one
+        self.assertEqual(pending_job.status, md.GradingJob.PENDING)
+
+        pending_job.status = md.GradingJob.RUNNING
+        pending_job.started_at = started_at
+        pending_job.save()
+        self.assertEqual(grading_queue.run_worker(self.get_models_dict(), batch_size=10, poll_interval=0,
+                                                  stale_after=0, once=True), (1, 0))
+        self.assertEqual(md.GradingJob.objects.get(pk=pending_job.pk).status, md.GradingJob.DONE)
+
+    def test_failed_batch_does_not_stop_worker(self):
+        self.submit_concrete(R_b=14.5)
+        with mock.patch.object(grading_queue, "grade_jobs", side_effect=RuntimeError("no database")), \
+                self.assertLogs("autograder.services.grading_queue", "ERROR"):
+            result = grading_queue.run_worker(self.get_models_dict(), batch_size=10, poll_interval=0,
+                                              stale_after=600, once=True)
+        self.assertEqual(result, (1, 1))
+        job = md.GradingJob.objects.get()
+        self.assertEqual((job.status, job.error), (md.GradingJob.FAILED, "RuntimeError: no database"))
+
+    def test_jobs_of_students_being_graded_wait(self):
+        md.GradingJob.objects.create(student=self.student, forms_names="Concrete", status=md.GradingJob.RUNNING)
+        pending_job = md.GradingJob.objects.create(student=self.student, forms_names="Concrete")
+        self.assertEqual(grading_queue.claim_jobs("worker", batch_size=10), [])
+
+        md.GradingJob.objects.filter(status=md.GradingJob.RUNNING).update(status=md.GradingJob.DONE)
+        self.assertEqual(grading_queue.claim_jobs("worker", batch_size=10), [pending_job])
+
+
+class GroupStatisticsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student("student")
+
+    def setUp(self):
+        reference_cache.clear_tables()
+        self.client.login(username="student", password="password")
+
+    def submit_concrete(self, R_b: float):
+        data = {"concrete_class": md.Concrete.objects.get().pk, "R_b_n": 18.5, "R_bt_n": 1.55, "R_b": R_b,
+                "R_bt": 1.05, "E_b": 3000}
+        self.client.post(reverse("grader:student_form_submit", args=["student", "Concrete"]), data)
+
+    def get_counters(self):
+        return {(row.statistics_model, row.field): (row.attempted, row.passed, row.failed)
+                for row in md.GroupFieldStatistics.objects.filter(group=self.student.group)}
+
+    def test_counters_are_updated_with_statistics(self):
+        self.submit_concrete(R_b=14.5)
+        self.assertEqual(self.get_counters()[("ConcreteAnswersStatistics", "R_b")], (1, 1, 0))
+        self.submit_concrete(R_b=15)
+        counters = self.get_counters()
+        self.assertEqual(counters[("ConcreteAnswersStatistics", "R_b")], (1, 0, 1))
+        self.assertEqual(counters[("ConcreteAnswersStatistics", "E_b")], (1, 1, 0))
+
+        md.ConcreteStudentAnswers.objects.update(R_b=14.5)
+        regrade.regrade_shard([self.student.pk], {name: models for block in StudentPersonalView.models_dict.values()
+                                                  for name, models in block.items()})
+        self.assertEqual(self.get_counters()[("ConcreteAnswersStatistics", "R_b")], (1, 1, 0))
+
+    def test_rebuild_gives_the_same_counters(self):
+        self.submit_concrete(R_b=15)
+        counters = self.get_counters()
+        md.GroupFieldStatistics.objects.update(attempted=0, passed=0, failed=0)
+
+        output = StringIO()
+        call_command("rebuild_group_statistics", "--group", "ПГС-1", stdout=output)
+        self.assertIn("counters of fields are saved", output.getvalue())
+        rebuilt_counters = self.get_counters()
+        self.assertEqual({key: value for key, value in rebuilt_counters.items() if value != (0, 0, 0)}, counters)
+
+    def test_concurrent_gradings_of_student_are_counted_once(self):
+        self.submit_concrete(R_b=15)
+        md.ConcreteStudentAnswers.objects.update(R_b=14.5)
+        models_dict = {name: models for block in StudentPersonalView.models_dict.values()
+                       for name, models in block.items()}
+        # both contexts are loaded before any of them is saved, like in two requests at the same time
+        students_contexts = [StudentContext(self.student, defer_writes=True) for _ in range(2)]
+        for student_context in students_contexts:
+            student_context.load_rows(grading=False)
+            student_context.load_rows(grading=True)
+            validation.validate_forms_answers(student_context, models_dict, ["Concrete"])
+        for student_context in students_contexts:
+            save_students_deferred_rows([student_context])
+
+        counters = self.get_counters()
+        self.assertEqual(counters[("ConcreteAnswersStatistics", "R_b")], (1, 1, 0))
+        cohort_statistics.rebuild_group_statistics([self.student.group_id])
+        self.assertEqual(self.get_counters(), counters)
+
+    def test_view_is_for_staff_only(self):
+        self.submit_concrete(R_b=15)
+        url = reverse("grader:group_statistics", args=[self.student.group_id])
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        User.objects.filter(username="student").update(is_staff=True)
+        with assert_query_budget("GroupStatisticsView", "GET"):
+            response = self.client.get(url).json()
+        self.assertEqual(response["statistics"]["ConcreteAnswersStatistics"]["R_b"],
+                         {"attempted": 1, "passed": 0, "failed": 1})
+
+
+class BarLayoutsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student("student")
+
+    def setUp(self):
+        reference_cache.clear_tables()
+
+    def test_layouts_are_the_least_ones_not_less_than_required(self):
+        layouts_table = bar_layouts.get_layouts_table()
+        for required_area in (0.5, 4.02, 4.5, 12.0, 100):
+            layouts = bar_layouts.get_layouts(required_area)
+            sufficient_areas = [layout.area for layout in layouts_table.layouts if layout.area >= required_area]
+            self.assertEqual([layout.area for layout in layouts], sufficient_areas[:3])
+        self.assertEqual(str(bar_layouts.get_layouts(4.02)[0]), "2d16 (4.02 см²)")
+
+    def test_only_allowed_numbers_of_bars_are_in_the_table(self):
+        layouts = bar_layouts.get_layouts_table().layouts
+        self.assertEqual(len(layouts), len(BAR_DIAMETERS) * (1 + 2 * len(BAR_DIAMETERS)))
+        self.assertTrue(all(layout.n_external == 2 and layout.n_internal in (0, 1, 2) for layout in layouts))
+
+    def test_reference_layouts_of_calculated_sections(self):
+        md.CalculatedReinforcementLeftProgram.objects.create(
+            student=self.student, fully_compressed_flange_moment_left=0, is_neutral_axis_in_flange_left=True,
+            section_widths_for_calculation_left=0, overhanging_flange_area_left=0, alpha_m_left=0,
+            is_compressed_zone_capacity_sufficient_left=True, reinforcement_area_left=5)
+        output = StringIO()
+        call_command("reference_layouts", "--group", "ПГС-1", stdout=output)
+        self.assertIn("2-2: 2d14 + 1d16 (5.09 см²)", output.getvalue())
+
+    def test_suggested_layouts_are_shown_on_the_page(self):
+        md.CalculatedReinforcementLeftProgram.objects.create(
+            student=self.student, fully_compressed_flange_moment_left=0, is_neutral_axis_in_flange_left=True,
+            section_widths_for_calculation_left=0, overhanging_flange_area_left=0, alpha_m_left=0,
+            is_compressed_zone_capacity_sufficient_left=True, reinforcement_area_left=5)
+        md.StudentOpenForms.objects.create(student=self.student,
+                                           max_opened_form_number=len(StudentPersonalView.models_dict))
+        self.client.login(username="student", password="password")
+        response = self.client.get(reverse("grader:student_personal", args=["student"]))
+        self.assertIn("CalculatedReinforcement", response.context["forms"])
+        self.assertContains(response, '<div class="help_text">Варианты: 2d14 + 1d16 (5.09 см²);', html=False)
+
+
+class AsyncStudentPersonalViewTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student("student")
+
+    def setUp(self):
+        reference_cache.clear_tables()
+
+    def test_async_page_is_the_same_as_sync_one(self):
+        sync_response = self.client.get(reverse("grader:student_personal", args=["student"]))
+        async_response = self.client.get(reverse("grader:student_personal_async", args=["student"]))
+        self.assertEqual(async_response.status_code, 200)
+        self.assertEqual(list(async_response.context["forms"].keys()),
+                         list(sync_response.context["forms"].keys()))
+        self.assertEqual(async_response.context["forms"]["GirderGeometry"].slab,
+                         sync_response.context["forms"]["GirderGeometry"].slab)
+
+    def test_page_uses_connection_of_the_request(self):
+        created_connections = list()
+
+        def add_connection(sender, connection, **kwargs):
+            created_connections.append(connection)
+
+        connection_created.connect(add_connection)
+        try:
+            response = self.client.get(reverse("grader:student_personal_async", args=["student"]))
+        finally:
+            connection_created.disconnect(add_connection)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(created_connections, [])  # no connections are opened in other threads
+
+
+class ReinforcementBatchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student("student")
+
+    def setUp(self):
+        reference_cache.clear_tables()
+
+    def get_inputs(self, M: list, A_sc: float = 1.0):
+        number = len(M)
+        inputs = {"student_id": np.arange(number), "has_data": np.ones(number, dtype=bool)}
+        inputs.update({key: np.full(number, value) for key, value in
+                       {"R_s": 35.0, "R_sc": 40.0, "alpha_R": 0.39, "R_b": 1.45, "h_f": 15.0}.items()})
+        inputs.update({key: np.full((number, 3), value) for key, value in
+                       {"b": 30.0, "h_0": 55.0, "a_sc": 5.0, "A_sc": A_sc}.items()})
+        inputs["M"] = np.array(M, dtype=float)
+        return inputs
+
+    def test_results_are_the_same_as_scalar_ones(self):
+        inputs = self.get_inputs([[5000, 10000, 20000], [30000, 40000, 45000]])
+        results = reinforcement_batch.calculate_reinforcement_batch(inputs)
+        for number in range(2):
+            materials = kernel.Materials(**{key: float(inputs[key][number]) for key in ("R_s", "R_sc", "R_b",
+                                                                                        "alpha_R")})
+            for column in range(3):
+                b, h_0, M = (float(inputs[key][number, column]) for key in ("b", "h_0", "M"))
+                compressed = kernel.BarsLayer(A=float(inputs["A_sc"][number, column]),
+                                              a=float(inputs["a_sc"][number, column]))
+                alpha_m = kernel.calculate_alpha_m(materials, b, M, h_0, compressed)
+                self.assertEqual(results["alpha_m"][number, column], alpha_m)
+                self.assertEqual(results["reinforcement_area"][number, column],
+                                 kernel.calculate_reinforcement_area(materials, b, M, h_0, compressed, alpha_m))
+                self.assertEqual(results["fully_compressed_flange_moment"][number, column],
+                                 kernel.calculate_section_moment_full_flange_compressed(
+                                     materials, b, float(inputs["h_f"][number]), h_0, compressed))
+
+    def test_not_implemented_cases_are_masked(self):
+        inputs = self.get_inputs([[60000, 60000, 1000]])
+        results = reinforcement_batch.calculate_reinforcement_batch(inputs)
+        self.assertEqual(results["flange_not_implemented"].tolist(), [[False, True, False]])
+        self.assertEqual(results["capacity_not_implemented"].tolist(), [[True, True, False]])
+        self.assertEqual(reinforcement_batch.get_not_implemented(inputs, results).tolist(), [[True, True, False]])
+
+    def assert_rows_are_the_same_as_scalar_ones(self):
+        models = [model for model, postfix in reinforcement_batch.PROGRAM_MODELS.values()]
+        student_context = StudentContext(self.student)
+        for section in reinforcement_batch.SECTIONS:
+            reiforcement_calculation.calculate_reinforcement(student_context, section)
+        scalar_rows = get_program_rows(self.student, models)
+
+        for model in models:
+            model.objects.all().delete()
+        reinforcement_batch.calculate_reinforcement_for_students(md.Student.objects.all())
+        self.assertEqual(get_program_rows(self.student, models), scalar_rows)
+
+    def test_students_without_data_get_the_same_rows_as_from_scalar_calculation(self):
+        self.assert_rows_are_the_same_as_scalar_ones()
+
+    def test_rows_and_fingerprints_are_the_same_as_scalar_ones(self):
+        create_reinforcement_inputs(self.student)
+        self.assert_rows_are_the_same_as_scalar_ones()
+        self.assertNotEqual(md.CalculatedReinforcementLeftProgram.objects.get().alpha_m_left, -1)
+
+    def test_students_without_variant_are_skipped(self):
+        md.VariantInfo.objects.all().delete()  # the scalar calculation raises VariantInfo.DoesNotExist
+        inputs, results, not_calculated = reinforcement_batch.calculate_reinforcement_for_students(
+            md.Student.objects.all())
+        self.assertTrue(not_calculated.all())
+        self.assertFalse(md.CalculatedReinforcementMiddleProgram.objects.exists())
+
+
+class BearingCapacityBatchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.student = create_student("student")
+
+    def setUp(self):
+        reference_cache.clear_tables()
+
+    def get_inputs(self, A: list):
+        inputs = {"student_id": np.arange(1), "has_data": np.ones(1, dtype=bool)}
+        inputs.update({key: np.full(1, value) for key, value in
+                       {"R_s": 35.0, "R_sc": 40.0, "R_b": 1.45, "b_w": 30.0, "b_f": 45.0, "h_f": 15.0,
+                        "h": 60.0}.items()})
+        inputs["A"] = np.array([A], dtype=float)  # sections x (bot, top)
+        inputs["a_s"] = np.full((1, 3, 2), 5.0)
+        return inputs
+
+    def test_surfaces_use_their_widths_and_opposite_reinforcement(self):
+        inputs = self.get_inputs([[10, 2], [2, 10], [2, 10]])
+        results = bearing_capacity_batch.calculate_bearing_capacity_batch(inputs)
+        self.assertEqual(results["compressed_zone_height_a"][0, 0, 0], (35.0 * 10 - 40.0 * 2) / (1.45 * 30.0))
+        self.assertEqual(results["compressed_zone_height_a"][0, 1, 1], (35.0 * 10 - 40.0 * 2) / (1.45 * 45.0))
+        self.assertFalse(results["not_implemented"].any())
+
+    def test_not_implemented_case_is_masked_for_top_surface_only(self):
+        inputs = self.get_inputs([[2, 200], [2, 2], [2, 2]])
+        results = bearing_capacity_batch.calculate_bearing_capacity_batch(inputs)
+        self.assertEqual(results["not_implemented"].tolist(), [[[False, True], [False, False], [False, False]]])
+
+    def test_capacity_curves_are_the_same_as_scalar_ones(self):
+        curves = bearing_capacity_batch.calculate_capacity_curves(self.get_inputs([[0, 0]] * 3),
+                                                                  tensile_areas=[10, 200], compressed_areas=[2, 4])
+        self.assertEqual(curves["bearing_capacity"].shape, (1, 3, 2, 2, 2))
+        materials = kernel.Materials(R_s=35.0, R_sc=40.0, R_b=1.45, alpha_R=0.39)
+        geometry = kernel.SectionGeometry(b_w=30.0, b_f=45.0, h_f=15.0, h=60.0)
+        result = kernel.calculate_bearing_capacity(materials, geometry, "bot", kernel.BarsLayer(A=10, a=5.0),
+                                                   kernel.BarsLayer(A=4, a=5.0))
+        self.assertEqual(curves["bearing_capacity"][0, 1, 0, 0, 1], np.float32(result.bearing_capacity))
+        # Rs*As > Rsc*Asc + Rb*bf*hf is not implemented for top surface
+        self.assertTrue(np.isnan(curves["bearing_capacity"][0, :, 1, 1]).all())
+        self.assertFalse(np.isnan(curves["bearing_capacity"][0, :, 0]).any())
+
+    def assert_rows_are_the_same_as_scalar_ones(self):
+        models = list(bearing_capacity_batch.PROGRAM_MODELS.values())
+        student_context = StudentContext(self.student)
+        for surface in bearing_capacity_batch.SURFACES:
+            bearing_capacity.calculate_bearing_capacity(student_context, surface)
+        scalar_rows = get_program_rows(self.student, models)
+
+        for model in models:
+            model.objects.all().delete()
+        bearing_capacity_batch.calculate_bearing_capacity_for_students(md.Student.objects.all())
+        self.assertEqual(get_program_rows(self.student, models), scalar_rows)
+
+    def test_students_without_reinforcement_are_skipped_as_by_scalar_calculation(self):
+        create_girder_geometry(self.student)
+        student_context = StudentContext(self.student)
+        for surface in bearing_capacity_batch.SURFACES:
+            bearing_capacity.calculate_bearing_capacity(student_context, surface)
+        inputs, results, not_calculated = bearing_capacity_batch.calculate_bearing_capacity_for_students(
+            md.Student.objects.all())
+        self.assertTrue(not_calculated.all())
+        self.assertFalse(any(model.objects.exists() for model in bearing_capacity_batch.PROGRAM_MODELS.values()))
+
+    def test_rows_and_fingerprints_are_the_same_as_scalar_ones(self):
+        create_girder_geometry(self.student)
+        areas = {f"section_{section}_{surface}_reinforcement_area": Decimal("4.02") if surface == "bot" else
+                 Decimal("2.26") for section in bearing_capacity_batch.SECTIONS
+                 for surface in bearing_capacity_batch.SURFACES}
+        distances = {f"section_{section}_{surface}_distance": 5 for section in bearing_capacity_batch.SECTIONS
+                     for surface in bearing_capacity_batch.SURFACES}
+        create_input_row(md.CalculatedReinforcement, self.student, **areas, **distances)
+        self.assert_rows_are_the_same_as_scalar_ones()
+        self.assertIsNotNone(md.BearingCapacityLeftTopProgram.objects.get().bearing_capacity_left_top)
+
+    def test_answers_without_program_answers_are_graded_as_incorrect(self):
+        create_girder_geometry(self.student)
+        create_input_row(md.BearingCapacityLeftBotStudent, self.student)
+        student_context = StudentContext(self.student)
+        models = StudentPersonalView.models_dict["capacity_calculations_models"]["BearingCapacityLeftBot"]
+        validation.grade_forms_answers(student_context, {"BearingCapacityLeftBot": models},
+                                       ["BearingCapacityLeftBot"])
+        self.assertFalse(md.BearingCapacityLeftBotProgram.objects.exists())
+        self.assertFalse(any(model_to_dict(md.BearingCapacityLeftBotStatistics.objects.get(),
+                                           exclude=["id", "student"]).values()))
+
+    def test_students_without_geometry_are_skipped(self):  # the scalar calculation raises ObjectDoesNotExist
+        inputs, results, not_calculated = bearing_capacity_batch.calculate_bearing_capacity_for_students(
+            md.Student.objects.all())
+        self.assertTrue(not_calculated.all())
+        self.assertFalse(md.BearingCapacityMiddleBotProgram.objects.exists())
+
+
+class CalculationKernelTest(SimpleTestCase):
+    materials = kernel.Materials(R_s=35.0, R_sc=40.0, R_b=1.45, alpha_R=0.39)
+    geometry = kernel.SectionGeometry(b_w=30.0, b_f=45.0, h_f=15.0, h=60.0)
+
+    def test_support_section_has_flange_values(self):
+        result = kernel.calculate_reinforcement(self.materials, self.geometry, section=2, M=10000, h_0=55.0,
+                                                compressed=kernel.BarsLayer(A=1.0, a=5.0))
+        self.assertTrue(result.is_neutral_axis_in_flange)
+        self.assertEqual(result.section_widths_for_calculation, self.geometry.b_f)
+        self.assertGreater(result.reinforcement_area, 0)
+
+    def test_not_implemented_case_raises_error(self):
+        with self.assertRaises(ValueError):
+            kernel.calculate_reinforcement(self.materials, self.geometry, section=1, M=60000, h_0=55.0,
+                                           compressed=kernel.BarsLayer(A=1.0, a=5.0))
+
+    def test_bearing_capacity_is_the_same_as_batch_one(self):
+        tensile, compressed = kernel.BarsLayer(A=10.0, a=5.0), kernel.BarsLayer(A=2.0, a=4.0)
+        result = kernel.calculate_bearing_capacity(self.materials, self.geometry, "bot", tensile, compressed)
+
+        inputs = {"student_id": np.arange(1), "has_data": np.ones(1, dtype=bool),
+                  "R_s": np.full(1, 35.0), "R_sc": np.full(1, 40.0), "R_b": np.full(1, 1.45),
+                  "b_w": np.full(1, 30.0), "b_f": np.full(1, 45.0), "h_f": np.full(1, 15.0), "h": np.full(1, 60.0),
+                  "A": np.array([[[10.0, 2.0]] * 3]), "a_s": np.array([[[5.0, 4.0]] * 3])}
+        results = bearing_capacity_batch.calculate_bearing_capacity_batch(inputs)
+        self.assertEqual(results["bearing_capacity"][0, 0, 0], result.bearing_capacity)
+        self.assertEqual(results["compressed_zone_height_b"][0, 0, 0], result.compressed_zone_height_b)
+
+
+class ValidationMatrixTest(SimpleTestCase):
+    def test_tolerant_match_is_the_same_as_scalar_one(self):
+        program_answers = {"a": 100.0, "b": -100.0, "c": -100.0, "d": 100.0, "e": 0.0, "f": 5.0}
+        student_answers = {"a": 100.9, "b": -100.9, "c": -98.0, "d": None, "e": 0.0, "f": 5.06}
+        statistics = validation.tolerant_match_validation(program_answers, student_answers, tolerance=0.01)
+
+        fields = list(program_answers.keys())
+        matrix = validation.tolerant_match_matrix(np.array([[program_answers[key] for key in fields]]),
+                                                  np.array([[student_answers[key] for key in fields]], dtype=float),
+                                                  tolerance=0.01)
+        self.assertEqual(dict(zip(fields, matrix[0].tolist())), statistics)
+
+    def test_none_values_do_not_match(self):
+        rows = [md.CalculatedReinforcementMiddleStudent(alpha_m_middle=0.1, reinforcement_area_middle=None,
+                                                        is_compressed_zone_capacity_sufficient_middle=True), None]
+        fields = validation.get_grading_spec("CalculatedReinforcementMiddle",
+                                             md.CalculatedReinforcementMiddleStudent).fields
+        self.assertEqual([(field.name, field.tolerance) for field in fields],
+                         [("alpha_m_middle", 0.01), ("is_compressed_zone_capacity_sufficient_middle", None),
+                          ("reinforcement_area_middle", 0.01)])
+        statistics = validation.validate_program_answers_matrix(rows, [rows[0], rows[0]], fields)
+        self.assertEqual(statistics.tolist(), [[True, True, False], [False, False, False]])
+
+    def test_materials_are_graded_in_units_of_answers(self):
+        grading_spec = validation.get_grading_spec("Reinforcement", md.ReinforcementStudentAnswers)
+        reinforcement = md.Reinforcement(pk=3, R_s_ser=400, R_s=350, R_sc_l=350, R_sc_sh=400, R_sw=None,
+                                         alpha_R=Decimal("0.390"), xi_R=Decimal("0.531"))
+        answers = md.ReinforcementStudentAnswers(reinforcement_class_id=3, R_s_ser=40, R_s=35, R_sc_l=350,
+                                                 R_sc_sh=40, R_sw=28, alpha_R=Decimal("0.391"), xi_R=None)
+        self.assertEqual(validation.grade_answers(answers, reinforcement, grading_spec.fields),
+                         {"reinforcement_class": True, "R_s_ser": True, "R_s": True, "R_sc_l": False,
+                          "R_sc_sh": True, "R_sw": False, "alpha_R": True, "xi_R": False})
+
+
+class DependencyGraphTest(SimpleTestCase):
+    def test_only_checks_of_changed_section_are_recalculated(self):
+        changed_checks = dependency_graph.get_changed_checks(
+            {md.InitialReinforcement: {"section_2_top_effective_depth"}})
+        self.assertEqual(changed_checks, ["CalculatedReinforcementLeft"])
+
+    def test_capacity_checks_read_both_surfaces_of_their_section(self):
+        changed_checks = dependency_graph.get_changed_checks(
+            {md.CalculatedReinforcement: {"section_2_top_reinforcement_area"}})
+        self.assertEqual(changed_checks, ["BearingCapacityLeftBot", "BearingCapacityLeftTop"])
+
+    def test_wall_width_is_read_by_middle_section_and_bottom_surface(self):
+        changed_checks = dependency_graph.get_changed_checks({md.GirderGeometry: {"girder_wall_width"}})
+        self.assertEqual(changed_checks, ["CalculatedReinforcementMiddle", "BearingCapacityMiddleBot",
+                                          "BearingCapacityLeftBot", "BearingCapacityRightBot"])
+
+    def test_not_read_fields_change_nothing(self):
+        self.assertEqual(dependency_graph.get_changed_checks({md.MomentsForces: {"left_support_shear_force"}}), [])
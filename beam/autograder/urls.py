@@ -5,4 +5,13 @@ app_name = 'grader'
 urlpatterns = [
     path('redirect/', views.redirect, name='redirect'),
     path('user/<str:user_name>/', views.StudentPersonalView.as_view(), name='student_personal'),
+    path('user/<str:user_name>/submit/', views.StudentFormsBatchSubmitView.as_view(),
+         name='student_forms_submit'),
+    path('user/<str:user_name>/submit/<str:form_name>/', views.StudentFormSubmitView.as_view(),
+         name='student_form_submit'),
+    path('user/<str:user_name>/grading-status/', views.StudentGradingStatusView.as_view(),
+         name='student_grading_status'),
+    path('group/<int:group_id>/statistics/', views.GroupStatisticsView.as_view(), name='group_statistics'),
+    path('async/redirect/', views.async_redirect, name='redirect_async'),
+    path('async/user/<str:user_name>/', views.AsyncStudentPersonalView.as_view(), name='student_personal_async'),
 ]
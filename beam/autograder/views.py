@@ -1,5 +1,5 @@
 from django.shortcuts import render
-from django.http import HttpResponseRedirect
+from django.http import HttpResponseRedirect, JsonResponse
 from django.views import generic, View
 import autograder.models as md
 from .forms import (ConcreteStudentAnswersForm, ReinforcementStudentAnswersForm, GirderGeometryForm,
@@ -10,12 +10,22 @@ from .forms import (ConcreteStudentAnswersForm, ReinforcementStudentAnswersForm,
                     BearingCapacityRightBotStudentForm,
                     BearingCapacityMiddleTopStudentForm, BearingCapacityLeftTopStudentForm,
                     BearingCapacityRightTopStudentForm)
-from django.contrib.auth.models import User
 from django.urls import reverse_lazy, reverse
 from django.contrib.auth.decorators import login_required
+from django.contrib.auth.views import redirect_to_login
 from django.forms.models import model_to_dict
-from autograder.services import validation, girder_length, slab_height
+from autograder.services import (validation, girder_length, slab_height, opened_blocks, bar_layouts, grading_queue,
+                                 cohort_statistics)
+from autograder.services.student_context import StudentContext, get_field_values, set_field_values
+from autograder.services.form_errors import FormErrorsStore
+from django.conf import settings
+from django.db import transaction, close_old_connections
 from django.db.models import Model
+from django.utils.datastructures import MultiValueDict
+from functools import cached_property
+from asgiref.sync import sync_to_async
+from weakref import WeakKeyDictionary
+import asyncio
 
 
 class GroupList(generic.ListView):
@@ -44,6 +54,17 @@ class StudentList(generic.ListView):
         return context
 
 
+class GroupStatisticsView(View):
+    """ Numbers of the group's students, who answered every field of the forms, and of the correct
+    and wrong answers (for teachers); counters are read instead of statistics of every student """
+    http_method_names = ["get"]
+
+    def get(self, request, group_id: int):
+        if not request.user.is_staff:
+            return JsonResponse({"error": "You cannot see statistics of the group"}, status=403)
+        return JsonResponse({"group_id": group_id, "statistics": cohort_statistics.get_group_statistics(group_id)})
+
+
 @login_required
 def redirect(request):
     user_id = request.user.pk
@@ -51,9 +72,16 @@ def redirect(request):
     return HttpResponseRedirect(reverse_lazy("grader:student_personal", args=[user_name]))
 
 
-class StudentPersonalView(View):
-    forms_with_errors = dict()
+async def async_redirect(request):
+    # user is loaded from session lazily, with DB queries
+    is_authenticated, user_name = await sync_to_async(lambda: (request.user.is_authenticated,
+                                                               request.user.username))()
+    if not is_authenticated:
+        return redirect_to_login(request.get_full_path())
+    return HttpResponseRedirect(reverse_lazy("grader:student_personal_async", args=[user_name]))
 
+
+class StudentPersonalView(View):
     models_dict = {
         "initial_data_models": {
             "GirderGeometry": [md.GirderGeometry, GirderGeometryForm],
@@ -112,66 +140,56 @@ class StudentPersonalView(View):
             owner = True
         return owner
 
+    @cached_property
+    def student_context(self):
+        """ Student, group and variant are resolved once per request and reused by all helpers """
+        return StudentContext.from_user_name(self.get_user_name())
+
     def get_student(self):
-        user_id = User.objects.get_by_natural_key(username=self.get_user_name())
-        return md.Student.objects.get(user_id=user_id)
+        return self.student_context.student
 
     def get_student_id(self):
-        student = self.get_student()
-        return student.pk
+        return self.student_context.student_id
 
     def get_student_name(self):
-        student = self.get_student()
-        return student.full_name
+        return self.get_student().full_name
 
     def get_user_name(self):
         return self.kwargs["user_name"]
 
     def get_student_group_name(self):
-        student = self.get_student()
-        group_id = student.group_id
-        group = md.Group.objects.get(pk=group_id)
-        return group.group_name
+        return self.student_context.group_name
 
     def get_instance(self, db_model):
-        return db_model.objects.filter(student_id=self.get_student_id()).first()
+        return self.student_context.get_row(db_model)
 
     def get_statistics_instance(self, db_model: Model):
-        return db_model.objects.filter(student_id=self.get_student_id()).first()
+        return self.student_context.get_row(db_model)
+
+    @cached_property
+    def student_slab(self):
+        return slab_height.get_slab(self.student_context)
+
+    @cached_property
+    def student_girder_length(self):
+        return girder_length.determine_girder_length(self.student_context)
 
     def get_slab(self):
-        return slab_height.get_slab(self.get_student(), self.get_student_group_name())
+        return self.student_slab
 
     def get_girder_length(self):
-        return girder_length.determine_girder_length(student=self.get_student())
+        return self.student_girder_length
 
     def get_girder_height(self):
-        girder_geometry = md.GirderGeometry.objects.filter(student_id=self.get_student_id()).first()
+        girder_geometry = self.get_instance(md.GirderGeometry)
         if girder_geometry is not None:
             return girder_geometry.girder_height
         else:
             return None
 
     # we do not want to show some forms before previous forms are successfully filled
-    def update_student_opened_blocks(self):
-        student = self.get_student()
-        current_blocks = self.get_instance(md.StudentOpenForms)
-        opened_blocks_number = 0
-        opened_forms_names = list()
-
-        for block_name, block_models in self.models_dict.items():
-            number_models_in_block = len(list(block_models.items()))
-            for key, value in block_models.items():
-                if self.get_instance(value[0]) is not None and key in block_models.keys():
-                    opened_forms_names.append(key)
-
-            opened_forms_number = len(opened_forms_names)
-
-            if opened_forms_number == number_models_in_block:  # all models in block are filled
-                opened_blocks_number += 1
-                md.StudentOpenForms.objects.update_or_create(student=student,
-                                                             defaults={"max_opened_form_number": opened_blocks_number})
-            opened_forms_names.clear()
+    def update_student_opened_blocks(self, forms_names: list):
+        opened_blocks.mark_forms_filled(self.student_context, self.models_dict, forms_names)
 
     def get_student_models_dict(self):
         current_blocks = self.get_instance(md.StudentOpenForms)
@@ -189,43 +207,46 @@ class StudentPersonalView(View):
 
         return student_models_dict
 
+    def get_form(self, form_model, answer=None, data=None, prefix=None):
+        """ Creates form of given class, some forms need extra arguments """
+        if form_model is GirderGeometryForm:
+            form = GirderGeometryForm(data, instance=answer, prefix=prefix, slab=self.get_slab(),
+                                      girder_length=self.get_girder_length())
+        elif form_model is InitialReinforcementForm:
+            form = InitialReinforcementForm(data, instance=answer, prefix=prefix,
+                                            girder_height=self.get_girder_height())
+        elif form_model is CalculatedReinforcementForm:
+            form = CalculatedReinforcementForm(data, instance=answer, prefix=prefix,
+                                               girder_height=self.get_girder_height(),
+                                               initial_reinforcement=self.get_instance(md.InitialReinforcement),
+                                               suggested_layouts=bar_layouts.get_suggested_layouts(
+                                                   self.student_context))
+        else:  # usual form
+            form = form_model(data, instance=answer, prefix=prefix)
+        return form
+
+    def get_forms_with_errors(self):
+        return FormErrorsStore(user_id=self.request.user.pk)
+
     def get(self, request, **kwargs):
         forms = dict()
 
         student_models_dict = self.get_student_models_dict()
 
+        forms_data_with_errors = dict()
+        if request.user.is_authenticated:
+            forms_data_with_errors = self.get_forms_with_errors().get_many(list(student_models_dict.keys()))
+
         for model_name, models_list in student_models_dict.items():
             answer_model = models_list[0]
             form_model = models_list[1]
             answer = self.get_instance(answer_model)
             if answer is not None:
-                if form_model is GirderGeometryForm:  # we need to pass extra arguments for this form
-                    form = GirderGeometryForm(instance=answer, slab=self.get_slab(),
-                                              girder_length=self.get_girder_length())
-                elif form_model is InitialReinforcementForm:  # and to this as well
-                    form = InitialReinforcementForm(instance=answer, girder_height=self.get_girder_height())
-                elif form_model is CalculatedReinforcementForm:  # and to this too
-                    form = CalculatedReinforcementForm(instance=answer,
-                                                       girder_height=self.get_girder_height(),
-                                                       initial_reinforcement=self.get_instance(md.InitialReinforcement))
-                else:  # usual form
-                    form = form_model(instance=answer)
-            else:  # answer was not saved, there could be errors in form.
-                if self.forms_with_errors.get(model_name) and \
-                        self.forms_with_errors["user"].username == request.user.username:
-                    form = self.forms_with_errors[model_name]
-                else:  # no errors, return empty form
-                    if form_model is GirderGeometryForm:  # we need pass extra args to this form
-                        form = GirderGeometryForm(slab=self.get_slab(),
-                                                  girder_length=self.get_girder_length())
-                    elif form_model is InitialReinforcementForm:
-                        form = InitialReinforcementForm(girder_height=self.get_girder_height())
-                    elif form_model is CalculatedReinforcementForm:
-                        form = CalculatedReinforcementForm(girder_height=self.get_girder_height(),
-                                                           initial_reinforcement=self.get_instance(
-                                                               md.InitialReinforcement))
-                    else:  # usual form
-                        form = form_model()
+                form = self.get_form(form_model, answer=answer)
+            elif model_name in forms_data_with_errors:  # answer was not saved, there were errors in form
+                form = self.get_form(form_model, data=forms_data_with_errors[model_name])
+            else:  # no errors, return empty form
+                form = self.get_form(form_model)
 
             forms[model_name] = form
 
@@ -240,58 +261,201 @@ class StudentPersonalView(View):
                                                                     "student_name": self.get_student_name(),
                                                                     "stat": statistics_dict,
                                                                     "forms_names": list(student_models_dict.keys()),
+                                                                    "user_name": self.get_user_name(),
                                                                     }
                       )
 
-    def post(self, request, **kwargs):
-
-        student_models_dict = self.get_student_models_dict()
-
+    def get_submitted_form_name(self, student_models_dict: dict):
+        """ Name of the form is the name of its submit button """
         for key in student_models_dict.keys():
-            if key in request.POST:
-                submit_button_name = key
-
-        answer_instance = self.get_instance(student_models_dict[submit_button_name][0])
-        model_form = student_models_dict[submit_button_name][1]
-
-        if answer_instance is not None:
-            if model_form is GirderGeometryForm:
-                form = GirderGeometryForm(request.POST, instance=answer_instance, slab=self.get_slab(),
-                                          girder_length=self.get_girder_length())
-            elif model_form is InitialReinforcementForm:
-                form = InitialReinforcementForm(request.POST, instance=answer_instance,
-                                                girder_height=self.get_girder_height())
-            elif model_form is CalculatedReinforcementForm:
-                form = CalculatedReinforcementForm(request.POST, instance=answer_instance,
-                                                   girder_height=self.get_girder_height(),
-                                                   initial_reinforcement=self.get_instance(md.InitialReinforcement))
-            else:
-                form = model_form(request.POST, instance=answer_instance)
-        else:
-            if model_form is GirderGeometryForm:
-                form = GirderGeometryForm(request.POST or None, slab=self.get_slab(),
-                                          girder_length=self.get_girder_length())
-            elif model_form is InitialReinforcementForm:
-                form = InitialReinforcementForm(request.POST or None,
-                                                girder_height=self.get_girder_height())
-            elif model_form is CalculatedReinforcementForm:
-                form = CalculatedReinforcementForm(request.POST or None,
-                                                   girder_height=self.get_girder_height(),
-                                                   initial_reinforcement=self.get_instance(md.InitialReinforcement))
+            if key in self.request.POST:
+                return key
+        return None
+
+    def submit_form(self, form_name: str, student_models_dict: dict):
+        """ Saves and grades the answer, if the form is valid; otherwise keeps submitted data
+        to show the form with errors. Returns the bound form """
+        return self.submit_forms([form_name], student_models_dict)[form_name]
+
+    def get_unprefixed_data(self, prefix: str):
+        """ Submitted data of the form with given prefix as if the form was submitted alone """
+        data = MultiValueDict()
+        for key, values in self.request.POST.lists():
+            if key.startswith(f"{prefix}-"):
+                data.setlist(key[len(prefix) + 1:], values)
+        return data
+
+    def submit_forms(self, forms_names: list, student_models_dict: dict, prefixed: bool = False):
+        """ Saves answers of the valid forms in one transaction and grades them with one validation
+        cascade. Fields of the forms are prefixed with the forms names, if several forms are submitted
+        together. Returns dict form name -> bound form """
+        forms = dict()
+        saved_forms_names = list()
+        forms_names = [name for name in student_models_dict.keys() if name in forms_names]  # dependent forms last
+
+        with transaction.atomic():
+            for form_name in forms_names:
+                answer_instance = self.get_instance(student_models_dict[form_name][0])
+                previous_values = get_field_values(answer_instance)  # the form changes the instance
+                model_form = student_models_dict[form_name][1]
+
+                # answers saved before are used by the next forms (girder height, initial reinforcement)
+                form = self.get_form(model_form, answer=answer_instance, data=self.request.POST,
+                                     prefix=form_name if prefixed else None)
+                if form.is_valid():
+                    answer = form.save(commit=False)
+                    answer.student = self.get_student()
+                    answer.save()
+                    self.student_context.set_changed_row(answer, previous_values)
+                    saved_forms_names.append(form_name)
+                elif answer_instance is not None:
+                    # valid fields are put onto the instance even by invalid form, but the next forms
+                    # and grading should get the saved answers
+                    set_field_values(answer_instance, previous_values)
+                forms[form_name] = form
+
+            if saved_forms_names:
+                self.update_student_opened_blocks(saved_forms_names)
+
+        forms_data_with_errors = {form_name: self.get_unprefixed_data(form_name) if prefixed else self.request.POST
+                                  for form_name in forms.keys() if form_name not in saved_forms_names}
+        self.get_forms_with_errors().update(forms_data_with_errors, saved_forms_names)
+
+        if saved_forms_names:
+            if settings.DEFERRED_GRADING:  # statistics are updated by "grade_worker"
+                grading_queue.enqueue(self.student_context, saved_forms_names)
             else:
-                form = model_form(request.POST or None)
+                validation.validate_forms_answers(self.student_context, student_models_dict, saved_forms_names)
 
-        if form.is_valid():
-            answer = form.save(commit=False)
-            answer.student = self.get_student()
-            answer.save()
-            self.update_student_opened_blocks()
+        return forms
 
-            validation.validate_answers(self.get_student(), student_models_dict, submit_button_name)
+    def post(self, request, **kwargs):
 
-        else:
-            self.forms_with_errors[submit_button_name] = form
-            self.forms_with_errors["user"] = request.user
+        student_models_dict = self.get_student_models_dict()
+        submit_button_name = self.get_submitted_form_name(student_models_dict)
+
+        self.submit_form(submit_button_name, student_models_dict)
 
         redirect_url = f"{reverse('grader:student_personal', args=(request.user,))}#{submit_button_name}"
         return HttpResponseRedirect(redirect_url)
+
+
+class StudentFormSubmitView(StudentPersonalView):
+    """ Saves and grades a single form like StudentPersonalView.post(), but answers with JSON
+    (errors of the form and updated statistics) instead of redirect to the whole page """
+    http_method_names = ["post"]
+
+    def get_opened_blocks_number(self):
+        current_blocks = self.get_instance(md.StudentOpenForms)
+        return current_blocks.max_opened_form_number if current_blocks is not None else 0
+
+    def get_forms_statistics(self, student_models_dict: dict):
+        """ Statistics of the opened forms, as validation may update statistics of dependent forms too """
+        forms_statistics = dict()
+        for model_name, models_list in student_models_dict.items():
+            if len(models_list) > 2:
+                statistics = self.get_statistics_instance(models_list[3])
+                if statistics is not None:
+                    forms_statistics[model_name] = model_to_dict(statistics, exclude=["id", "student"])
+        return forms_statistics
+
+    def get_form_result(self, form_name: str, form, student_models_dict: dict):
+        result = {"saved": not form.errors, "errors": form.errors.get_json_data()}
+        if not form.errors:
+            answer = self.get_instance(student_models_dict[form_name][0])
+            result["values"] = model_to_dict(answer, exclude=["id", "student"])  # with calculated fields
+        return result
+
+    def post(self, request, **kwargs):
+        if not self.is_owner():
+            return JsonResponse({"error": "You cannot change data in this form"}, status=403)
+
+        form_name = kwargs["form_name"]
+        student_models_dict = self.get_student_models_dict()
+        if form_name not in student_models_dict:
+            return JsonResponse({"error": f"Form {form_name} is not opened"}, status=404)
+
+        opened_blocks_number = self.get_opened_blocks_number()
+        form = self.submit_form(form_name, student_models_dict)
+
+        response = {"form": form_name, **self.get_form_result(form_name, form, student_models_dict)}
+        if not form.errors:
+            response["statistics"] = self.get_forms_statistics(student_models_dict)
+            response["graded"] = not settings.DEFERRED_GRADING  # see StudentGradingStatusView otherwise
+            # new forms should be shown, the page is to be reloaded
+            response["reload"] = self.get_opened_blocks_number() != opened_blocks_number
+        return JsonResponse(response)
+
+
+class StudentFormsBatchSubmitView(StudentFormSubmitView):
+    """ Saves several forms in one transaction and grades them with one validation cascade.
+    Names of the forms are posted in "forms", fields of each form are prefixed with its name """
+
+    def post(self, request, **kwargs):
+        if not self.is_owner():
+            return JsonResponse({"error": "You cannot change data in this form"}, status=403)
+
+        forms_names = request.POST.getlist("forms")
+        student_models_dict = self.get_student_models_dict()
+        not_opened_forms_names = [name for name in forms_names if name not in student_models_dict]
+        if not forms_names or not_opened_forms_names:
+            return JsonResponse({"error": f"Forms {', '.join(not_opened_forms_names)} are not opened"}, status=404)
+
+        opened_blocks_number = self.get_opened_blocks_number()
+        forms = self.submit_forms(forms_names, student_models_dict, prefixed=True)
+
+        response = {"forms": {form_name: self.get_form_result(form_name, form, student_models_dict)
+                              for form_name, form in forms.items()},
+                    "statistics": self.get_forms_statistics(student_models_dict),
+                    "graded": not settings.DEFERRED_GRADING,
+                    "reload": self.get_opened_blocks_number() != opened_blocks_number}
+        return JsonResponse(response)
+
+
+class StudentGradingStatusView(StudentFormSubmitView):
+    """ Status of the latest grading job of the student (with DEFERRED_GRADING setting), is polled
+    by the page after submission; statistics are returned, when answers are graded """
+    http_method_names = ["get"]
+
+    def get(self, request, **kwargs):
+        if not self.is_owner():
+            return JsonResponse({"error": "You cannot see grading of this student"}, status=403)
+
+        job = grading_queue.get_latest_job(self.get_user_name())
+        if job is not None and job.status in (md.GradingJob.PENDING, md.GradingJob.RUNNING):
+            return JsonResponse({"status": job.status})
+
+        response = {"status": job.status if job is not None else None,
+                    "statistics": self.get_forms_statistics(self.get_student_models_dict())}
+        if job is not None and job.status == md.GradingJob.FAILED:
+            response["error"] = job.error
+        return JsonResponse(response)
+
+
+async_pages_semaphores = WeakKeyDictionary()  # event loop -> semaphore of the async pages
+
+
+def get_async_pages_semaphore():
+    loop = asyncio.get_running_loop()
+    if loop not in async_pages_semaphores:
+        async_pages_semaphores[loop] = asyncio.Semaphore(settings.ASYNC_PAGES_CONCURRENCY)
+    return async_pages_semaphores[loop]
+
+
+class AsyncStudentPersonalView(StudentPersonalView):
+    """ StudentPersonalView for ASGI server: the student and their rows are loaded with async ORM, then
+    the page is rendered as usual. All queries of the request run in its thread-sensitive executor,
+    so the request uses one DB connection; it is closed before the next page takes the place
+    (see ASYNC_PAGES_CONCURRENCY), and the event loop serves other students meanwhile """
+
+    async def get(self, request, **kwargs):
+        async with get_async_pages_semaphore():
+            try:
+                self.student_context = await StudentContext.afrom_user_name(self.get_user_name())
+                await self.student_context.aload_rows(grading=True)
+                return await sync_to_async(super().get)(request, **kwargs)
+            finally:
+                await sync_to_async(close_old_connections)()
+
+    async def post(self, request, **kwargs):
+        return await sync_to_async(super().post)(request, **kwargs)
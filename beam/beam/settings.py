@@ -51,6 +51,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'autograder.middleware.QueryStatsMiddleware',
 ]
 
 ROOT_URLCONF = 'beam.urls'
@@ -78,6 +79,13 @@ WSGI_APPLICATION = 'beam.wsgi.application'
 
 APP_NAME = 'RC Autograder'
 
+# answers are graded by "grade_worker" processes instead of the request, which saves them
+DEFERRED_GRADING = False
+
+# async pages, which use DB at the same time in a process (every request of ASGI server has its own
+# thread and DB connection, so this bounds number of DB connections of the process)
+ASYNC_PAGES_CONCURRENCY = 20
+
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
@@ -92,6 +100,49 @@ DATABASES = {
     }
 }
 
+# Logging
+# https://docs.djangoproject.com/en/4.1/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'autograder': {
+            'handlers': ['console'],
+            'level': 'DEBUG' if DEBUG else 'WARNING',
+        },
+    },
+}
+
+# Cache
+# https://docs.djangoproject.com/en/4.1/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # forms with errors are kept between POST and redirected GET; shared by all worker processes
+    # (create table with "python manage.py createcachetable")
+    'form_errors': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'autograder_form_errors',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,  # users with forms with errors; forms of a user are limited by the store
+        }
+    },
+    # version of reference tables (materials, bars, variants...), which are cached in memory of processes
+    'reference_tables': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'autograder_reference_tables',
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -0,0 +1,119 @@
+// Submits forms to the JSON endpoints, so the whole page is not reloaded after every answer.
+// Forms changed since the last submission are sent together in one batch
+var batchSubmitUrl = document.currentScript.dataset.batchSubmitUrl;
+var gradingStatusUrl = document.currentScript.dataset.gradingStatusUrl;
+var GRADING_POLL_INTERVAL = 1000;  // ms
+
+$(function () {
+    var dirtyForms = {};  // form name -> form element
+
+    function getFormName(form) {
+        return form.find("input[type=submit]").attr("name");
+    }
+
+    function showErrors(form, errors) {
+        var container = form.find(".form_errors").empty();
+        var names = Object.keys(errors);
+        if (names.length === 0) {
+            return;
+        }
+        container.append($("<p>").text("Для успешной отправки данных исправьте следующие ошибки:"));
+        var list = $("<ul>").addClass("errorlist");
+        names.forEach(function (name) {
+            errors[name].forEach(function (error) {
+                list.append($("<li>").text(error.message));
+            });
+        });
+        container.append(list);
+    }
+
+    function showValues(form, values) {  // calculated fields are updated on save
+        $.each(values, function (name, value) {
+            form.find("[name='" + name + "']").not(":checkbox").val(value);
+        });
+    }
+
+    function showStatistics(statistics) {
+        $.each(statistics, function (formName, formStatistics) {
+            $.each(formStatistics, function (key, value) {
+                $("#stat_" + key).text(value === null ? "None" : (value ? "True" : "False"));
+            });
+        });
+    }
+
+    function waitForGrading() {  // answers are graded by background workers (deferred grading)
+        $.getJSON(gradingStatusUrl).done(function (response) {
+            if (response.statistics) {
+                showStatistics(response.statistics);
+            } else {
+                setTimeout(waitForGrading, GRADING_POLL_INTERVAL);
+            }
+        });
+    }
+
+    function showFormResult(form, result) {
+        showErrors(form, result.errors);
+        if (result.saved) {
+            showValues(form, result.values);
+            delete dirtyForms[getFormName(form)];
+        }
+    }
+
+    function getBatchData(forms) {  // fields of every form are prefixed with its name
+        var data = new FormData();
+        data.append("csrfmiddlewaretoken", forms[0].find("[name=csrfmiddlewaretoken]").val());
+        forms.forEach(function (form) {
+            var formName = getFormName(form);
+            data.append("forms", formName);
+            new FormData(form[0]).forEach(function (value, name) {
+                if (name !== "csrfmiddlewaretoken") {
+                    data.append(formName + "-" + name, value);
+                }
+            });
+        });
+        return data;
+    }
+
+    function post(url, data) {
+        return $.ajax({url: url, method: "POST", data: data, processData: false, contentType: false,
+                       dataType: "json"});
+    }
+
+    $("form[data-submit-url]").on("change input", function () {
+        dirtyForms[getFormName($(this))] = $(this);
+    });
+
+    $("form[data-submit-url]").on("submit", function (event) {
+        var form = $(this);
+        var formName = getFormName(form);
+        event.preventDefault();
+
+        dirtyForms[formName] = form;
+        var forms = Object.values(dirtyForms);
+        var request;
+        if (forms.length > 1) {
+            request = post(batchSubmitUrl, getBatchData(forms)).done(function (response) {
+                forms.forEach(function (dirtyForm) {
+                    showFormResult(dirtyForm, response.forms[getFormName(dirtyForm)]);
+                });
+            });
+        } else {
+            request = post(form.data("submit-url"), new FormData(this)).done(function (response) {
+                showFormResult(form, response);
+            });
+        }
+
+        request.done(function (response) {
+            if (response.reload) {  // new forms are opened
+                window.location.reload();
+            } else if (response.graded === false) {
+                setTimeout(waitForGrading, GRADING_POLL_INTERVAL);
+            } else if (response.statistics) {
+                showStatistics(response.statistics);
+            }
+        }).fail(function () {  // fall back to usual submission with redirect
+            form.off("submit");
+            form.find("input[type=submit]").trigger("click");
+        });
+    });
+});